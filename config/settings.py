@@ -141,7 +141,27 @@ STATIC_ROOT=BASE_DIR / 'static'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-# --- Volovo: sand base (пескобаза) ---
-SAND_BASE_LAT = 52.036282      # поменяешь на свои координаты
-SAND_BASE_LON = 37.887833
-SAND_BASE_RADIUS_KM = 0.02# 70 метров как в твоём JS по умолчанию
+# --- Volovo: пескобазы и зоны выгрузки — модель tracking.Geofence (админка / миграция 0013) ---
+
+# --- Volovo: fleet_summary — потоков на расчёт по oid (mode=auto/cum/python) ---
+FLEET_SUMMARY_WORKERS = 8
+
+# --- Volovo: сопоставление рейсов с маршрутами RouteCatalog (tracking.routes) ---
+ROUTE_MATCH_MAX_M = 300.0       # рейс дальше этого (расстояние Хаусдорфа) от маршрута — не его маршрут
+
+# --- Volovo: накопительные колонки трека (tracking.derived) ---
+TRACK_CUM_MAX_JUMP_KM = 1.0     # фильтр скачков для cum_km (как max_jump_km по умолчанию в API)
+TRACK_CUM_MAX_GAP_S = 600       # после паузы > 10 мин точка принимается как новый якорь
+
+# --- Volovo: кэш ответов API (points_summary / trips_for_map / тайлы) ---
+# ключи содержат версию данных oid (tracking.versions), поэтому срок жизни может быть долгим;
+# для нескольких воркеров gunicorn — FileBasedCache / Redis вместо LocMemCache
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "volovo-api",
+        "OPTIONS": {"MAX_ENTRIES": 2000},
+    }
+}
+TRACK_API_CACHE_S = 86400
+TRACK_TILE_CACHE_S = 86400
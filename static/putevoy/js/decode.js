@@ -0,0 +1,47 @@
+(function () {
+  // ---- декодеры trips_for_map?format=polyline|binary (см. tracking/encoding.py) ----
+
+  // Google encoded polyline -> [[lat, lon], ...]
+  window.putevoyDecodePolyline = function (str, precision) {
+    const k = Math.pow(10, precision || 5);
+    const out = [];
+    let i = 0, lat = 0, lon = 0;
+    while (i < str.length) {
+      const d = [0, 0];
+      for (let j = 0; j < 2; j++) {
+        let shift = 0, v = 0, b;
+        do {
+          b = str.charCodeAt(i++) - 63;
+          v += (b & 0x1f) * Math.pow(2, shift);
+          shift += 5;
+        } while (b >= 0x20);
+        d[j] = (v % 2) ? -(v + 1) / 2 : v / 2;
+      }
+      lat += d[0];
+      lon += d[1];
+      out.push([lat / k, lon / k]);
+    }
+    return out;
+  };
+
+  // ArrayBuffer -> заголовок (JSON) с trips[i].points = [[lat, lon], ...]
+  window.putevoyDecodeBinary = function (buf) {
+    const view = new DataView(buf);
+    const headLen = view.getUint32(0, true);
+    const head = JSON.parse(new TextDecoder("utf-8").decode(new Uint8Array(buf, 4, headLen)));
+    const scale = head.binary_scale || 1e6;
+    const data = new Int32Array(buf, 4 + headLen);
+    let off = 0;
+    (head.trips || []).forEach(tr => {
+      const pts = new Array(tr.points_count);
+      let lat = 0, lon = 0;
+      for (let i = 0; i < tr.points_count; i++) {
+        lat += data[off++];
+        lon += data[off++];
+        pts[i] = [lat / scale, lon / scale];
+      }
+      tr.points = pts;
+    });
+    return head;
+  };
+})();
@@ -1,3 +1,15 @@
-from django.contrib import admin
+from django.contrib.gis import admin
 
-# Register your models here.
+from tracking.models import Geofence, RouteCatalog
+
+
+@admin.register(Geofence)
+class GeofenceAdmin(admin.GISModelAdmin):
+    list_display = ("name", "kind", "radius_m", "active", "updated_at")
+    list_filter = ("kind", "active")
+
+
+@admin.register(RouteCatalog)
+class RouteCatalogAdmin(admin.GISModelAdmin):
+    list_display = ("name", "road_width_m", "road_length_km", "pss_tonnage_t")
+    search_fields = ("name",)
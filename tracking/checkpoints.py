@@ -0,0 +1,80 @@
+"""
+Водяные знаки импорта (ImportCheckpoint): на (oid, источник) храним, до
+какого момента трек уже загружен, и с какой точки ещё не пересчитаны
+производные данные (tracking.derived).
+
+Импорт коммитит каждую пачку вместе с продвижением водяного знака, поэтому
+после падения следующий запуск с --resume продолжает с места остановки,
+а dirty_from не даёт потерять пересчёт cum_* за уже загруженные пачки.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.db import connection
+
+from tracking.models import ImportCheckpoint
+
+# last_tm/last_key только растут, dirty_from — только уменьшается (LEAST/GREATEST пропускают NULL)
+_ADVANCE_SQL = """
+INSERT INTO tracking_importcheckpoint AS c (oid, source, last_tm, last_key, dirty_from, updated_at)
+VALUES (%s, %s, %s, %s, %s, now())
+ON CONFLICT (oid, source) DO UPDATE SET
+    last_tm = GREATEST(c.last_tm, EXCLUDED.last_tm),
+    last_key = GREATEST(c.last_key, EXCLUDED.last_key),
+    dirty_from = LEAST(c.dirty_from, EXCLUDED.dirty_from),
+    updated_at = now()
+"""
+
+
+def get(oid: int, source: str) -> Optional[ImportCheckpoint]:
+    return ImportCheckpoint.objects.filter(oid=oid, source=source).first()
+
+
+def advance(
+    oid: int,
+    source: str,
+    last_tm: Optional[datetime],
+    dirty_from: Optional[datetime] = None,
+    last_key: Optional[int] = None,
+) -> None:
+    """Пачка до last_tm (last_key) загружена; dirty_from — самая ранняя изменённая в ней точка."""
+    with connection.cursor() as cur:
+        cur.execute(_ADVANCE_SQL, [oid, source, last_tm, last_key, dirty_from])
+
+
+def keys(source: str) -> Dict[int, int]:
+    """oid -> last_key по источнику."""
+    return dict(
+        ImportCheckpoint.objects.filter(source=source, last_key__isnull=False).values_list("oid", "last_key")
+    )
+
+
+def dirty(source: str) -> Dict[int, datetime]:
+    """oid -> dirty_from: загружено, но производные данные ещё не пересчитаны."""
+    return dict(
+        ImportCheckpoint.objects.filter(source=source, dirty_from__isnull=False).values_list("oid", "dirty_from")
+    )
+
+
+def dirty_until(oid: int, tm: Optional[datetime] = None) -> bool:
+    """
+    Есть ли у oid (по любому источнику) загруженные, но не пересчитанные точки
+    с tm не позже tm (None — вообще).
+    """
+    qs = ImportCheckpoint.objects.filter(oid=oid, dirty_from__isnull=False)
+    if tm is not None:
+        qs = qs.filter(dirty_from__lte=tm)
+    return qs.exists()
+
+
+def mark_clean(oid: int, source: str, since: Optional[datetime] = None) -> None:
+    """
+    Производные данные пересчитаны (refresh_derived) с since (None — весь трек).
+    Долг раньше since (его записал параллельный импорт, пока шёл пересчёт) остаётся.
+    """
+    qs = ImportCheckpoint.objects.filter(oid=oid, source=source)
+    if since is not None:
+        qs = qs.filter(dirty_from__gte=since)
+    qs.update(dirty_from=None)
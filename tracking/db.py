@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import Iterator, Optional, Sequence
+
+from django.contrib.gis.db.models import GeometryField
+from django.db import connection
+from django.db.models import F, Func, FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from tracking.engine import Track
+from tracking.models import TrackPoint
+
+
+# ----------------- PostGIS helpers (ST_X / ST_Y) -----------------
+
+class ST_X(Func):
+    function = "ST_X"
+    output_field = FloatField()
+
+
+class ST_Y(Func):
+    function = "ST_Y"
+    output_field = FloatField()
+
+
+def with_lat_lon(qs):
+    """geography -> geometry (в 4326), затем ST_X/ST_Y: без GEOS-объекта на каждую точку."""
+    return qs.annotate(
+        geom2=Cast("geom", GeometryField(srid=4326)),
+    ).annotate(
+        lon=ST_X(F("geom2")),
+        lat=ST_Y(F("geom2")),
+    )
+
+
+def load_track(
+    oid: int,
+    dt_from=None,
+    dt_to=None,
+    order_by: Sequence[str] = ("tm",),
+    limit: Optional[int] = None,
+    with_speed: bool = False,
+) -> Track:
+    """Точки oid за период сразу колонками (см. tracking.engine.Track)."""
+    qs = TrackPoint.objects.filter(oid=oid)
+    if dt_from:
+        qs = qs.filter(tm__gte=dt_from)
+    if dt_to:
+        qs = qs.filter(tm__lte=dt_to)
+
+    fields = ["tm", "lat", "lon"]
+    if with_speed:
+        fields.append("speed_kmh")
+
+    qs = with_lat_lon(qs).order_by(*order_by).values_list(*fields)
+    if limit:
+        qs = qs[:limit]
+    return Track.from_rows(qs)
+
+
+def iter_track(oid: int, dt_from=None, dt_to=None, chunk: int = 50_000) -> Iterator[Track]:
+    """Как load_track, но чанками через серверный курсор: память не растёт с периодом."""
+    qs = TrackPoint.objects.filter(oid=oid)
+    if dt_from:
+        qs = qs.filter(tm__gte=dt_from)
+    if dt_to:
+        qs = qs.filter(tm__lte=dt_to)
+
+    rows = with_lat_lon(qs).order_by("tm").values_list("tm", "lat", "lon").iterator(chunk_size=chunk)
+    while True:
+        part = list(islice(rows, chunk))
+        if not part:
+            return
+        yield Track.from_rows(part)
+
+
+# ----------------- SQL-side summary -----------------
+
+# Фильтр скачков в SQL — оконный, без "последней принятой точки":
+# точка считается скачком, если она дальше max_jump_km И от предыдущей, И от
+# следующей точки (одиночный выброс). Python-путь сравнивает с последней
+# ПРИНЯТОЙ точкой, поэтому результаты расходятся, если трек "телепортировался"
+# и остался на новом месте: Python отбрасывает весь хвост, SQL — только точку
+# разрыва. Фильтр по скорости не применяется (как и в python-пути, где speed не грузится).
+_SUMMARY_SQL = """
+WITH pts AS (
+    SELECT oid, tm, geom,
+           ST_Distance(geom, LAG(geom) OVER w, false) / 1000.0 AS d_prev,
+           ST_Distance(geom, LEAD(geom) OVER w, false) / 1000.0 AS d_next
+    FROM tracking_trackpoint
+    WHERE oid = ANY(%(oids)s) {range_sql}
+    WINDOW w AS (PARTITION BY oid ORDER BY tm)
+),
+kept AS (
+    SELECT oid, tm, geom, {inside_sql} AS inside
+    FROM pts
+    WHERE NOT (COALESCE(d_prev > %(max_jump_km)s, false) AND COALESCE(d_next > %(max_jump_km)s, true))
+),
+steps AS (
+    SELECT oid, inside,
+           ST_Distance(geom, LAG(geom) OVER w, false) AS d_m,
+           LAG(inside) OVER w AS inside_prev
+    FROM kept
+    WINDOW w AS (PARTITION BY oid ORDER BY tm)
+),
+orig AS (
+    SELECT oid, count(*) AS original_count FROM pts GROUP BY oid
+)
+SELECT s.oid,
+       o.original_count,
+       count(*) AS points_count_used,
+       COALESCE(sum(s.d_m), 0) / 1000.0 AS total_km,
+       count(*) FILTER (WHERE s.inside AND NOT COALESCE(s.inside_prev, false)) AS sand_base_entries
+FROM steps s
+JOIN orig o ON o.oid = s.oid
+GROUP BY s.oid, o.original_count
+"""
+
+
+_FENCE_CIRCLE_SQL = """EXISTS (
+        SELECT 1 FROM tracking_geofence g
+        WHERE g.active AND (%(sb_kind)s IS NULL OR g.kind = %(sb_kind)s) AND g.radius_m IS NOT NULL
+          AND ST_DWithin(g.center, pts.geom, %(sb_max_radius_m)s, false)
+          AND ST_DWithin(g.center, pts.geom, g.radius_m, false))"""
+
+_FENCE_AREA_SQL = """EXISTS (
+        SELECT 1 FROM tracking_geofence g
+        WHERE g.active AND (%(sb_kind)s IS NULL OR g.kind = %(sb_kind)s) AND ST_Covers(g.area, pts.geom))"""
+
+
+def summary_sql(oids: Sequence[int], dt_from=None, dt_to=None, max_jump_km: float = 1.0, sb=None):
+    """
+    total_km / sand_base_entries / счётчики точек одним запросом, без выгрузки точек.
+    sb: FenceIndex пескобаз (tracking.geofences) или None; точки проверяются против
+    tracking_geofence через GiST-индексы на center/area — цена не растёт с числом зон.
+    Возвращаем {oid: {...}}; oid без точек в ответ не попадают.
+    """
+    params = {"oids": list(oids), "max_jump_km": float(max_jump_km)}
+
+    range_sql = ""
+    if dt_from:
+        range_sql += " AND tm >= %(dt_from)s"
+        params["dt_from"] = dt_from
+    if dt_to:
+        range_sql += " AND tm <= %(dt_to)s"
+        params["dt_to"] = dt_to
+
+    inside = []
+    if sb:
+        params["sb_kind"] = sb.kind
+        if sb.max_radius_m():
+            # постоянный радиус — условие для GiST по center, точный — по radius_m зоны
+            inside.append(_FENCE_CIRCLE_SQL)
+            params["sb_max_radius_m"] = sb.max_radius_m()
+        if sb.has_polygons():
+            inside.append(_FENCE_AREA_SQL)
+    inside_sql = "({})".format(" OR ".join(inside)) if inside else "false"
+
+    sql = _SUMMARY_SQL.format(range_sql=range_sql, inside_sql=inside_sql)
+
+    out = {}
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        for oid, original_count, used, total_km, entries in cur.fetchall():
+            out[int(oid)] = {
+                "original_count": int(original_count),
+                "points_count_used": int(used),
+                "gps_jumps_removed": int(original_count) - int(used),
+                "total_km": float(total_km),
+                "sand_base_entries": int(entries),
+            }
+    return out
+
+
+# ----------------- Mapbox Vector Tiles -----------------
+
+_MVT_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS env
+),
+lines AS (
+    {lines_sql}
+),
+mvt AS (
+    SELECT lines.day::text AS day,
+           ST_AsMVTGeom(ST_Transform(lines.g, 3857), bounds.env, 4096, 64, true) AS geom
+    FROM lines, bounds
+    WHERE ST_Transform(lines.g, 3857) && bounds.env
+)
+SELECT ST_AsMVT(mvt.*, 'track', 4096, 'geom') FROM mvt WHERE mvt.geom IS NOT NULL
+"""
+
+# сырые точки: линия на сутки
+_MVT_RAW_LINES = """
+    SELECT (tm AT TIME ZONE %(tz)s)::date AS day,
+           ST_MakeLine(geom::geometry ORDER BY tm) AS g
+    FROM tracking_trackpoint
+    WHERE oid = %(oid)s AND tm >= %(dt_from)s AND tm <= %(dt_to)s
+      AND gps_jump IS NOT TRUE
+    GROUP BY 1
+"""
+
+# пирамида (tracking.pyramid): вершины обрезаются по времени через vertex_t
+_MVT_PYRAMID_LINES = """
+    SELECT p.day, ST_MakeLine(dp.geom ORDER BY (dp.path)[1]) AS g
+    FROM tracking_trackpyramid p, ST_DumpPoints(p.geom) dp
+    WHERE p.oid = %(oid)s AND p.level = %(level)s
+      AND p.day >= %(day_from)s AND p.day <= %(day_to)s
+      AND p.vertex_t[(dp.path)[1]] BETWEEN %(t_from)s AND %(t_to)s
+    GROUP BY p.day
+"""
+
+
+def track_tile_mvt(oid: int, z: int, x: int, y: int, dt_from, dt_to, tz_name: str, level=None) -> bytes:
+    """
+    MVT-тайл (слой 'track', фича на сутки, свойство day) для oid за [dt_from, dt_to].
+    level — уровень TrackPyramid (обзорные масштабы), None — сырые точки.
+    """
+    params = {"z": z, "x": x, "y": y, "oid": oid, "dt_from": dt_from, "dt_to": dt_to, "tz": tz_name}
+    if level is None:
+        lines_sql = _MVT_RAW_LINES
+    else:
+        lines_sql = _MVT_PYRAMID_LINES
+        params.update(
+            level=level,
+            day_from=timezone.localtime(dt_from).date(),
+            day_to=timezone.localtime(dt_to).date(),
+            t_from=int(dt_from.timestamp()),
+            t_to=int(dt_to.timestamp()),
+        )
+
+    with connection.cursor() as cur:
+        cur.execute(_MVT_SQL.format(lines_sql=lines_sql), params)
+        row = cur.fetchone()
+    return bytes(row[0]) if row and row[0] else b""
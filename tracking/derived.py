@@ -0,0 +1,285 @@
+"""
+Производные колонки трека: cum_km / cum_kept / cum_n / cum_sb_entries / gps_jump.
+
+Считаются по всей истории oid с фильтром скачков из settings
+(TRACK_CUM_MAX_JUMP_KM / TRACK_CUM_MAX_GAP_S), поэтому км и заезды на
+пескобазу за любой период — разность двух граничных строк. Пескобазы —
+активные Geofence kind=sand_base (tracking.geofences).
+
+Правило паузы есть только здесь, не в расчёте на лету (volovo_api.views,
+tracking.stream): после паузы дольше TRACK_CUM_MAX_GAP_S точка принимается
+как новый якорь, а отрезок через паузу в cum_km не входит. Иначе одна
+"телепортация" за всю историю отбросила бы остаток трека. Поэтому при
+паузах с переездом stored/cum и live расходятся; TRACK_CUM_MAX_GAP_S=None
+(или 0) — фильтр как на лету.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from tracking import checkpoints, engine, geofences
+from tracking.db import with_lat_lon
+from tracking.geofences import FenceIndex
+from tracking.models import Geofence, TrackPoint, Vehicle
+from tracking.pyramid import build_range
+from tracking.trips import refresh_trips
+from tracking.versions import bump
+
+CHUNK = 50_000
+
+_UPDATE_SQL = """
+UPDATE tracking_trackpoint AS t
+SET cum_km = u.cum_km,
+    cum_kept = u.cum_kept,
+    cum_n = u.cum_n,
+    cum_sb_entries = u.cum_sb_entries,
+    gps_jump = u.gps_jump
+FROM unnest(%s::bigint[], %s::timestamptz[], %s::double precision[], %s::integer[], %s::integer[],
+            %s::integer[], %s::boolean[])
+     AS u(id, tm, cum_km, cum_kept, cum_n, cum_sb_entries, gps_jump)
+WHERE t.id = u.id AND t.tm = u.tm  -- tm: отсечение секций (миграция 0008)
+"""
+
+
+def get_sand_base() -> Optional[FenceIndex]:
+    """Активные пескобазы (Geofence kind=sand_base) или None, если их нет."""
+    index = geofences.load(Geofence.SAND_BASE)
+    return index if len(index) else None
+
+
+def cum_max_jump_km() -> float:
+    return float(getattr(settings, "TRACK_CUM_MAX_JUMP_KM", 1.0))
+
+
+def _cum_max_gap_s() -> Optional[float]:
+    v = getattr(settings, "TRACK_CUM_MAX_GAP_S", None)
+    return float(v) if v else None
+
+
+def _inside(lat: np.ndarray, lon: np.ndarray, sb) -> np.ndarray:
+    if not sb:
+        return np.zeros(lat.shape[0], dtype=bool)
+    return sb.inside(lat, lon)
+
+
+@dataclass
+class _State:
+    cum_km: float = 0.0
+    cum_kept: int = 0
+    cum_n: int = 0
+    cum_sb_entries: int = 0
+    anchor: Optional[tuple] = None  # (lat, lon, t) последней принятой точки
+    inside: bool = False
+
+
+def _state_before(oid: int, since, sb) -> Optional[_State]:
+    """Состояние на последней строке до since; None — строки до since не посчитаны."""
+    if since is None:
+        return _State()
+
+    before = with_lat_lon(TrackPoint.objects.filter(oid=oid, tm__lt=since)).order_by("-tm", "-id")
+    prev = before.values("tm", "lat", "lon", "cum_km", "cum_kept", "cum_n", "cum_sb_entries", "gps_jump").first()
+    if prev is None:
+        return _State()
+    if prev["cum_km"] is None or prev["cum_n"] is None or prev["gps_jump"] is None:
+        return None
+
+    anchor = prev if not prev["gps_jump"] else before.filter(gps_jump=False).values("tm", "lat", "lon").first()
+
+    st = _State(
+        cum_km=prev["cum_km"], cum_kept=prev["cum_kept"], cum_n=prev["cum_n"], cum_sb_entries=prev["cum_sb_entries"]
+    )
+    if anchor:
+        st.anchor = (anchor["lat"], anchor["lon"], anchor["tm"].timestamp())
+        st.inside = bool(_inside(np.array([anchor["lat"]]), np.array([anchor["lon"]]), sb)[0])
+    return st
+
+
+def _apply_chunk(st: _State, lat, lon, t, sb, max_jump_km, max_gap_s):
+    """Считаем колонки для чанка, продолжая состояние st (st обновляется)."""
+    if st.anchor is not None:
+        a_lat, a_lon, a_t = st.anchor
+        keep = engine.filter_jumps(
+            np.concatenate(([a_lat], lat)),
+            np.concatenate(([a_lon], lon)),
+            max_jump_km,
+            t=np.concatenate(([a_t], t)),
+            max_gap_s=max_gap_s,
+        )[1:]
+    else:
+        keep = engine.filter_jumps(lat, lon, max_jump_km, t=t, max_gap_s=max_gap_s)
+
+    k = np.flatnonzero(keep)
+    k_lat, k_lon = lat[k], lon[k]
+
+    if st.anchor is not None:
+        steps = engine.step_km(np.concatenate(([st.anchor[0]], k_lat)), np.concatenate(([st.anchor[1]], k_lon)))
+    else:
+        steps = np.concatenate(([0.0], engine.step_km(k_lat, k_lon)))[:k.shape[0]]
+    # точка, принятая после паузы (max_gap_s), — разрыв, а не пробег
+    steps[steps > max_jump_km] = 0.0
+
+    k_inside = _inside(k_lat, k_lon, sb)
+    k_prev = np.concatenate(([st.inside], k_inside[:-1]))
+
+    k_cum_km = st.cum_km + np.cumsum(steps)
+    k_cum_kept = st.cum_kept + np.arange(1, k.shape[0] + 1)
+    k_cum_sb = st.cum_sb_entries + np.cumsum(k_inside & ~k_prev)
+
+    # отброшенные точки наследуют значения последней принятой
+    pos = np.cumsum(keep)
+    cum_km = np.concatenate(([st.cum_km], k_cum_km))[pos]
+    cum_kept = np.concatenate(([st.cum_kept], k_cum_kept))[pos]
+    cum_sb = np.concatenate(([st.cum_sb_entries], k_cum_sb))[pos]
+    cum_n = st.cum_n + np.arange(1, lat.shape[0] + 1)
+    st.cum_n += int(lat.shape[0])
+
+    if k.shape[0]:
+        last = int(k[-1])
+        st.anchor = (float(lat[last]), float(lon[last]), float(t[last]))
+        st.inside = bool(k_inside[-1])
+        st.cum_km = float(k_cum_km[-1])
+        st.cum_kept = int(k_cum_kept[-1])
+        st.cum_sb_entries = int(k_cum_sb[-1])
+
+    return cum_km, cum_kept, cum_n, cum_sb, ~keep
+
+
+def refresh_cumulative(oid: int, since=None, chunk: int = CHUNK) -> int:
+    """
+    Пересчитываем cum_* у точек oid с tm >= since (since=None — весь трек).
+    Если строки до since ещё не посчитаны — пересчитываем с начала.
+    Вне внешней транзакции каждая страница коммитится сама: блокировки строк
+    и WAL не копятся на весь трек, а недосчитанный хвост прикрывает
+    ImportCheckpoint.dirty_from (его снимают только после refresh_derived).
+    Возвращаем число обновлённых строк.
+    """
+    sb = get_sand_base()
+    st = _state_before(oid, since, sb)
+    if st is None:
+        since = None
+        st = _State()
+
+    max_jump_km = cum_max_jump_km()
+    max_gap_s = _cum_max_gap_s()
+
+    qs = with_lat_lon(TrackPoint.objects.filter(oid=oid))
+    if since is not None:
+        qs = qs.filter(tm__gte=since)
+    qs = qs.order_by("tm", "id")
+
+    total = 0
+    last = None
+    while True:
+        page = qs
+        if last is not None:
+            page = page.filter(Q(tm__gt=last[0]) | Q(tm=last[0], id__gt=last[1]))
+        rows = list(page.values_list("id", "tm", "lat", "lon")[:chunk])
+        if not rows:
+            break
+
+        ids, tms, lats, lons = zip(*rows)
+        lat = np.asarray(lats, dtype=np.float64)
+        lon = np.asarray(lons, dtype=np.float64)
+        t = np.fromiter((x.timestamp() for x in tms), dtype=np.float64, count=len(rows))
+
+        cum_km, cum_kept, cum_n, cum_sb, jump = _apply_chunk(st, lat, lon, t, sb, max_jump_km, max_gap_s)
+
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                _UPDATE_SQL,
+                [list(ids), list(tms), cum_km.tolist(), cum_kept.tolist(), cum_n.tolist(), cum_sb.tolist(),
+                 jump.tolist()],
+            )
+
+        total += len(rows)
+        last = (rows[-1][1], rows[-1][0])
+        if len(rows) < chunk:
+            break
+
+    return total
+
+
+def refresh_derived(oid: int, since=None) -> Tuple[int, int, int]:
+    """
+    cum_* колонки, затем рейсы (Trip) и пирамида (TrackPyramid);
+    в конце поднимаем версию данных (кэш API, см. tracking.versions).
+    Если пескобазы менялись после прошлого расчёта (Vehicle.sb_version) —
+    пересчитываем весь трек, а не с since.
+    Возвращаем (точек пересчитано, рейсов создано, суток перестроено).
+    """
+    sb_version = geofences.version(Geofence.SAND_BASE)
+    if since is not None and _sb_stale(oid, sb_version):
+        since = None
+    n_points = refresh_cumulative(oid, since=since)
+    with transaction.atomic():
+        n_trips = refresh_trips(oid, since=since)
+    n_days = build_range(oid, since=since)
+    bump(oid, since=since)
+    if since is None:
+        Vehicle.objects.filter(oid=oid).update(sb_version=sb_version)
+    return n_points, n_trips, n_days
+
+
+def _sb_stale(oid: int, sb_version: str) -> bool:
+    """cum_sb_entries/рейсы oid посчитаны по другим пескобазам (oid без Vehicle — как раньше, нет)."""
+    return Vehicle.objects.filter(oid=oid).exclude(sb_version=sb_version).exists()
+
+
+def range_summary(oid: int, dt_from=None, dt_to=None) -> Optional[Dict[str, Any]]:
+    """
+    points_summary по двум граничным строкам (F — первая в периоде, L — последняя).
+    None — колонки для периода ещё не посчитаны, посчитаны по другим пескобазам
+    или устарели: импорт вставил/переписал точки не позже dt_to, а refresh_derived
+    ещё не прошёл (ImportCheckpoint.dirty_from). Тогда API считает на лету.
+
+    Отличие от пересчёта "с нуля": фильтр скачков не перезапускается на dt_from,
+    т.е. первая точка периода сравнивается с последней принятой точкой ДО периода.
+    """
+    if _sb_stale(oid, geofences.version(Geofence.SAND_BASE)):
+        return None
+    # новые точки внутри периода — NULL в cum_*, переписанные — со старыми cum_*:
+    # по граничным строкам это не видно
+    if checkpoints.dirty_until(oid, dt_to):
+        return None
+
+    qs = TrackPoint.objects.filter(oid=oid)
+    if dt_from:
+        qs = qs.filter(tm__gte=dt_from)
+    if dt_to:
+        qs = qs.filter(tm__lte=dt_to)
+
+    fields = ("lat", "lon", "cum_km", "cum_kept", "cum_n", "cum_sb_entries", "gps_jump")
+    first = with_lat_lon(qs).order_by("tm", "id").values(*fields).first()
+    if first is None:
+        return {
+            "original_count": 0,
+            "points_count_used": 0,
+            "gps_jumps_removed": 0,
+            "total_km": 0.0,
+            "sand_base_entries": 0,
+        }
+    last = qs.order_by("-tm", "-id").values(*fields[2:]).first()
+    if any(r[f] is None for r in (first, last) for f in fields[2:]):
+        return None
+
+    first_kept = not first["gps_jump"]
+    first_inside = first_kept and bool(
+        _inside(np.array([first["lat"]]), np.array([first["lon"]]), get_sand_base())[0]
+    )
+
+    original_count = last["cum_n"] - first["cum_n"] + 1
+    used = last["cum_kept"] - first["cum_kept"] + int(first_kept)
+    return {
+        "original_count": original_count,
+        "points_count_used": used,
+        "gps_jumps_removed": original_count - used,
+        "total_km": float(last["cum_km"] - first["cum_km"]),
+        "sand_base_entries": last["cum_sb_entries"] - first["cum_sb_entries"] + int(first_inside),
+    }
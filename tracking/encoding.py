@@ -0,0 +1,64 @@
+"""
+Компактные форматы точек для карты (trips_for_map?format=...).
+
+polyline — Google encoded polyline (точность 1e-5 град, ~1 м);
+binary   — int32 little-endian, микроградусы: первая точка рейса абсолютная,
+           дальше дельты; lat/lon чередуются.
+Декодеры на фронте — static/putevoy/js/decode.js.
+"""
+from __future__ import annotations
+
+import json
+import struct
+
+import numpy as np
+
+POLYLINE_PRECISION = 5
+BINARY_SCALE = 1_000_000
+
+# 5 бит на символ: int32-дельта после zigzag укладывается в 7 символов
+_CHUNKS = 7
+
+
+def _deltas(lat: np.ndarray, lon: np.ndarray, scale: int) -> np.ndarray:
+    """Округлённые координаты -> дельты, чередуя lat/lon (первая пара — абсолютная)."""
+    v = np.empty((lat.shape[0], 2), dtype=np.int64)
+    v[:, 0] = np.round(np.asarray(lat, dtype=np.float64) * scale)
+    v[:, 1] = np.round(np.asarray(lon, dtype=np.float64) * scale)
+    d = v.copy()
+    d[1:] -= v[:-1]
+    return d.reshape(-1)
+
+
+def encode_polyline(lat: np.ndarray, lon: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+    """Google encoded polyline, без цикла по точкам."""
+    if lat.shape[0] == 0:
+        return ""
+    d = _deltas(lat, lon, 10 ** precision)
+    z = np.where(d < 0, ~(d << 1), d << 1).astype(np.uint64)
+
+    shifts = np.arange(_CHUNKS, dtype=np.uint64) * np.uint64(5)
+    chunks = (z[:, None] >> shifts) & np.uint64(0x1F)
+    # число символов на значение: минимум один, дальше по старшему ненулевому куску
+    nz = chunks != 0
+    n = np.where(nz.any(axis=1), _CHUNKS - np.argmax(nz[:, ::-1], axis=1), 1)
+
+    pos = np.arange(_CHUNKS)
+    chunks |= np.where(pos[None, :] < (n[:, None] - 1), np.uint64(0x20), np.uint64(0))
+    chunks += np.uint64(63)
+    return chunks[pos[None, :] < n[:, None]].astype(np.uint8).tobytes().decode("ascii")
+
+
+def delta_int32(lat: np.ndarray, lon: np.ndarray) -> bytes:
+    """Рейс в binary-формате: 2 * n int32 LE."""
+    return _deltas(lat, lon, BINARY_SCALE).astype("<i4").tobytes()
+
+
+def pack_binary(header: dict, blobs) -> bytes:
+    """
+    [uint32 LE длина заголовка][JSON-заголовок utf-8, добит пробелами до кратности 4][данные].
+    blobs — байты рейсов (delta_int32) в порядке header["trips"].
+    """
+    head = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    head += b" " * (-(4 + len(head)) % 4)
+    return struct.pack("<I", len(head)) + head + b"".join(blobs)
@@ -0,0 +1,287 @@
+"""
+Векторный движок трек-аналитики (NumPy).
+
+Трек держим колонками: lat/lon/t (epoch-секунды)/speed (км/ч, NaN = нет данных)
++ исходные datetime (tm) — они нужны только на границах рейсов.
+Фильтр скачков, расстояния, заезды в геозону и деление на рейсы считаются
+на массивах, без python-цикла по каждой точке.
+"""
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# окно поиска следующей "нормальной" точки после скачка (растёт x2)
+_JUMP_WINDOW = 256
+
+
+@dataclass
+class Track:
+    lat: np.ndarray
+    lon: np.ndarray
+    t: np.ndarray
+    speed: np.ndarray
+    tm: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.lat.shape[0])
+
+    def take(self, sel) -> "Track":
+        """sel: bool-маска, массив индексов или slice."""
+        return Track(
+            lat=self.lat[sel],
+            lon=self.lon[sel],
+            t=self.t[sel],
+            speed=self.speed[sel],
+            tm=self.tm[sel],
+        )
+
+    @classmethod
+    def empty(cls) -> "Track":
+        f = np.empty(0, dtype=np.float64)
+        return cls(lat=f, lon=f.copy(), t=f.copy(), speed=f.copy(), tm=np.empty(0, dtype=object))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence]) -> "Track":
+        """
+        rows: (tm, lat, lon) или (tm, lat, lon, speed) — как из values_list().
+        tm — datetime, speed может быть None.
+        """
+        rows = list(rows)
+        n = len(rows)
+        if n == 0:
+            return cls.empty()
+
+        cols = list(zip(*rows))
+        tm = np.empty(n, dtype=object)
+        tm[:] = cols[0]
+
+        lat = np.asarray(cols[1], dtype=np.float64)
+        lon = np.asarray(cols[2], dtype=np.float64)
+        t = np.fromiter((x.timestamp() for x in cols[0]), dtype=np.float64, count=n)
+        if len(cols) > 3:
+            # None -> NaN
+            speed = np.array(cols[3], dtype=np.float64)
+        else:
+            speed = np.full(n, np.nan)
+
+        return cls(lat=lat, lon=lon, t=t, speed=speed, tm=tm)
+
+
+# ----------------- kernels -----------------
+
+def haversine_km(lat1, lon1, lat2, lon2, radius_km: float = EARTH_RADIUS_KM) -> np.ndarray:
+    """Расстояние по сфере, км. Аргументы — скаляры или массивы (broadcast)."""
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * radius_km * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def step_km(lat: np.ndarray, lon: np.ndarray, radius_km: float = EARTH_RADIUS_KM) -> np.ndarray:
+    """Длины отрезков между соседними точками (n-1 значений)."""
+    if lat.shape[0] < 2:
+        return np.empty(0, dtype=np.float64)
+    return haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:], radius_km)
+
+
+def cumulative_km(lat: np.ndarray, lon: np.ndarray, radius_km: float = EARTH_RADIUS_KM) -> np.ndarray:
+    """cum[i] — пройдено от точки 0 до точки i; длина отрезка a..b = cum[b] - cum[a]."""
+    out = np.zeros(lat.shape[0], dtype=np.float64)
+    if lat.shape[0] > 1:
+        np.cumsum(step_km(lat, lon, radius_km), out=out[1:])
+    return out
+
+
+def path_km(lat: np.ndarray, lon: np.ndarray, radius_km: float = EARTH_RADIUS_KM) -> float:
+    return float(step_km(lat, lon, radius_km).sum())
+
+
+def speed_mask(speed: np.ndarray, max_speed_kmh: float) -> np.ndarray:
+    """True — точка проходит по скорости (неизвестная скорость проходит)."""
+    return ~(speed > max_speed_kmh)
+
+
+def _pair_ok(lat0, lon0, t0, lat, lon, t, max_jump_km, max_speed_kmh, max_gap_s, radius_km) -> np.ndarray:
+    d = haversine_km(lat0, lon0, lat, lon, radius_km)
+    ok = ~(d > max_jump_km)
+    if t is not None and max_speed_kmh is not None:
+        dt_s = t - t0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sp = d / (dt_s / 3600.0)
+        ok &= ~((dt_s > 0) & (sp > max_speed_kmh))
+    if t is not None and max_gap_s is not None:
+        ok |= (t - t0) > max_gap_s
+    return ok
+
+
+def filter_jumps(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    max_jump_km: float,
+    t: Optional[np.ndarray] = None,
+    max_speed_kmh: Optional[float] = None,
+    radius_km: float = EARTH_RADIUS_KM,
+    max_gap_s: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Маска принятых точек. Семантика как у последовательного фильтра:
+    точка сравнивается с ПОСЛЕДНЕЙ ПРИНЯТОЙ (а не с соседней), отбрасывается если
+    дистанция > max_jump_km или (при t/max_speed_kmh) скорость > max_speed_kmh.
+    max_gap_s (нужен t): после паузы длиннее max_gap_s точка принимается всегда —
+    иначе одна "телепортация" отбрасывает весь остаток трека.
+
+    Сначала векторно проверяем все соседние пары: пока точки подряд "хорошие",
+    предыдущая принятая = соседняя. Только после отбракованной точки ищем
+    (тоже векторно, окнами) первую точку, допустимую относительно якоря.
+    """
+    n = lat.shape[0]
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+
+    def ok_from(anchor: int, lo: int, hi: int) -> np.ndarray:
+        return _pair_ok(
+            lat[anchor], lon[anchor], None if t is None else t[anchor],
+            lat[lo:hi], lon[lo:hi], None if t is None else t[lo:hi],
+            max_jump_km, max_speed_kmh, max_gap_s, radius_km,
+        )
+
+    pair_ok = _pair_ok(
+        lat[:-1], lon[:-1], None if t is None else t[:-1],
+        lat[1:], lon[1:], None if t is None else t[1:],
+        max_jump_km, max_speed_kmh, max_gap_s, radius_km,
+    )
+    # кандидаты на отбраковку при условии, что предыдущая точка принята
+    bad = np.flatnonzero(~pair_ok) + 1
+    if bad.size == 0:
+        return keep
+
+    i = 1
+    while True:
+        k = int(np.searchsorted(bad, i))
+        if k >= bad.size:
+            break
+        b = int(bad[k])
+        anchor = b - 1  # точки i..b-1 приняты цепочкой, b-1 — якорь
+        keep[b] = False
+
+        found = -1
+        lo = b + 1
+        w = _JUMP_WINDOW
+        while lo < n:
+            hi = min(n, lo + w)
+            hit = np.flatnonzero(ok_from(anchor, lo, hi))
+            if hit.size:
+                found = lo + int(hit[0])
+                break
+            lo = hi
+            w *= 2
+
+        if found < 0:
+            keep[b + 1:] = False
+            break
+        keep[b + 1:found] = False
+        i = found + 1
+
+    return keep
+
+
+def inside_circle(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    lat0: float,
+    lon0: float,
+    radius_km: float,
+    earth_radius_km: float = EARTH_RADIUS_KM,
+) -> np.ndarray:
+    return haversine_km(lat0, lon0, lat, lon, earth_radius_km) <= radius_km
+
+
+def entry_indexes(inside: np.ndarray) -> np.ndarray:
+    """Индексы переходов вне -> внутрь (первая точка внутри тоже считается заездом)."""
+    if inside.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+    prev = np.concatenate(([False], inside[:-1]))
+    return np.flatnonzero(inside & ~prev)
+
+
+def split_between_entries(n: int, entries: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Рейсы от заезда до следующего заезда: пары (a, b) включительно.
+    Если заездов < 2 — один рейс на весь трек (чтобы карта хоть что-то рисовала).
+    """
+    if entries.shape[0] >= 2:
+        return [(int(a), int(b)) for a, b in zip(entries[:-1], entries[1:]) if b > a]
+    if n >= 2:
+        return [(0, n - 1)]
+    return []
+
+
+def stride_indices(n: int, max_points: int) -> np.ndarray:
+    """Каждая N-я точка + последняя."""
+    if max_points <= 0 or n <= max_points:
+        return np.arange(n)
+    step = max(1, n // max_points)
+    idx = np.arange(0, n, step)
+    if idx[-1] != n - 1:
+        idx = np.append(idx, n - 1)
+    return idx
+
+
+def simplify(lat: np.ndarray, lon: np.ndarray, tolerance_km: float = 0.0, max_points: int = 0) -> np.ndarray:
+    """
+    Дуглас–Пекер без рекурсии: куча отрезков по максимальному отклонению,
+    всегда делим отрезок с самым большим отклонением. Останавливаемся, когда
+    отклонение <= tolerance_km или набрали max_points точек (0 — без лимита).
+    Так бюджет точек уходит на повороты, а не на прямые.
+    Возвращает отсортированные индексы; первая и последняя точка входят всегда.
+    """
+    n = lat.shape[0]
+    if n <= 2:
+        return np.arange(n)
+    if max_points and max_points < 2:
+        max_points = 2
+
+    # локальная равнопромежуточная проекция, км
+    k = np.cos(np.radians(np.nanmean(lat))) * EARTH_RADIUS_KM
+    x = np.radians(lon) * k
+    y = np.radians(lat) * EARTH_RADIUS_KM
+
+    def farthest(s: int, e: int):
+        if e - s < 2:
+            return -1, 0.0
+        px = x[s + 1:e]
+        py = y[s + 1:e]
+        ax, ay = x[s], y[s]
+        dx, dy = x[e] - ax, y[e] - ay
+        l2 = dx * dx + dy * dy
+        # расстояние до отрезка (а не до прямой) — трек часто возвращается в начало
+        u = np.clip(((px - ax) * dx + (py - ay) * dy) / l2, 0.0, 1.0) if l2 > 0 else 0.0
+        d = np.hypot(px - (ax + u * dx), py - (ay + u * dy))
+        i = int(np.argmax(d))
+        return s + 1 + i, float(d[i])
+
+    keep = [0, n - 1]
+    heap: List[Tuple[float, int, int, int]] = []
+
+    m, d = farthest(0, n - 1)
+    if m >= 0 and d > tolerance_km:
+        heap.append((-d, 0, n - 1, m))
+
+    while heap and not (max_points and len(keep) >= max_points):
+        _, s, e, m = heapq.heappop(heap)
+        keep.append(m)
+        for a, b in ((s, m), (m, e)):
+            mm, dd = farthest(a, b)
+            if mm >= 0 and dd > tolerance_km:
+                heapq.heappush(heap, (-dd, a, b, mm))
+
+    return np.sort(np.asarray(keep, dtype=np.int64))
@@ -0,0 +1,205 @@
+"""
+HTTP-клиент Fortmonitor для импортёров.
+
+Один requests.Session на весь запуск: keep-alive с пулом соединений на
+число потоков, gzip, повторы с backoff на 5xx/обрывах и таймауты. Когда
+cookie протухли (401/403, редирект на login.aspx или HTML вместо JSON),
+клиент сам логинится заново и повторяет запрос; при параллельной выгрузке
+перелогин выполняет один поток, остальные просто повторяют запрос.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE = "http://109.195.2.91"
+
+# куда сохранять cookie
+DOCS = Path.home() / "Документы"
+COOKIE_TXT = DOCS / "cookie.txt"
+
+# учётка Fortmonitor (лучше потом вынести в env)
+LOGIN = "volovo"
+PASSWORD = "Vol170717"
+
+USER_AGENT = "Mozilla/5.0"
+
+
+class SessionExpired(RuntimeError):
+    """Fortmonitor не принял cookie, а перелогин не помог или запрещён."""
+
+
+def _hidden(html: str, name: str) -> Optional[str]:
+    m = re.search(
+        r'<input[^>]+name="{name}"[^>]+value="([^"]*)"'.format(name=re.escape(name)),
+        html,
+        re.IGNORECASE,
+    )
+    return m.group(1) if m else None
+
+
+def login_get_cookie(base: str = BASE, session: Optional[requests.Session] = None) -> str:
+    """
+    Логин на login.aspx (ASP.NET) и сохранение cookie.
+    session — сессия, в которую положить cookie (по умолчанию новая).
+    """
+    s = session if session is not None else requests.Session()
+
+    r = s.get("{}/login.aspx".format(base), timeout=60)
+    r.raise_for_status()
+    html = r.text
+
+    viewstate = _hidden(html, "__VIEWSTATE")
+    eventvalidation = _hidden(html, "__EVENTVALIDATION")
+    viewstategenerator = _hidden(html, "__VIEWSTATEGENERATOR")
+
+    if not viewstate:
+        raise RuntimeError("Не нашёл __VIEWSTATE на login.aspx — возможно форма изменилась.")
+
+    data = {
+        "__EVENTTARGET": "lbEnter",
+        "__EVENTARGUMENT": "",
+        "__LASTFOCUS": "",
+        "__VIEWSTATE": viewstate,
+        "__EVENTVALIDATION": eventvalidation or "",
+        "__VIEWSTATEGENERATOR": viewstategenerator or "",
+        "TimeZone": "3",
+        "tbLogin": LOGIN,
+        "tbPassword": PASSWORD,
+    }
+
+    r2 = s.post("{}/login.aspx".format(base), data=data, timeout=60, allow_redirects=True)
+    r2.raise_for_status()
+
+    cookie_line = "; ".join(["{}={}".format(c.name, c.value) for c in s.cookies])
+    if not cookie_line:
+        raise RuntimeError("Cookie пустые — логин не удался?")
+
+    COOKIE_TXT.parent.mkdir(parents=True, exist_ok=True)
+    COOKIE_TXT.write_text(cookie_line, encoding="utf-8")
+    return cookie_line
+
+
+class RateLimiter:
+    """Не чаще rate запросов в секунду к хосту Fortmonitor (общий на все потоки); rate=0 — без лимита."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class FortmonitorClient:
+    """
+    client = FortmonitorClient(base, pool_size=workers)
+    client.login()                      # или client.set_cookie(строка из cookie.txt)
+    data = client.track(oid, "2026-01-01 00:00:00", "2026-01-01 06:00:00")
+
+    Методы безопасно вызывать из нескольких потоков.
+    """
+
+    def __init__(
+        self,
+        base: str = BASE,
+        pool_size: int = 4,
+        timeout: Tuple[float, float] = (10.0, 90.0),
+        retries: int = 3,
+        backoff: float = 0.5,
+        relogin: bool = True,
+    ):
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+        self.relogin = relogin
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size), max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+
+        self._lock = threading.Lock()
+        # номер логина: поток перелогинивается, только если никто не успел раньше
+        self._generation = 0
+
+    def set_cookie(self, cookie_line: str) -> None:
+        """Cookie в формате cookie.txt: "name=value; name2=value2"."""
+        for part in cookie_line.split(";"):
+            name, sep, value = part.strip().partition("=")
+            if sep:
+                self.session.cookies.set(name, value)
+
+    def login(self) -> str:
+        with self._lock:
+            self.session.cookies.clear()
+            cookie_line = login_get_cookie(self.base, session=self.session)
+            self._generation += 1
+        return cookie_line
+
+    def _relogin(self, generation: int) -> None:
+        with self._lock:
+            if self._generation != generation:
+                return
+            self.session.cookies.clear()
+            login_get_cookie(self.base, session=self.session)
+            self._generation += 1
+
+    @staticmethod
+    def _expired(r: requests.Response) -> bool:
+        if r.status_code in (401, 403):
+            return True
+        if "login.aspx" in r.url.lower():
+            return True
+        ctype = r.headers.get("Content-Type", "")
+        return r.ok and "json" not in ctype and "__VIEWSTATE" in r.text
+
+    def get_json(self, path: str, referer: str = "") -> Any:
+        """GET {base}{path} как XHR страницы referer; при протухших cookie — перелогин и повтор."""
+        headers = {
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "X-Requested-With": "XMLHttpRequest",
+        }
+        if referer:
+            headers["Referer"] = "{}/{}".format(self.base, referer)
+
+        for attempt in range(2):
+            generation = self._generation
+            r = self.session.get(self.base + path, headers=headers, timeout=self.timeout)
+            if not self._expired(r):
+                r.raise_for_status()
+                return r.json()
+            if attempt or not self.relogin:
+                break
+            self._relogin(generation)
+        raise SessionExpired("Fortmonitor: сессия истекла ({} {})".format(r.status_code, r.url))
+
+    def track(self, oid: int, dt_from: str, dt_to: str) -> Dict[str, Any]:
+        path = "/api/Api.svc/track?oid={}&from={}&to={}".format(oid, quote(dt_from), quote(dt_to))
+        return self.get_json(path, referer="MileageReportData.aspx")
@@ -0,0 +1,205 @@
+"""
+Геозоны (Geofence): пескобазы, места выгрузки и т.п. — круг (center + radius_m)
+или полигон (area).
+
+FenceIndex относит к зонам сразу весь массив точек: зоны разложены по сетке
+CELL_DEG x CELL_DEG (ячейка -> зоны, чей bbox её задевает), точка проверяется
+только против зон своей ячейки. Точки вне занятых ячеек отсеиваются одним
+np.isin, поэтому стоимость не растёт с числом зон. В SQL то же делают
+GiST-индексы на area/center (см. tracking.db.summary_sql).
+
+Заезды в cum_sb_entries и рейсы посчитаны по зонам на момент расчёта; с какой
+версией зон (version) — хранит Vehicle.sb_version. После правки зон range_summary
+отдаёт None (API считает на лету), а refresh_derived пересчитывает oid целиком.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count, Max, Q
+
+from tracking import engine
+from tracking.models import Geofence
+
+# ~1.1 км по широте: пескобаза целиком в 1-4 ячейках
+CELL_DEG = 0.01
+
+# код ячейки: (i + _I0) * _J_SPAN + (j + _J0), i/j — номера по широте/долготе
+_I0 = 10_000
+_J0 = 20_000
+_J_SPAN = 2 * _J0 + 1
+
+
+@dataclass
+class Fence:
+    id: Optional[int]
+    name: str
+    kind: str
+    # круг
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_km: Optional[float] = None
+    # полигон: кольца (lon[], lat[]), первое — внешнее, остальные — дыры
+    rings: List[Tuple[np.ndarray, np.ndarray]] = field(default_factory=list)
+
+    @classmethod
+    def from_model(cls, g: Geofence) -> "Fence":
+        if g.area is not None:
+            rings = []
+            for ring in g.area.coords:
+                xy = np.asarray(ring, dtype=np.float64)
+                rings.append((xy[:, 0], xy[:, 1]))
+            return cls(g.id, g.name, g.kind, rings=rings)
+        return cls(g.id, g.name, g.kind, lat=g.center.y, lon=g.center.x, radius_km=g.radius_m / 1000.0)
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        """(min_lat, min_lon, max_lat, max_lon)."""
+        if self.rings:
+            lon, lat = self.rings[0]
+            return float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max())
+        # с запасом 1%: по долготе окружность чуть шире d_lat / cos(lat)
+        d_lat = 1.01 * math.degrees(self.radius_km / engine.EARTH_RADIUS_KM)
+        d_lon = d_lat / max(math.cos(math.radians(self.lat)), 1e-6)
+        return self.lat - d_lat, self.lon - d_lon, self.lat + d_lat, self.lon + d_lon
+
+    def contains(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        if not self.rings:
+            return engine.inside_circle(lat, lon, self.lat, self.lon, self.radius_km)
+        # чётность пересечений луча на восток с рёбрами колец (дыры вычитаются сами)
+        inside = np.zeros(lat.shape[0], dtype=bool)
+        for rx, ry in self.rings:
+            for x1, y1, x2, y2 in zip(rx[:-1], ry[:-1], rx[1:], ry[1:]):
+                if y1 == y2:
+                    continue
+                cross = (y1 > lat) != (y2 > lat)
+                inside ^= cross & (lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1))
+        return inside
+
+    def as_json(self) -> Dict[str, Any]:
+        out = {"id": self.id, "name": self.name, "kind": self.kind}
+        if self.rings:
+            out["polygon"] = [np.column_stack(r).round(7).tolist() for r in self.rings]
+        else:
+            out.update(lat=self.lat, lon=self.lon, radius_km=self.radius_km)
+        return out
+
+
+def _cells(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    i = np.floor(lat / CELL_DEG).astype(np.int64)
+    j = np.floor(lon / CELL_DEG).astype(np.int64)
+    return (i + _I0) * _J_SPAN + (j + _J0)
+
+
+class FenceIndex:
+    """
+    index = load(Geofence.SAND_BASE)
+    inside = index.inside(lat, lon)      # bool[]
+    which = index.classify(lat, lon)     # номер зоны в index.fences или -1
+    """
+
+    def __init__(self, fences: List[Fence], kind: Optional[str] = None):
+        self.fences = list(fences)
+        self.kind = kind
+        cells: Dict[int, List[int]] = {}
+        for n, f in enumerate(self.fences):
+            lat0, lon0, lat1, lon1 = f.bbox()
+            i0, i1 = math.floor(lat0 / CELL_DEG), math.floor(lat1 / CELL_DEG)
+            j0, j1 = math.floor(lon0 / CELL_DEG), math.floor(lon1 / CELL_DEG)
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    cells.setdefault((i + _I0) * _J_SPAN + (j + _J0), []).append(n)
+        self._cells = cells
+        self._keys = np.fromiter(sorted(cells), dtype=np.int64, count=len(cells))
+
+    def __len__(self) -> int:
+        return len(self.fences)
+
+    def classify(self, lat, lon) -> np.ndarray:
+        """Номер зоны для каждой точки (при пересечении зон — первая по порядку), -1 — вне зон."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        out = np.full(lat.shape[0], -1, dtype=np.int64)
+        if not self.fences or not lat.shape[0]:
+            return out
+
+        codes = _cells(lat, lon)
+        cand = np.flatnonzero(np.isin(codes, self._keys))
+        if not cand.shape[0]:
+            return out
+
+        # точки-кандидаты группами по ячейке
+        cand = cand[np.argsort(codes[cand], kind="stable")]
+        c = codes[cand]
+        starts = np.flatnonzero(np.concatenate(([True], c[1:] != c[:-1])))
+        ends = np.concatenate((starts[1:], [c.shape[0]]))
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            todo = cand[a:b]
+            for n in self._cells[int(c[a])]:
+                hit = self.fences[n].contains(lat[todo], lon[todo])
+                out[todo[hit]] = n
+                todo = todo[~hit]
+                if not todo.shape[0]:
+                    break
+        return out
+
+    def inside(self, lat, lon) -> np.ndarray:
+        return self.classify(lat, lon) >= 0
+
+    def max_radius_m(self) -> float:
+        return max((f.radius_km * 1000.0 for f in self.fences if not f.rings), default=0.0)
+
+    def has_polygons(self) -> bool:
+        return any(f.rings for f in self.fences)
+
+    def as_json(self) -> Optional[Dict[str, Any]]:
+        """
+        Для ответов API ("sand_base"): lat/lon/radius_km первой зоны, как раньше
+        у единственной пескобазы (карта рисует по ним круг), и все зоны в "geofences".
+        """
+        if not self.fences:
+            return None
+        f = self.fences[0]
+        if f.rings:
+            lat0, lon0, lat1, lon1 = f.bbox()
+            lat, lon = (lat0 + lat1) / 2.0, (lon0 + lon1) / 2.0
+            radius_km = float(engine.haversine_km(lat, lon, lat1, lon1))
+        else:
+            lat, lon, radius_km = f.lat, f.lon, f.radius_km
+        return {"lat": lat, "lon": lon, "radius_km": radius_km, "geofences": [g.as_json() for g in self.fences]}
+
+
+# kind -> (отпечаток таблицы, индекс)
+_cache: Dict[Optional[str], Tuple[tuple, FenceIndex]] = {}
+
+
+def _fences(kind: Optional[str]):
+    return Geofence.objects.all() if kind is None else Geofence.objects.filter(kind=kind)
+
+
+def _stamp(qs) -> tuple:
+    """Отпечаток зон: меняется при добавлении, удалении, правке и (де)активации."""
+    agg = qs.aggregate(n=Count("id"), active=Count("id", filter=Q(active=True)), changed=Max("updated_at"))
+    return agg["n"], agg["active"], agg["changed"]
+
+
+def version(kind: Optional[str] = Geofence.SAND_BASE) -> str:
+    """Версия зон вида kind строкой — для Vehicle.sb_version и ключей кэша API."""
+    n, active, changed = _stamp(_fences(kind))
+    return "{}:{}:{}".format(n, active, changed.isoformat() if changed else "")
+
+
+def load(kind: Optional[str] = Geofence.SAND_BASE) -> FenceIndex:
+    """Активные зоны вида kind (None — все); индекс перестраивается, только если зоны менялись."""
+    qs = _fences(kind)
+    stamp = _stamp(qs)
+
+    hit = _cache.get(kind)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+
+    index = FenceIndex([Fence.from_model(g) for g in qs.filter(active=True).order_by("id")], kind=kind)
+    _cache[kind] = (stamp, index)
+    return index
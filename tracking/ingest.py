@@ -0,0 +1,193 @@
+"""
+Запись ответов Fortmonitor в TrackPoint: общая для import_fortmonitor
+(диапазоны дат, повтор архива) и ingest_daemon (малые окна по всему парку).
+
+Чанк ответа разбирается в строки (oid, tm, idx, lon, lat, speed_kmh, odo_km),
+пишется одним upsert (tracking.loader) и коммитится вместе с водяным знаком
+ImportCheckpoint; cum_*/рейсы пересчитываются по oid отдельно (refresh).
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from tracking import checkpoints
+from tracking.derived import refresh_derived
+from tracking.loader import upsert_points
+from tracking.versions import bump
+
+# source в ImportCheckpoint
+SOURCE = "fortmonitor"
+
+
+def to_float(x: Any) -> Optional[float]:
+    if x is None:
+        return None
+    try:
+        if isinstance(x, str):
+            x = x.replace(",", ".").strip()
+            if x == "":
+                return None
+        return float(x)
+    except Exception:
+        return None
+
+
+def parse_tm(tm_raw: Any) -> Optional[datetime]:
+    """
+    Fortmonitor 'tm' обычно строка.
+    Возвращаем aware datetime в TZ проекта (обычно Europe/Moscow/+03).
+    """
+    if tm_raw is None:
+        return None
+
+    if isinstance(tm_raw, datetime):
+        dt = tm_raw
+    else:
+        s = str(tm_raw).strip()
+        if not s:
+            return None
+
+        fmts = [
+            "%Y-%m-%d %H:%M:%S",
+            "%d.%m.%Y %H:%M:%S",
+            "%Y-%m-%dT%H:%M:%S",
+            "%Y-%m-%d %H:%M",
+            "%d.%m.%Y %H:%M",
+        ]
+
+        dt = None
+        for fmt in fmts:
+            try:
+                dt = datetime.strptime(s, fmt)
+                break
+            except Exception:
+                continue
+
+        if dt is None:
+            return None
+
+    tz = timezone.get_current_timezone()
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, tz)
+    else:
+        dt = dt.astimezone(tz)
+    return dt
+
+
+def normalize_dt_str(s: str, is_to: bool) -> str:
+    """
+    Даты из параметров команд. Принимаем:
+      YYYY-MM-DD
+      YYYY-MM-DD HH:MM:SS
+    Возвращаем: 'YYYY-MM-DD HH:MM:SS'
+    """
+    s = (s or "").strip()
+    if not s:
+        raise RuntimeError("Пустая дата")
+
+    if len(s) == 10:
+        return s + (" 23:59:59" if is_to else " 00:00:00")
+    return s
+
+
+def dst_to_odo_km(dst_val: Any) -> Optional[float]:
+    """
+    Fortmonitor coords[][]: второй элемент обычно 'dst' (пройдено).
+    Иногда в метрах, иногда в км.
+    Эвристика:
+      если > 10000 => метры -> км
+      иначе => км
+    """
+    d = to_float(dst_val)
+    if d is None:
+        return None
+    if d > 10000:
+        return d / 1000.0
+    return d
+
+
+def split_range(dt_from: datetime, dt_to: datetime, chunk_hours: int):
+    cur = dt_from
+    step = timedelta(hours=chunk_hours)
+    while cur < dt_to:
+        nxt = min(dt_to, cur + step)
+        yield cur, nxt
+        cur = nxt
+
+
+def parse_coords(oid: int, coords: Sequence[Any]) -> List[Tuple]:
+    """
+    coords ответа -> строки (oid, tm, idx, lon, lat, speed_kmh, odo_km);
+    idx=None: номер новым точкам выдаёт store_chunk в SQL (уже загруженные его не тратят).
+    """
+    rows: List[Tuple] = []
+
+    for row in coords:
+        # ожидаем list: [dir, dst, lat, lon, speed, st, tm, width]
+        if isinstance(row, list):
+            dst_ = row[1] if len(row) > 1 else None
+            lat_ = to_float(row[2] if len(row) > 2 else None)
+            lon_ = to_float(row[3] if len(row) > 3 else None)
+            speed_ = to_float(row[4] if len(row) > 4 else None)
+            tm_raw = row[6] if len(row) > 6 else None
+        elif isinstance(row, dict):
+            dst_ = row.get("dst")
+            lat_ = to_float(row.get("lat"))
+            lon_ = to_float(row.get("lon"))
+            speed_ = to_float(row.get("speed"))
+            tm_raw = row.get("tm")
+        else:
+            continue
+
+        if lat_ is None or lon_ is None:
+            continue
+
+        tm_dt = parse_tm(tm_raw)
+        if not tm_dt:
+            continue
+
+        rows.append((oid, tm_dt, None, float(lon_), float(lat_), speed_, dst_to_odo_km(dst_)))
+
+    return rows
+
+
+def store_chunk(
+    oid: int, rows: Sequence[Tuple], mark: Optional[datetime], use_copy: bool = False
+) -> Tuple[int, int, Optional[datetime]]:
+    """
+    Один INSERT ... ON CONFLICT (oid, tm) DO UPDATE: возвращаются только
+    вставленные и реально изменённые точки, нетронутые не переписываются.
+    Пачка, водяной знак (mark; None — не двигать) и версии данных изменённых
+    суток (кэш API, tracking.versions) коммитятся вместе. idx получают
+    только вставленные точки, подряд после max(idx) oid.
+    Возвращаем (новых, обновлённых, самая ранняя изменённая tm).
+    """
+    with transaction.atomic():
+        changed = upsert_points(rows, use_copy=use_copy, number_new=True) if rows else []
+        first = min(r[1] for r in changed) if changed else None
+        if mark is not None or first is not None:
+            checkpoints.advance(oid, SOURCE, mark, first)
+        if first is not None:
+            bump(oid, since=first)
+    n_new = sum(1 for r in changed if r[4])
+    return n_new, len(changed) - n_new, first
+
+
+def pending_since(oid: int) -> Optional[datetime]:
+    """Долг пересчёта от прошлого запуска, упавшего до refresh_derived."""
+    cp = checkpoints.get(oid, SOURCE)
+    return cp.dirty_from if cp is not None else None
+
+
+def refresh(oid: int, since: datetime) -> Tuple[int, int, int]:
+    """
+    refresh_derived (cum_* коммитятся постранично), затем снятие долга —
+    только после пересчёта всего хвоста и только не раньше since.
+    """
+    res = refresh_derived(oid, since=since)
+    checkpoints.mark_clean(oid, SOURCE, since)
+    return res
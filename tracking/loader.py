@@ -0,0 +1,173 @@
+"""
+Быстрая загрузка точек: COPY во временную staging-таблицу и один
+INSERT ... SELECT в tracking_trackpoint (вместо bulk_create с GEOS Point
+и объектом модели на каждую строку).
+
+Строка: (oid, tm, idx, lon, lat, speed_kmh, odo_km); idx/speed/odo могут быть None
+(upsert_points(number_new=True) выдаёт idx новым точкам сам).
+Ключ — уникальный (oid, tm): insert_points/copy_points пропускают уже загруженные
+точки, upsert_points обновляет их, но только если значения действительно поменялись.
+Реестр Vehicle обновляется по строкам из RETURNING (tracking.vehicles).
+"""
+from __future__ import annotations
+
+import io
+from datetime import datetime
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from django.db import connection
+
+from tracking.vehicles import note_rows
+
+STAGE = "tracking_trackpoint_stage"
+
+_CREATE_SQL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGE} (
+    oid integer NOT NULL,
+    tm timestamptz NOT NULL,
+    idx integer,
+    lon double precision NOT NULL,
+    lat double precision NOT NULL,
+    speed_kmh double precision,
+    odo_km double precision
+)
+"""
+
+# {source} — staging-таблица или unnest массивов; дубли (oid, tm) внутри
+# пачки схлопываем сами: ON CONFLICT DO UPDATE не может тронуть строку дважды
+_MERGE_SQL = """
+WITH src AS (
+    SELECT DISTINCT ON (oid, tm) oid, tm, idx, lon, lat, speed_kmh, odo_km
+    FROM {source}
+    ORDER BY oid, tm
+){numbered}
+INSERT INTO tracking_trackpoint AS t (oid, tm, idx, geom, speed_kmh, odo_km)
+SELECT s.oid, s.tm, {idx}, ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)::geography, s.speed_kmh, s.odo_km
+FROM src s{join}
+ORDER BY s.oid, s.tm
+ON CONFLICT (oid, tm) {action}
+RETURNING t.oid, t.tm, ST_X(t.geom::geometry), ST_Y(t.geom::geometry), (t.xmax = 0)
+"""
+
+# number_new: idx без значения выдаём в том же запросе и только точкам, которых
+# ещё нет в таблице, — подряд после max(idx) oid (индекс (oid, idx)), без пропусков
+_NUMBERED = """, base AS (
+    SELECT o.oid, (SELECT COALESCE(MAX(p.idx) + 1, 0) FROM tracking_trackpoint p WHERE p.oid = o.oid) AS next_idx
+    FROM (SELECT DISTINCT oid FROM src) o
+), fresh AS (
+    SELECT s.oid, s.tm, b.next_idx + row_number() OVER (PARTITION BY s.oid ORDER BY s.tm) - 1 AS idx
+    FROM src s JOIN base b ON b.oid = s.oid
+    WHERE s.idx IS NULL
+      AND NOT EXISTS (SELECT 1 FROM tracking_trackpoint p WHERE p.oid = s.oid AND p.tm = s.tm)
+)"""
+
+# idx у существующей точки не трогаем; speed/odo без значения в ответе не затираем
+_DO_UPDATE = """DO UPDATE SET
+    geom = EXCLUDED.geom,
+    speed_kmh = COALESCE(EXCLUDED.speed_kmh, t.speed_kmh),
+    odo_km = COALESCE(EXCLUDED.odo_km, t.odo_km)
+WHERE ST_AsBinary(t.geom) IS DISTINCT FROM ST_AsBinary(EXCLUDED.geom)
+   OR (EXCLUDED.speed_kmh IS NOT NULL AND t.speed_kmh IS DISTINCT FROM EXCLUDED.speed_kmh)
+   OR (EXCLUDED.odo_km IS NOT NULL AND t.odo_km IS DISTINCT FROM EXCLUDED.odo_km)
+"""
+
+_UNNEST = """unnest(%s::integer[], %s::timestamptz[], %s::integer[], %s::float8[], %s::float8[],
+            %s::float8[], %s::float8[]) AS s(oid, tm, idx, lon, lat, speed_kmh, odo_km)"""
+
+_COLUMNS = "(oid, tm, idx, lon, lat, speed_kmh, odo_km)"
+
+
+def _cell(v) -> str:
+    if v is None:
+        return "\\N"
+    if isinstance(v, float):
+        return repr(v)
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return str(v)
+
+
+class _RowStream(io.RawIOBase):
+    """Файл для copy_expert поверх итератора строк: весь COPY в памяти не собирается."""
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self._lines: Iterator[bytes] = (
+            ("\t".join(_cell(v) for v in row) + "\n").encode("utf-8") for row in rows
+        )
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buf) < size:
+            chunk = next(self._lines, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        if size < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def _stage(cur, rows: Iterable[Sequence]) -> None:
+    cur.execute(_CREATE_SQL)
+    cur.execute(f"TRUNCATE {STAGE}")
+    cur.copy_expert(f"COPY {STAGE} {_COLUMNS} FROM STDIN", _RowStream(rows), size=1 << 16)
+
+
+def _merge_sql(source: str, action: str, number_new: bool) -> str:
+    if number_new:
+        return _MERGE_SQL.format(
+            source=source, action=action, numbered=_NUMBERED,
+            idx="COALESCE(s.idx, f.idx)", join="\nLEFT JOIN fresh f ON f.oid = s.oid AND f.tm = s.tm",
+        )
+    return _MERGE_SQL.format(source=source, action=action, numbered="", idx="s.idx", join="")
+
+
+def _merge(
+    rows: Iterable[Sequence], action: str, use_copy: bool, registry: bool, number_new: bool = False
+) -> List[Tuple]:
+    """Строки RETURNING: (oid, tm, lon, lat, inserted)."""
+    with connection.cursor() as cur:
+        if use_copy:
+            _stage(cur, rows)
+            cur.execute(_merge_sql(STAGE, action, number_new))
+        else:
+            cols = list(zip(*rows)) or [()] * 7
+            cur.execute(_merge_sql(_UNNEST, action, number_new), [list(c) for c in cols])
+        out = cur.fetchall()
+    if registry and out:
+        note_rows(out)
+    return out
+
+
+def insert_points(rows: Iterable[Sequence], use_copy: bool = False, registry: bool = True) -> List[Tuple]:
+    """
+    INSERT ... ON CONFLICT (oid, tm) DO NOTHING: точки с уже загруженным (oid, tm) пропускаются.
+    use_copy — через staging-таблицу, иначе одним unnest.
+    registry — обновить Vehicle (только вставленными строками).
+    Возвращаем (oid, tm, lon, lat, inserted) действительно вставленных строк.
+    """
+    return _merge(rows, "DO NOTHING", use_copy=use_copy, registry=registry)
+
+
+def copy_points(rows: Iterable[Sequence], registry: bool = True) -> int:
+    """insert_points через staging-таблицу; возвращаем число вставленных строк."""
+    return len(insert_points(rows, use_copy=True, registry=registry))
+
+
+def upsert_points(
+    rows: Iterable[Sequence], use_copy: bool = False, registry: bool = True, number_new: bool = False
+) -> List[Tuple]:
+    """
+    INSERT ... ON CONFLICT (oid, tm) DO UPDATE: новые точки вставляются,
+    существующие переписываются только при изменившихся geom/speed/odo.
+    use_copy — через staging-таблицу (большие пачки), иначе одним unnest.
+    number_new — строкам с idx=None нумеровать новые точки в SQL (после max(idx) oid).
+    Возвращаем (oid, tm, lon, lat, inserted) вставленных и изменённых строк;
+    нетронутые точки в ответ не попадают.
+    """
+    return _merge(rows, _DO_UPDATE, use_copy=use_copy, registry=registry, number_new=number_new)
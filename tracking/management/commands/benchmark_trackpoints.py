@@ -0,0 +1,105 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from tracking.db import load_track
+from tracking.ingest import normalize_dt_str, parse_tm
+from tracking.loader import insert_points
+from tracking.models import TrackPoint
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер вставки TrackPoint (bulk_create и insert_points, откатывается) и чтения трека (load_track, как _load_points). "
+        "Запускать до и после миграции индексов на одних и тех же параметрах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oid", type=int, required=True, help="OID для замера чтения")
+        parser.add_argument("--from", dest="dt_from", required=True, help="Начало: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+        parser.add_argument("--to", dest="dt_to", required=True, help="Конец: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+        parser.add_argument("--repeat", type=int, default=10, help="Повторов чтения (по умолчанию 10)")
+        parser.add_argument("--insert", type=int, default=50000, help="Точек для замера вставки (0 — не мерить)")
+        parser.add_argument("--explain", action="store_true", help="Показать EXPLAIN (ANALYZE, BUFFERS) запроса чтения")
+
+    def handle(self, *args, **opts):
+        oid = int(opts["oid"])
+        dt_from = parse_tm(normalize_dt_str(opts["dt_from"], is_to=False))
+        dt_to = parse_tm(normalize_dt_str(opts["dt_to"], is_to=True))
+        if not dt_from or not dt_to:
+            raise RuntimeError("Не смог распарсить --from/--to. Пример: --from 2025-12-01 --to 2025-12-31")
+
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'tracking_trackpoint' ORDER BY indexname"
+            )
+            self.stdout.write("Индексы: " + ", ".join(r[0] for r in cur.fetchall()))
+
+        # ---- чтение
+        n = 0
+        times = []
+        for _ in range(max(1, int(opts["repeat"]))):
+            t0 = time.perf_counter()
+            n = len(load_track(oid, dt_from, dt_to))
+            times.append((time.perf_counter() - t0) * 1000.0)
+        times.sort()
+        p95 = times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))]
+        self.stdout.write(
+            "load_track: {} точек, p50={:.1f} мс, p95={:.1f} мс, min={:.1f} мс".format(
+                n, statistics.median(times), p95, times[0]
+            )
+        )
+
+        if opts.get("explain"):
+            qs = (
+                TrackPoint.objects.filter(oid=oid, tm__gte=dt_from, tm__lte=dt_to)
+                .order_by("tm")
+                .values_list("tm", "geom")
+            )
+            sql, params = qs.query.sql_with_params()
+            with connection.cursor() as cur:
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+                for (line,) in cur.fetchall():
+                    self.stdout.write("  " + line)
+
+        # ---- вставка (в транзакции, которая откатывается)
+        total = int(opts["insert"])
+        if total <= 0:
+            return
+        fake_oid = -1  # в реальных данных oid > 0
+        objs = [
+            TrackPoint(
+                oid=fake_oid,
+                tm=dt_from + timedelta(seconds=i),
+                idx=i,
+                geom=Point(37.88 + (i % 1000) * 1e-5, 52.03 + (i // 1000) * 1e-5, srid=4326),
+                speed_kmh=40.0,
+                odo_km=i * 0.01,
+            )
+            for i in range(total)
+        ]
+        rows = [(p.oid, p.tm, p.idx, p.geom.x, p.geom.y, p.speed_kmh, p.odo_km) for p in objs]
+        self._insert("bulk_create", total, lambda: TrackPoint.objects.bulk_create(objs, batch_size=5000))
+        # путь импортёров: INSERT ... ON CONFLICT DO NOTHING RETURNING (tracking.loader)
+        self._insert("insert_points", total, lambda: insert_points(rows, registry=False))
+        self._insert("insert_points(copy)", total, lambda: insert_points(rows, use_copy=True, registry=False))
+
+    def _insert(self, name, total, fn):
+        """Замер вставки в транзакции, которая откатывается."""
+        t0 = time.perf_counter()
+        try:
+            with transaction.atomic():
+                fn()
+                elapsed = time.perf_counter() - t0
+                raise _Rollback()
+        except _Rollback:
+            pass
+        self.stdout.write("{}: {} точек за {:.2f} с, {:.0f} строк/с".format(name, total, elapsed, total / elapsed))
@@ -0,0 +1,42 @@
+from typing import List
+
+from django.core.management.base import BaseCommand
+
+from tracking.ingest import normalize_dt_str, parse_tm
+from tracking.models import TrackPoint
+from tracking.pyramid import PYRAMID_LEVELS, build_range
+
+
+class Command(BaseCommand):
+    help = "Построение пирамиды упрощённых треков (TrackPyramid) по суткам для обзорных масштабов карты."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oid", type=int, default=0, help="Один OID")
+        parser.add_argument("--oids", type=str, default="", help="Список OID через запятую: 182,716,717")
+        parser.add_argument("--all", action="store_true", help="Все OID из tracking_trackpoint")
+        parser.add_argument("--from", dest="dt_from", default="", help="Начало: YYYY-MM-DD (по умолчанию первая точка)")
+        parser.add_argument("--to", dest="dt_to", default="", help="Конец: YYYY-MM-DD (по умолчанию последняя точка)")
+
+    def handle(self, *args, **opts):
+        oids: List[int] = []
+        if opts.get("all"):
+            oids = list(TrackPoint.objects.values_list("oid", flat=True).distinct().order_by("oid"))
+        elif int(opts.get("oid") or 0):
+            oids = [int(opts["oid"])]
+        else:
+            s = (opts.get("oids") or "").strip()
+            if s:
+                oids = [int(x.strip()) for x in s.split(",") if x.strip().isdigit()]
+
+        if not oids:
+            raise RuntimeError("Нужно указать --oid, --oids или --all")
+
+        since = parse_tm(normalize_dt_str(opts["dt_from"], is_to=False)) if opts.get("dt_from") else None
+        until = parse_tm(normalize_dt_str(opts["dt_to"], is_to=True)) if opts.get("dt_to") else None
+
+        self.stdout.write("Уровни (zoom, допуск м): {}".format(list(PYRAMID_LEVELS)))
+        for oid in oids:
+            n = build_range(oid, since=since, until=until)
+            self.stdout.write("OID={}: построено суток: {}".format(oid, n))
+
+        self.stdout.write(self.style.SUCCESS("ГОТОВО"))
@@ -1,196 +1,54 @@
-import re
-import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
-from urllib.parse import quote
-from typing import Optional, Any, Dict, List, Tuple
-
-import requests
+from typing import Optional, Dict, List
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
 from django.utils import timezone
-from django.contrib.gis.geos import Point
-
-from tracking.models import TrackPoint
-
-
-BASE = "http://109.195.2.91"
-
-# куда сохранять cookie
-DOCS = Path.home() / "Документы"
-COOKIE_TXT = DOCS / "cookie.txt"
-
-# учётка Fortmonitor (лучше потом вынести в env)
-LOGIN = "volovo"
-PASSWORD = "Vol170717"
-
-
-def _hidden(html: str, name: str) -> Optional[str]:
-    m = re.search(
-        r'<input[^>]+name="{name}"[^>]+value="([^"]*)"'.format(name=re.escape(name)),
-        html,
-        re.IGNORECASE,
-    )
-    return m.group(1) if m else None
-
 
-def _to_float(x: Any) -> Optional[float]:
-    if x is None:
-        return None
-    try:
-        if isinstance(x, str):
-            x = x.replace(",", ".").strip()
-            if x == "":
-                return None
-        return float(x)
-    except Exception:
-        return None
+from tracking import checkpoints
+from tracking.fortmonitor import BASE, COOKIE_TXT, DOCS, FortmonitorClient, RateLimiter
+from tracking.ingest import (
+    SOURCE, normalize_dt_str, parse_coords, parse_tm, pending_since, refresh, split_range,
+    store_chunk,
+)
+from tracking.rawarchive import SUFFIXES, RawArchive
 
 
-def _parse_tm(tm_raw: Any) -> Optional[datetime]:
+def fetch_chunks(tasks, fetch, workers: int = 1, limiter: Optional[RateLimiter] = None):
     """
-    Fortmonitor 'tm' обычно строка.
-    Возвращаем aware datetime в TZ проекта (обычно Europe/Moscow/+03).
+    Для задач (oid, a, b) вызываем fetch(oid, a_str, b_str) в workers потоках,
+    в работе не больше 2*workers запросов. Результаты (задача, ответ) отдаём
+    строго в порядке задач: запись в БД остаётся в одном потоке и по порядку.
     """
-    if tm_raw is None:
-        return None
-
-    if isinstance(tm_raw, datetime):
-        dt = tm_raw
-    else:
-        s = str(tm_raw).strip()
-        if not s:
-            return None
-
-        fmts = [
-            "%Y-%m-%d %H:%M:%S",
-            "%d.%m.%Y %H:%M:%S",
-            "%Y-%m-%dT%H:%M:%S",
-            "%Y-%m-%d %H:%M",
-            "%d.%m.%Y %H:%M",
-        ]
-
-        dt = None
-        for fmt in fmts:
-            try:
-                dt = datetime.strptime(s, fmt)
-                break
-            except Exception:
-                continue
-
-        if dt is None:
-            return None
-
-    tz = timezone.get_current_timezone()
-    if timezone.is_naive(dt):
-        dt = timezone.make_aware(dt, tz)
-    else:
-        dt = dt.astimezone(tz)
-    return dt
-
-
-def normalize_dt_str(s: str, is_to: bool) -> str:
-    """
-    Принимаем:
-      YYYY-MM-DD
-      YYYY-MM-DD HH:MM:SS
-    Возвращаем: 'YYYY-MM-DD HH:MM:SS'
-    """
-    s = (s or "").strip()
-    if not s:
-        raise RuntimeError("Пустая дата")
-
-    if len(s) == 10:
-        return s + (" 23:59:59" if is_to else " 00:00:00")
-    return s
-
-
-def split_range(dt_from: datetime, dt_to: datetime, chunk_hours: int):
-    cur = dt_from
-    step = timedelta(hours=chunk_hours)
-    while cur < dt_to:
-        nxt = min(dt_to, cur + step)
-        yield cur, nxt
-        cur = nxt
-
-
-def dst_to_odo_km(dst_val: Any) -> Optional[float]:
-    """
-    Fortmonitor coords[][]: второй элемент обычно 'dst' (пройдено).
-    Иногда в метрах, иногда в км.
-    Эвристика:
-      если > 10000 => метры -> км
-      иначе => км
-    """
-    d = _to_float(dst_val)
-    if d is None:
-        return None
-    if d > 10000:
-        return d / 1000.0
-    return d
-
-
-def login_get_cookie() -> str:
-    """
-    Логин на login.aspx (ASP.NET) и сохранение cookie.
-    """
-    s = requests.Session()
-
-    r = s.get("{}/login.aspx".format(BASE), timeout=60)
-    r.raise_for_status()
-    html = r.text
-
-    viewstate = _hidden(html, "__VIEWSTATE")
-    eventvalidation = _hidden(html, "__EVENTVALIDATION")
-    viewstategenerator = _hidden(html, "__VIEWSTATEGENERATOR")
-
-    if not viewstate:
-        raise RuntimeError("Не нашёл __VIEWSTATE на login.aspx — возможно форма изменилась.")
-
-    data = {
-        "__EVENTTARGET": "lbEnter",
-        "__EVENTARGUMENT": "",
-        "__LASTFOCUS": "",
-        "__VIEWSTATE": viewstate,
-        "__EVENTVALIDATION": eventvalidation or "",
-        "__VIEWSTATEGENERATOR": viewstategenerator or "",
-        "TimeZone": "3",
-        "tbLogin": LOGIN,
-        "tbPassword": PASSWORD,
-    }
-
-    r2 = s.post("{}/login.aspx".format(BASE), data=data, timeout=60, allow_redirects=True)
-    r2.raise_for_status()
-
-    cookie_line = "; ".join(["{}={}".format(c.name, c.value) for c in s.cookies])
-    if not cookie_line:
-        raise RuntimeError("Cookie пустые — логин не удался?")
-
-    COOKIE_TXT.parent.mkdir(parents=True, exist_ok=True)
-    COOKIE_TXT.write_text(cookie_line, encoding="utf-8")
-    return cookie_line
-
-
-def fetch_track(cookie_line: str, oid: int, dt_from: str, dt_to: str) -> Dict[str, Any]:
-    url = (
-        "{}/api/Api.svc/track?oid={}&from={}&to={}".format(
-            BASE, oid, quote(dt_from), quote(dt_to)
-        )
-    )
-    r = requests.get(
-        url,
-        headers={
-            "Accept": "application/json, text/javascript, */*; q=0.01",
-            "X-Requested-With": "XMLHttpRequest",
-            "Referer": "{}/MileageReportData.aspx".format(BASE),
-            "Cookie": cookie_line,
-            "User-Agent": "Mozilla/5.0",
-        },
-        timeout=90,
-    )
-    r.raise_for_status()
-    return r.json()
+    def call(task):
+        oid, a, b = task
+        if limiter is not None:
+            limiter.wait()
+        return fetch(oid, a.strftime("%Y-%m-%d %H:%M:%S"), b.strftime("%Y-%m-%d %H:%M:%S"))
+
+    if workers <= 1:
+        for task in tasks:
+            yield task, call(task)
+        return
+
+    window = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fortmonitor") as ex:
+        try:
+            for task in tasks:
+                window.append((task, ex.submit(call, task)))
+                if len(window) >= 2 * workers:
+                    t, f = window.popleft()
+                    yield t, f.result()
+            while window:
+                t, f = window.popleft()
+                yield t, f.result()
+        finally:
+            for _, f in window:
+                f.cancel()
 
 
 class Command(BaseCommand):
@@ -199,13 +57,21 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--oid", type=int, default=0, help="Один OID")
         parser.add_argument("--oids", type=str, default="", help="Список OID через запятую: 182,716,717")
-        parser.add_argument("--from", dest="dt_from", required=True, help="Начало: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
-        parser.add_argument("--to", dest="dt_to", required=True, help="Конец: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS")
+        parser.add_argument("--from", dest="dt_from", default="", help="Начало: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS (с --resume — для oid без водяного знака)")
+        parser.add_argument("--to", dest="dt_to", default="", help="Конец: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS (по умолчанию — сейчас)")
+        parser.add_argument("--resume", "--since-last", dest="resume", action="store_true", help="Начинать каждый oid с водяного знака прошлого импорта (ImportCheckpoint)")
+        parser.add_argument("--overlap-hours", type=float, default=1.0, help="С --resume: захватить N часов до водяного знака (опоздавшие точки)")
         parser.add_argument("--chunk-hours", type=int, default=6, help="Размер чанка в часах")
         parser.add_argument("--no-login", action="store_true", help="Не логиниться, взять cookie из cookie.txt")
-        parser.add_argument("--save-raw", action="store_true", help="Сохранять raw json ответы в ~/Документы")
+        parser.add_argument("--save-raw", action="store_true", help="Архивировать сырые ответы: NDJSON по oid и суткам в --raw-dir (tracking.rawarchive)")
+        parser.add_argument("--raw-dir", default=str(DOCS / "fortmonitor_raw"), help="Каталог архива сырых ответов")
+        parser.add_argument("--raw-compression", choices=sorted(SUFFIXES), default="gz", help="Сжатие архива: gz или zst (нужен zstandard)")
+        parser.add_argument("--replay", metavar="DIR", default="", help="Не ходить в сеть: загрузить ответы из архива DIR (--from/--to/--oids — фильтр)")
+        parser.add_argument("--workers", type=int, default=1, help="Параллельных запросов к Fortmonitor (запись в БД всё равно по порядку)")
+        parser.add_argument("--rate", type=float, default=5.0, help="Не больше N запросов в секунду к Fortmonitor (0 — без лимита)")
+        parser.add_argument("--base-url", dest="base_url", default=BASE, help="Адрес Fortmonitor (для теста — локальный стаб)")
+        parser.add_argument("--loader", choices=("orm", "copy"), default="orm", help="orm — upsert из массивов (unnest), copy — COPY через staging-таблицу (tracking.loader)")
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         # 1) OIDs
         oids: List[int] = []
@@ -216,155 +82,140 @@ class Command(BaseCommand):
             if s:
                 oids = [int(x.strip()) for x in s.split(",") if x.strip().isdigit()]
 
+        # повтор из архива: сеть не нужна, oid по умолчанию — все из архива
+        replay = RawArchive(Path(opts["replay"])) if opts.get("replay") else None
+        if not oids and replay is not None:
+            oids = replay.oids()
+
         if not oids:
             raise RuntimeError("Нужно указать --oid или --oids")
 
         # 2) Dates
-        dt_from_str = normalize_dt_str(opts["dt_from"], is_to=False)
-        dt_to_str = normalize_dt_str(opts["dt_to"], is_to=True)
-
-        dt_from = _parse_tm(dt_from_str)
-        dt_to = _parse_tm(dt_to_str)
-        if not dt_from or not dt_to:
+        resume = bool(opts.get("resume")) and replay is None
+        from_raw = (opts.get("dt_from") or "").strip()
+        to_raw = (opts.get("dt_to") or "").strip()
+        if not from_raw and not resume and replay is None:
+            raise RuntimeError("Нужно указать --from или --resume")
+
+        # водяной знак не уходит дальше "сейчас", даже если --to в будущем
+        now = timezone.localtime()
+        dt_from = parse_tm(normalize_dt_str(from_raw, is_to=False)) if from_raw else None
+        dt_to = parse_tm(normalize_dt_str(to_raw, is_to=True)) if to_raw else (None if replay else now)
+        if (from_raw and not dt_from) or (to_raw and not dt_to):
             raise RuntimeError("Не смог распарсить даты. Пример: --from '2025-12-09' --to '2026-02-10'")
 
+        # начало по каждому oid: водяной знак (с перекрытием) или --from;
+        # при --replay — просто фильтр по архиву (None — с начала)
+        overlap = timedelta(hours=float(opts.get("overlap_hours") or 0))
+        starts: Dict[int, Optional[datetime]] = {}
+        for oid in oids:
+            if replay is not None:
+                starts[oid] = dt_from
+                continue
+            cp = checkpoints.get(oid, SOURCE) if resume else None
+            if cp is not None and cp.last_tm is not None:
+                starts[oid] = timezone.localtime(cp.last_tm) - overlap
+            elif dt_from is not None:
+                starts[oid] = dt_from
+            else:
+                self.stdout.write(self.style.WARNING("OID={}: нет водяного знака и не задан --from, пропускаем".format(oid)))
+
         chunk_hours = int(opts.get("chunk_hours") or 6)
+        workers = max(1, int(opts.get("workers") or 1))
+        base = (opts.get("base_url") or BASE).rstrip("/")
+        use_copy = opts.get("loader") == "copy"
 
-        self.stdout.write("Диапазон: {} -> {} (chunk={}h)".format(dt_from_str, dt_to_str, chunk_hours))
-        self.stdout.write("OIDs: {}".format(oids))
+        for oid, start in starts.items():
+            if replay is not None:
+                self.stdout.write("OID={}: архив {} ({} -> {})".format(oid, replay.root, start or "начало", dt_to or "конец"))
+            else:
+                self.stdout.write("OID={}: {} -> {} (chunk={}h)".format(oid, start, dt_to, chunk_hours))
+        oids = [oid for oid in oids if oid in starts]
 
-        # 3) Cookie
-        if opts.get("no_login"):
-            cookie_line = COOKIE_TXT.read_text(encoding="utf-8").strip() if COOKIE_TXT.exists() else ""
-            if not cookie_line:
-                raise RuntimeError("cookie.txt пустой или не найден. Убери --no-login или залогинься.")
-        else:
-            self.stdout.write("Логин в Fortmonitor...")
-            cookie_line = login_get_cookie()
-            self.stdout.write("Cookie сохранены: {}".format(COOKIE_TXT))
+        archive = RawArchive(Path(opts["raw_dir"]), opts.get("raw_compression") or "gz") if opts.get("save_raw") else None
 
         total_new = 0
         total_upd = 0
+        total_coords = 0
+        t0 = time.monotonic()
+
+        if replay is None:
+            # 3) Cookie: одна сессия на весь запуск, протухшие cookie клиент обновит сам
+            client = FortmonitorClient(base, pool_size=workers)
+            if opts.get("no_login"):
+                cookie_line = COOKIE_TXT.read_text(encoding="utf-8").strip() if COOKIE_TXT.exists() else ""
+                if not cookie_line:
+                    raise RuntimeError("cookie.txt пустой или не найден. Убери --no-login или залогинься.")
+                client.set_cookie(cookie_line)
+            else:
+                self.stdout.write("Логин в Fortmonitor...")
+                client.login()
+                self.stdout.write("Cookie сохранены: {}".format(COOKIE_TXT))
+
+            # ответы по всем (oid, чанк) — параллельно, но приходят в порядке задач
+            tasks = {oid: list(split_range(starts[oid], dt_to, chunk_hours)) for oid in oids}
+            fetched = fetch_chunks(
+                [(oid, a, b) for oid in oids for a, b in tasks[oid]],
+                client.track,
+                workers=workers,
+                limiter=RateLimiter(float(opts.get("rate") or 0)),
+            )
+            if workers > 1:
+                self.stdout.write("Параллельно: {} потоков".format(workers))
 
         for oid in oids:
-            # индекс для новых точек
-            cur_max_idx = (
-                TrackPoint.objects.filter(oid=oid)
-                .exclude(idx__isnull=True)
-                .order_by("-idx")
-                .values_list("idx", flat=True)
-                .first()
-            )
-            next_idx = int(cur_max_idx) + 1 if cur_max_idx is not None else 0
+            self.stdout.write(self.style.MIGRATE_HEADING("\nOID={}".format(oid)))
+
+            # самая ранняя изменённая точка: с неё пересчитываем cum_* (tracking.derived);
+            # начинаем с долга прошлого запуска, если тот упал до пересчёта
+            changed_from: Optional[datetime] = pending_since(oid)
 
-            self.stdout.write(self.style.MIGRATE_HEADING("\nOID={} стартовый idx={}".format(oid, next_idx)))
+            if replay is not None:
+                chunks = replay.iter_chunks(oid, starts[oid], dt_to)
+            else:
+                chunks = ((a, b, data) for (_oid, a, b), data in islice(fetched, len(tasks[oid])))
 
-            for a, b in split_range(dt_from, dt_to, chunk_hours):
+            for a, b, data in chunks:
                 a_str = a.strftime("%Y-%m-%d %H:%M:%S")
                 b_str = b.strftime("%Y-%m-%d %H:%M:%S")
+                # повтор из архива водяной знак сети не двигает, только долг пересчёта
+                mark = min(b, now) if replay is None else None
 
-                data = fetch_track(cookie_line, oid, a_str, b_str)
-
-                if opts.get("save_raw"):
-                    out = DOCS / "track_{}_{}_{}.json".format(
-                        oid, a.strftime("%Y%m%d_%H%M%S"), b.strftime("%Y%m%d_%H%M%S")
-                    )
-                    out.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+                if archive is not None:
+                    archive.write(oid, a, b, data)
 
                 coords = data.get("coords") or []
+                total_coords += len(coords)
                 if not coords:
+                    if mark is not None:
+                        checkpoints.advance(oid, SOURCE, mark)
                     self.stdout.write("  {} -> {}: 0 точек".format(a_str, b_str))
                     continue
 
-                existing = set(
-                    TrackPoint.objects.filter(oid=oid, tm__gte=a, tm__lt=b)
-                    .values_list("tm", flat=True)
-                )
-
-                new_objs: List[TrackPoint] = []
-                upd_rows: List[Tuple[datetime, Point, Optional[float], Optional[float]]] = []
-
-                for row in coords:
-                    # ожидаем list: [dir, dst, lat, lon, speed, st, tm, width]
-                    if isinstance(row, list):
-                        dst_ = row[1] if len(row) > 1 else None
-                        lat_ = _to_float(row[2] if len(row) > 2 else None)
-                        lon_ = _to_float(row[3] if len(row) > 3 else None)
-                        speed_ = _to_float(row[4] if len(row) > 4 else None)
-                        tm_raw = row[6] if len(row) > 6 else None
-                    elif isinstance(row, dict):
-                        dst_ = row.get("dst")
-                        lat_ = _to_float(row.get("lat"))
-                        lon_ = _to_float(row.get("lon"))
-                        speed_ = _to_float(row.get("speed"))
-                        tm_raw = row.get("tm")
-                    else:
-                        continue
-
-                    if lat_ is None or lon_ is None:
-                        continue
-
-                    tm_dt = _parse_tm(tm_raw)
-                    if not tm_dt:
-                        continue
-
-                    geom = Point(float(lon_), float(lat_), srid=4326)
-
-                    odo_km = dst_to_odo_km(dst_)
-
-                    if tm_dt in existing:
-                        upd_rows.append((tm_dt, geom, speed_, odo_km))
-                    else:
-                        new_objs.append(
-                            TrackPoint(
-                                oid=oid,
-                                tm=tm_dt,
-                                idx=next_idx,
-                                geom=geom,
-                                speed_kmh=speed_,
-                                odo_km=odo_km,
-                            )
-                        )
-                        next_idx += 1
+                rows = parse_coords(oid, coords)
+                n_new, n_upd, first = store_chunk(oid, rows, mark, use_copy=use_copy)
+                total_new += n_new
+                total_upd += n_upd
+                if first is not None:
+                    changed_from = first if changed_from is None else min(changed_from, first)
 
-                if new_objs:
-                    TrackPoint.objects.bulk_create(new_objs, batch_size=5000)
-                    total_new += len(new_objs)
-
-                # обновляем существующие
-                if upd_rows:
-                    tms = [x[0] for x in upd_rows]
-                    objs = list(TrackPoint.objects.filter(oid=oid, tm__in=tms))
-                    by_tm = {o.tm: o for o in objs}
-
-                    touched = 0
-                    for tm_dt, geom, speed_, odo_km in upd_rows:
-                        o = by_tm.get(tm_dt)
-                        if not o:
-                            continue
-
-                        changed = False
-                        if geom and o.geom != geom:
-                            o.geom = geom
-                            changed = True
-                        if speed_ is not None and o.speed_kmh != speed_:
-                            o.speed_kmh = speed_
-                            changed = True
-                        if odo_km is not None and o.odo_km != odo_km:
-                            o.odo_km = odo_km
-                            changed = True
-
-                        if changed:
-                            touched += 1
-
-                    if touched:
-                        TrackPoint.objects.bulk_update(objs, ["geom", "speed_kmh", "odo_km"], batch_size=5000)
-                        total_upd += touched
+                self.stdout.write(
+                    "  {} -> {}: coords={} new={} upd={}".format(a_str, b_str, len(coords), n_new, n_upd)
+                )
 
+            if changed_from is not None:
+                n_points, n_trips, n_days = refresh(oid, changed_from)
                 self.stdout.write(
-                    "  {} -> {}: coords={} new={} upd={}".format(
-                        a_str, b_str, len(coords), len(new_objs), len(upd_rows)
+                    "  cum_*: пересчитано {} точек с {}, новых рейсов: {}, суток пирамиды: {}".format(
+                        n_points, changed_from, n_trips, n_days
                     )
                 )
 
-        self.stdout.write(self.style.SUCCESS("\nГОТОВО. new={}, updated={}".format(total_new, total_upd)))
+        if replay is None:
+            fetched.close()
+        dt = time.monotonic() - t0
+        self.stdout.write(self.style.SUCCESS(
+            "\nГОТОВО. coords={}, new={}, updated={}, {:.1f} c ({:.0f} точек/с)".format(
+                total_coords, total_new, total_upd, dt, total_coords / dt if dt > 0 else 0.0
+            )
+        ))
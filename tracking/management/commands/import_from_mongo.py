@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-from django.contrib.gis.geos import Point
 from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
 
 from pymongo import MongoClient, ASCENDING
 
-from tracking.models import TrackPoint, RouteCatalog
+from tracking import checkpoints
+from tracking.derived import refresh_derived
+from tracking.loader import insert_points
+from tracking.models import ImportCheckpoint, TrackPoint, RouteCatalog, Vehicle
+from tracking.versions import bump
 
 
 MONGO_URI = "mongodb://127.0.0.1:27017"
@@ -16,6 +24,11 @@ DB_NAME = "volovo"
 COL_POINTS = "track_points"
 COL_ROUTES = "routes_catalog"
 
+PROJECTION = {"_id": 0, "oid": 1, "lat": 1, "lon": 1, "tm": 1, "idx": 1}
+
+# source в ImportCheckpoint: last_key — idx, до которого oid уже загружен
+SOURCE = "mongo"
+
 
 def to_float(v) -> Optional[float]:
     if v is None:
@@ -33,11 +46,209 @@ def parse_tm(s: Optional[str]) -> Optional[datetime]:
     if not s:
         return None
     try:
-        return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+        # в зоне по умолчанию — как Django сохранил бы наивное время
+        return timezone.make_aware(datetime.strptime(s, "%Y-%m-%d %H:%M:%S"))
     except Exception:
         return None
 
 
+def _load_points(
+    docs: Iterable[dict],
+    batch: int,
+    use_copy: bool,
+    on_flush: Optional[Callable[[int, int], None]] = None,
+    keyed: bool = False,
+) -> Tuple[int, int, Dict[int, datetime]]:
+    """
+    Документы track_points -> TrackPoint пачками по batch (tracking.loader.insert_points:
+    orm — unnest массивов, copy — COPY через staging; уже загруженные (oid, tm) пропускаются).
+    Каждая пачка коммитится вместе с ImportCheckpoint: dirty_from по oid — по реально
+    вставленным точкам и, если keyed (документы идут по (oid, idx)), последний прочитанный idx.
+    on_flush(inserted, skipped) — после каждой пачки (прирост).
+    Возвращаем (inserted, skipped, oid -> самая ранняя вставленная tm).
+    """
+    # кортежи (oid, tm, idx, lon, lat, speed_kmh, odo_km)
+    buf: List[Tuple] = []
+    inserted = 0
+    skipped = 0
+    skipped_flushed = 0
+    # oid -> самая ранняя вставленная tm (с неё пересчитываем cum_*)
+    changed_from: Dict[int, datetime] = {}
+
+    def flush():
+        nonlocal inserted, buf, skipped_flushed
+        if not buf:
+            return
+        # oid -> последний прочитанный idx (None — у точек oid нет idx)
+        last_idx: Dict[int, Optional[int]] = {}
+        for oid_, _tm, idx_ in (r[:3] for r in buf):
+            prev = last_idx.get(oid_)
+            last_idx[oid_] = idx_ if prev is None else (prev if idx_ is None else max(prev, idx_))
+
+        with transaction.atomic():
+            # Vehicle, счётчики и dirty_from — только по реально вставленным строкам
+            new = insert_points(buf, use_copy=use_copy)
+            n = len(new)
+            first: Dict[int, datetime] = {}
+            for oid_, tm_, _lon, _lat, _new in new:
+                if oid_ not in first or tm_ < first[oid_]:
+                    first[oid_] = tm_
+            for oid_, idx_ in last_idx.items():
+                if first.get(oid_) is not None or (keyed and idx_ is not None):
+                    checkpoints.advance(oid_, SOURCE, None, first.get(oid_), idx_ if keyed else None)
+            # кэш API не отдаёт старые ответы за сутки с новыми точками, не дожидаясь refresh_derived
+            for oid_, tm_ in first.items():
+                bump(oid_, since=tm_)
+
+        for oid_, tm_ in first.items():
+            cur_min = changed_from.get(oid_)
+            if cur_min is None or tm_ < cur_min:
+                changed_from[oid_] = tm_
+        inserted += n
+        buf = []
+        if on_flush is not None:
+            on_flush(n, skipped - skipped_flushed)
+        skipped_flushed = skipped
+
+    for p in docs:
+        oid = p.get("oid")
+        lat = to_float(p.get("lat"))
+        lon = to_float(p.get("lon"))
+        tm = parse_tm(p.get("tm"))
+        if oid is None or lat is None or lon is None or tm is None:
+            skipped += 1
+            continue
+
+        idx = p.get("idx")
+        try:
+            idx = int(idx) if idx is not None else None
+        except Exception:
+            idx = None
+
+        buf.append((int(oid), tm, idx, float(lon), float(lat), None, None))
+
+        if len(buf) >= batch:
+            flush()
+
+    flush()
+    return inserted, skipped, changed_from
+
+
+def _id_bounds(col, q: Dict[str, Any], total: int, parts: int) -> List[Any]:
+    """
+    Границы _id, делящие документы q на parts примерно равных диапазонов
+    (skip по индексу _id; для q с oid нужен индекс (oid, _id)).
+    """
+    step = -(-total // parts)
+    out = []
+    for i in range(1, parts):
+        doc = next(iter(col.find(q, {"_id": 1}).sort("_id", ASCENDING).skip(i * step).limit(1)), None)
+        if doc is None:
+            break
+        out.append(doc["_id"])
+    return out
+
+
+def plan_shards(col, q: Dict[str, Any], shard_by: str, workers: int, split_points: int) -> List[Dict[str, Any]]:
+    """
+    Шарды импорта: {"oid": oid|None, "lo": _id|None, "hi": _id|None}, диапазон [lo, hi).
+    shard_by="oid" — шард на oid, oid больше split_points точек режется по _id;
+    shard_by="id" — вся выборка режется по _id на 4*workers диапазонов.
+    Самые большие шарды — первыми, чтобы не ждать хвост.
+    """
+    def ranges(oid, qq, total, parts):
+        bounds = [None] + _id_bounds(col, qq, total, parts) + [None]
+        return [{"oid": oid, "lo": lo, "hi": hi, "n": -(-total // parts)} for lo, hi in zip(bounds, bounds[1:])]
+
+    if shard_by == "id":
+        total = col.count_documents(q)
+        return ranges(q.get("oid"), q, total, max(1, 4 * workers)) if total else []
+
+    shards = []
+    counts = col.aggregate([{"$match": q}, {"$group": {"_id": "$oid", "n": {"$sum": 1}}}])
+    for c in counts:
+        oid, n = c["_id"], int(c["n"])
+        if oid is None:
+            continue
+        if split_points and n > split_points:
+            shards.extend(ranges(oid, dict(q, oid=oid), n, -(-n // split_points)))
+        else:
+            shards.append({"oid": oid, "lo": None, "hi": None, "n": n})
+    shards.sort(key=lambda sh: -sh["n"])
+    return shards
+
+
+def resume_query(q: Dict[str, Any], done: Dict[int, int]) -> Dict[str, Any]:
+    """
+    q без уже загруженного: для oid с контрольной точкой — только idx >= last_key
+    (>=, а не >: пачка могла оборваться посреди одинаковых idx; повтор отсекает
+    уникальный (oid, tm)). Документы без idx идут первыми и к этому моменту загружены.
+    """
+    if not done:
+        return q
+    only = q.get("oid")
+    if only is not None:
+        return dict(q, idx={"$gte": done[only]}) if only in done else q
+    return dict(
+        q,
+        **{"$or": [{"oid": {"$nin": sorted(done)}}] + [{"oid": o, "idx": {"$gte": k}} for o, k in sorted(done.items())]},
+    )
+
+
+def shard_query(q: Dict[str, Any], shard: Dict[str, Any]) -> Dict[str, Any]:
+    qq = dict(q)
+    if shard["oid"] is not None:
+        qq["oid"] = shard["oid"]
+    rng = {}
+    if shard["lo"] is not None:
+        rng["$gte"] = shard["lo"]
+    if shard["hi"] is not None:
+        rng["$lt"] = shard["hi"]
+    if rng:
+        qq["_id"] = rng
+    return qq
+
+
+# ---- процесс-воркер: своё подключение к Mongo и к Postgres
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(uri: str, counters) -> None:
+    # соединения Django родитель закрыл до fork, здесь откроются свои
+    _worker["col"] = MongoClient(uri)[DB_NAME][COL_POINTS]
+    _worker["counters"] = counters
+
+
+def _count(inserted: int, skipped: int) -> None:
+    counters = _worker["counters"]
+    with counters.get_lock():
+        counters[0] += inserted
+        counters[1] += skipped
+
+
+def _run_shard(q: Dict[str, Any], shard: Dict[str, Any], batch: int, mongo_batch: int, use_copy: bool):
+    cur = _worker["col"].find(shard_query(q, shard), PROJECTION, batch_size=mongo_batch)
+    # целый oid читаем по idx и ведём контрольную точку; диапазоны _id — без неё
+    keyed = shard["oid"] is not None and shard["lo"] is None and shard["hi"] is None
+    if keyed:
+        cur = cur.sort([("idx", ASCENDING), ("tm", ASCENDING)])
+    try:
+        return _load_points(cur, batch, use_copy, on_flush=_count, keyed=keyed)
+    finally:
+        cur.close()
+        connections.close_all()
+
+
+def _run_refresh(oid: int, since: datetime):
+    try:
+        res = refresh_derived(oid, since=since)
+        checkpoints.mark_clean(oid, SOURCE, since)
+        return oid, res
+    finally:
+        connections.close_all()
+
+
 class Command(BaseCommand):
     help = "Import MongoDB collections routes_catalog + track_points into PostGIS (RouteCatalog, TrackPoint)."
 
@@ -46,22 +257,36 @@ class Command(BaseCommand):
         parser.add_argument("--batch", type=int, default=5000, help="Bulk insert batch size")
         parser.add_argument("--limit", type=int, default=0, help="Limit points (0=all)")
         parser.add_argument("--oid", type=int, default=0, help="Import only this oid (0=all)")
+        parser.add_argument("--loader", choices=("orm", "copy"), default="orm", help="orm = INSERT from arrays (unnest), copy = COPY into a staging table (tracking.loader)")
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes for points (1 = single global cursor)")
+        parser.add_argument("--shard-by", choices=("oid", "id"), default="oid", help="With --workers: shard per oid (big oids split by _id) or by _id ranges")
+        parser.add_argument("--split-points", type=int, default=2_000_000, help="--shard-by oid: split oids with more points into _id ranges (0 = never)")
+        parser.add_argument("--mongo-batch", type=int, default=10000, help="Mongo cursor batch_size")
+        parser.add_argument("--mongo-uri", default=MONGO_URI, help="MongoDB URI")
+        parser.add_argument("--no-resume", action="store_true", help="Ignore (oid, idx) checkpoints and re-read everything (existing points are still skipped)")
 
     def handle(self, *args, **opts):
         drop = bool(opts["drop"])
         batch = int(opts["batch"])
         limit = int(opts["limit"])
         only_oid = int(opts["oid"])
+        use_copy = opts["loader"] == "copy"
+        workers = max(1, int(opts["workers"]))
+        mongo_batch = int(opts["mongo_batch"])
+        if workers > 1 and limit:
+            raise RuntimeError("--limit works only without --workers")
 
-        client = MongoClient(MONGO_URI)
+        client = MongoClient(opts["mongo_uri"])
         db = client[DB_NAME]
         points_col = db[COL_POINTS]
         routes_col = db[COL_ROUTES]
 
         if drop:
-            self.stdout.write(self.style.WARNING("Dropping RouteCatalog + TrackPoint..."))
+            self.stdout.write(self.style.WARNING("Dropping RouteCatalog + TrackPoint + Vehicle..."))
             RouteCatalog.objects.all().delete()
             TrackPoint.objects.all().delete()
+            Vehicle.objects.all().delete()
+            ImportCheckpoint.objects.filter(source=SOURCE).delete()
 
         # ---- Routes
         self.stdout.write("Importing routes_catalog...")
@@ -94,48 +319,91 @@ class Command(BaseCommand):
         q: Dict[str, Any] = {}
         if only_oid:
             q["oid"] = only_oid
+        if not opts["no_resume"]:
+            done = checkpoints.keys(SOURCE)
+            if done:
+                self.stdout.write(f"  resuming: {len(done)} oid checkpoints")
+            q = resume_query(q, done)
 
-        cur = points_col.find(q, {"_id": 0, "oid": 1, "lat": 1, "lon": 1, "tm": 1, "idx": 1}).sort(
-            [("oid", ASCENDING), ("idx", ASCENDING), ("tm", ASCENDING)]
-        )
-        if limit and limit > 0:
-            cur = cur.limit(limit)
-
-        buf: List[TrackPoint] = []
-        inserted = 0
-        skipped = 0
-
-        def flush():
-            nonlocal inserted, buf
-            if not buf:
-                return
-            TrackPoint.objects.bulk_create(buf, batch_size=batch)
-            inserted += len(buf)
-            buf = []
-            self.stdout.write(f"  inserted: {inserted}", ending="\r")
-
-        for p in cur:
-            oid = p.get("oid")
-            lat = to_float(p.get("lat"))
-            lon = to_float(p.get("lon"))
-            tm = parse_tm(p.get("tm"))
-            if oid is None or lat is None or lon is None or tm is None:
-                skipped += 1
+        if workers > 1:
+            inserted, skipped, changed_from = self._import_parallel(points_col, q, opts, batch, mongo_batch, use_copy, workers)
+        else:
+            cur = points_col.find(q, PROJECTION, batch_size=mongo_batch).sort(
+                [("oid", ASCENDING), ("idx", ASCENDING), ("tm", ASCENDING)]
+            )
+            if limit and limit > 0:
+                cur = cur.limit(limit)
+
+            progress = [0]
+
+            def on_flush(n, _skipped):
+                progress[0] += n
+                self.stdout.write(f"  inserted: {progress[0]}", ending="\r")
+
+            inserted, skipped, changed_from = _load_points(cur, batch, use_copy, on_flush, keyed=True)
+            self.stdout.write("")  # newline
+        self.stdout.write(self.style.SUCCESS(f"track_points imported: inserted={inserted}, skipped={skipped}"))
+
+        # пересчёт, не доделанный прошлым (прерванным) запуском
+        for oid, since in checkpoints.dirty(SOURCE).items():
+            if only_oid and oid != only_oid:
                 continue
+            if oid not in changed_from or since < changed_from[oid]:
+                changed_from[oid] = since
 
-            idx = p.get("idx")
-            try:
-                idx = int(idx) if idx is not None else None
-            except Exception:
-                idx = None
+        if workers > 1 and len(changed_from) > 1:
+            self._refresh_parallel(changed_from, workers, opts["mongo_uri"])
+            return
+        for oid, since in sorted(changed_from.items()):
+            # cum_* коммитятся постранично; долг снимаем только после всего пересчёта
+            n_points, n_trips, n_days = refresh_derived(oid, since=since)
+            checkpoints.mark_clean(oid, SOURCE, since)
+            self.stdout.write(f"  derived refreshed: oid={oid} points={n_points} trips={n_trips} days={n_days}")
 
-            geom = Point(float(lon), float(lat), srid=4326)
-            buf.append(TrackPoint(oid=int(oid), tm=tm, idx=idx, geom=geom))
+    def _pool(self, workers: int, uri: str, counters=None) -> ProcessPoolExecutor:
+        # соединения с Postgres не должны переезжать в дочерние процессы через fork
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(uri, counters if counters is not None else ctx.Array("q", 2)),
+        )
 
-            if len(buf) >= batch:
-                flush()
+    def _import_parallel(self, points_col, q, opts, batch, mongo_batch, use_copy, workers):
+        shards = plan_shards(points_col, q, opts["shard_by"], workers, int(opts["split_points"]))
+        self.stdout.write(f"  shards: {len(shards)}, workers: {workers}")
 
-        flush()
+        counters = multiprocessing.get_context("fork").Array("q", 2)  # inserted, skipped
+        changed_from: Dict[int, datetime] = {}
+        inserted = skipped = 0
+        t0 = time.monotonic()
+        with self._pool(workers, opts["mongo_uri"], counters) as ex:
+            pending = {ex.submit(_run_shard, q, sh, batch, mongo_batch, use_copy) for sh in shards}
+            done_n = 0
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for f in done:
+                    n, sk, cf = f.result()
+                    inserted += n
+                    skipped += sk
+                    done_n += 1
+                    for oid_, tm_ in cf.items():
+                        if oid_ not in changed_from or tm_ < changed_from[oid_]:
+                            changed_from[oid_] = tm_
+                dt = time.monotonic() - t0
+                self.stdout.write(
+                    f"  inserted: {counters[0]} skipped: {counters[1]} shards: {done_n}/{len(shards)}"
+                    f" ({counters[0] / dt if dt > 0 else 0:.0f}/s)",
+                    ending="\r",
+                )
         self.stdout.write("")  # newline
-        self.stdout.write(self.style.SUCCESS(f"track_points imported: inserted={inserted}, skipped={skipped}"))
+        return inserted, skipped, changed_from
 
+    def _refresh_parallel(self, changed_from: Dict[int, datetime], workers: int, uri: str) -> None:
+        with self._pool(workers, uri) as ex:
+            futures = [ex.submit(_run_refresh, oid, since) for oid, since in sorted(changed_from.items())]
+            for f in futures:
+                oid, (n_points, n_trips, n_days) = f.result()
+                self.stdout.write(f"  derived refreshed: oid={oid} points={n_points} trips={n_trips} days={n_days}")
@@ -0,0 +1,213 @@
+import random
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from tracking import checkpoints
+from tracking.fortmonitor import BASE, COOKIE_TXT, FortmonitorClient, RateLimiter
+from tracking.ingest import SOURCE, parse_coords, pending_since, refresh, split_range, store_chunk
+from tracking.models import ImportCheckpoint, Vehicle
+
+# как часто перечитывать список oid (новые машины в Vehicle)
+FLEET_REFRESH_S = 60.0
+
+
+class _OidState:
+    """Расписание oid: когда опрашивать и сколько ошибок подряд."""
+
+    def __init__(self, next_due: float):
+        self.next_due = next_due
+        self.failures = 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Непрерывный импорт Fortmonitor по всему парку: каждые --interval минут для каждого oid "
+        "забираем малые окна от его водяного знака (ImportCheckpoint). Остановка — SIGTERM/Ctrl-C."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oids", type=str, default="", help="Список OID через запятую (по умолчанию — все из Vehicle и ImportCheckpoint)")
+        parser.add_argument("--interval", type=float, default=5.0, help="Минут между опросами одного oid")
+        parser.add_argument("--jitter", type=float, default=0.2, help="Разброс расписания, доля интервала (0.2 = ±20%%)")
+        parser.add_argument("--workers", type=int, default=4, help="Одновременно опрашиваемых oid")
+        parser.add_argument("--rate", type=float, default=5.0, help="Не больше N запросов в секунду к Fortmonitor (0 — без лимита)")
+        parser.add_argument("--window-hours", type=int, default=6, help="Окно одного запроса, часов")
+        parser.add_argument("--max-windows", type=int, default=4, help="Окон на oid за один опрос; отставший oid догоняет следующими опросами")
+        parser.add_argument("--overlap-minutes", type=float, default=10.0, help="Захватить N минут до водяного знака (опоздавшие точки)")
+        parser.add_argument("--initial-hours", type=float, default=24.0, help="Глубина первого опроса для oid без водяного знака")
+        parser.add_argument("--max-backoff", type=float, default=60.0, help="Максимальная пауза для oid с ошибками, минут")
+        parser.add_argument("--once", action="store_true", help="Один проход по всем oid и выход (для cron/проверки)")
+        parser.add_argument("--no-login", action="store_true", help="Начать с cookie из cookie.txt (протухшие клиент обновит сам)")
+        parser.add_argument("--base-url", dest="base_url", default=BASE, help="Адрес Fortmonitor")
+        parser.add_argument("--loader", choices=("orm", "copy"), default="orm", help="orm — upsert из массивов (unnest), copy — COPY через staging-таблицу")
+
+    # ---- журнал
+
+    def _log(self, msg: str, style=None) -> None:
+        line = "[{}] {}".format(timezone.localtime().strftime("%Y-%m-%d %H:%M:%S"), msg)
+        self.stdout.write(style(line) if style else line)
+
+    # ---- кого и с какого момента опрашивать
+
+    def _fleet(self, opts) -> List[int]:
+        s = (opts.get("oids") or "").strip()
+        if s:
+            return [int(x.strip()) for x in s.split(",") if x.strip().isdigit()]
+        oids = set(Vehicle.objects.values_list("oid", flat=True))
+        oids.update(ImportCheckpoint.objects.filter(source=SOURCE).values_list("oid", flat=True))
+        return sorted(oids)
+
+    def _windows(self, oid: int, now: datetime, opts) -> Tuple[List[Tuple[datetime, datetime]], bool]:
+        """Окна опроса oid и признак "отстал" (окон больше --max-windows)."""
+        overlap = timedelta(minutes=float(opts["overlap_minutes"]))
+        cp = checkpoints.get(oid, SOURCE)
+        if cp is not None and cp.last_tm is not None:
+            start = cp.last_tm - overlap
+        else:
+            last_tm = Vehicle.objects.filter(oid=oid).values_list("last_tm", flat=True).first()
+            start = last_tm - overlap if last_tm else now - timedelta(hours=float(opts["initial_hours"]))
+        windows = list(split_range(timezone.localtime(start), now, int(opts["window_hours"])))
+        limit = max(1, int(opts["max_windows"]))
+        return windows[:limit], len(windows) > limit
+
+    # ---- сеть (в потоках пула) и запись (в основном потоке)
+
+    @staticmethod
+    def _fetch(client: FortmonitorClient, limiter: RateLimiter, oid: int, windows, stop: threading.Event):
+        out = []
+        for a, b in windows:
+            if stop.is_set() and out:
+                break  # при остановке отдаём то, что успели
+            limiter.wait()
+            out.append((a, b, client.track(oid, a.strftime("%Y-%m-%d %H:%M:%S"), b.strftime("%Y-%m-%d %H:%M:%S"))))
+        return out
+
+    def _store(self, oid: int, chunks, use_copy: bool) -> Tuple[int, int]:
+        changed_from: Optional[datetime] = pending_since(oid)
+        total_new = total_upd = 0
+        for _a, b, data in chunks:
+            rows = parse_coords(oid, data.get("coords") or [])
+            n_new, n_upd, first = store_chunk(oid, rows, b, use_copy=use_copy)
+            total_new += n_new
+            total_upd += n_upd
+            if first is not None:
+                changed_from = first if changed_from is None else min(changed_from, first)
+        if changed_from is not None:
+            refresh(oid, changed_from)
+        return total_new, total_upd
+
+    def _schedule(self, st: _OidState, delay_s: float) -> None:
+        if self.once:
+            st.next_due = float("inf")  # один проход: больше не опрашиваем
+            return
+        st.next_due = time.monotonic() + delay_s * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def handle(self, *args, **opts):
+        interval_s = max(1.0, float(opts["interval"]) * 60.0)
+        self.jitter = min(max(float(opts["jitter"]), 0.0), 0.9)
+        self.once = bool(opts.get("once"))
+        max_backoff_s = max(interval_s, float(opts["max_backoff"]) * 60.0)
+        workers = max(1, int(opts["workers"]))
+        use_copy = opts.get("loader") == "copy"
+        slots = 2 * workers  # опросов в работе (в пуле + в очереди)
+
+        # остановка: дописываем то, что уже в работе, и выходим; второй сигнал — как обычно
+        stop = threading.Event()
+
+        def on_signal(signum, _frame):
+            self._log("сигнал {}: завершаем текущие опросы...".format(signum))
+            stop.set()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        signal.signal(signal.SIGINT, on_signal)
+        signal.signal(signal.SIGTERM, on_signal)
+
+        client = FortmonitorClient((opts.get("base_url") or BASE).rstrip("/"), pool_size=workers)
+        if opts.get("no_login") and COOKIE_TXT.exists():
+            client.set_cookie(COOKIE_TXT.read_text(encoding="utf-8").strip())
+        else:
+            client.login()
+        limiter = RateLimiter(float(opts.get("rate") or 0))
+
+        state: Dict[int, _OidState] = {}
+        running: Dict[Future, Tuple[int, bool]] = {}  # future -> (oid, отстаёт)
+        fleet_at = float("-inf")
+        self._log("старт: интервал {:.1f} мин, потоков {}".format(interval_s / 60.0, workers))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as ex:
+            while True:
+                now_m = time.monotonic()
+                busy = {oid for oid, _ in running.values()}
+
+                if not stop.is_set():
+                    if now_m - fleet_at >= FLEET_REFRESH_S:
+                        close_old_connections()  # долгоживущий процесс: переподключение после обрыва БД
+                        fleet_at = now_m
+                        for oid in self._fleet(opts):
+                            if oid not in state:
+                                # первый опрос размазываем по интервалу, чтобы не бить всем парком разом
+                                state[oid] = _OidState(now_m if self.once else now_m + random.uniform(0.0, interval_s))
+
+                    due = sorted(
+                        (st.next_due, oid) for oid, st in state.items() if st.next_due <= now_m and oid not in busy
+                    )
+                    now = timezone.localtime()
+                    for _, oid in due[: max(0, slots - len(running))]:
+                        try:
+                            windows, behind = self._windows(oid, now, opts)
+                        except Exception as e:
+                            self._log("oid={}: ошибка планирования: {}".format(oid, e), self.style.ERROR)
+                            self._schedule(state[oid], interval_s)
+                            continue
+                        if not windows:
+                            self._schedule(state[oid], interval_s)
+                            continue
+                        running[ex.submit(self._fetch, client, limiter, oid, windows, stop)] = (oid, behind)
+                        busy.add(oid)
+
+                if not running and (stop.is_set() or (self.once and all(st.next_due == float("inf") for st in state.values()))):
+                    break
+
+                # ждём готовых опросов или ближайшего срока (не дольше секунды — сигналы)
+                idle_due = min((st.next_due for oid, st in state.items() if oid not in busy), default=now_m + 1.0)
+                if stop.is_set() or len(running) >= slots:
+                    timeout = 1.0
+                else:
+                    timeout = min(1.0, max(0.05, idle_due - time.monotonic()))
+                if not running:
+                    stop.wait(timeout)
+                    continue
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for f in done:
+                    oid, behind = running.pop(f)
+                    st = state[oid]
+                    try:
+                        n_new, n_upd = self._store(oid, f.result(), use_copy)
+                    except Exception as e:
+                        st.failures += 1
+                        delay = min(max_backoff_s, interval_s * 2 ** (st.failures - 1))
+                        self._schedule(st, delay)
+                        retry = "пропускаем" if self.once else "следующий опрос через {:.0f} мин".format(delay / 60.0)
+                        self._log("oid={}: ошибка #{} ({}), {}".format(oid, st.failures, e, retry), self.style.ERROR)
+                        continue
+                    if st.failures:
+                        self._log("oid={}: восстановлен после {} ошибок".format(oid, st.failures))
+                    st.failures = 0
+                    if behind and not self.once:
+                        st.next_due = time.monotonic()  # отстаёт — догоняем следующим опросом
+                    else:
+                        self._schedule(st, interval_s)
+                    if n_new or n_upd:
+                        self._log("oid={}: new={} upd={}".format(oid, n_new, n_upd))
+
+        self._log("остановлен", self.style.SUCCESS)
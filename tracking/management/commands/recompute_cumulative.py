@@ -0,0 +1,47 @@
+from typing import List
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracking.derived import refresh_derived
+from tracking.ingest import normalize_dt_str, parse_tm
+from tracking.models import TrackPoint
+
+
+class Command(BaseCommand):
+    help = "Пересчёт накопительных колонок TrackPoint (cum_km, cum_kept, cum_n, cum_sb_entries, gps_jump) рейсов (Trip) и пирамиды (TrackPyramid) после бэкфилла."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oid", type=int, default=0, help="Один OID")
+        parser.add_argument("--oids", type=str, default="", help="Список OID через запятую: 182,716,717")
+        parser.add_argument("--all", action="store_true", help="Все OID из tracking_trackpoint")
+        parser.add_argument("--from", dest="dt_from", default="", help="Пересчитать начиная с: YYYY-MM-DD или YYYY-MM-DD HH:MM:SS (по умолчанию весь трек)")
+
+    def handle(self, *args, **opts):
+        oids: List[int] = []
+        if opts.get("all"):
+            oids = list(TrackPoint.objects.values_list("oid", flat=True).distinct().order_by("oid"))
+        elif int(opts.get("oid") or 0):
+            oids = [int(opts["oid"])]
+        else:
+            s = (opts.get("oids") or "").strip()
+            if s:
+                oids = [int(x.strip()) for x in s.split(",") if x.strip().isdigit()]
+
+        if not oids:
+            raise RuntimeError("Нужно указать --oid, --oids или --all")
+
+        since = None
+        if opts.get("dt_from"):
+            since = parse_tm(normalize_dt_str(opts["dt_from"], is_to=False))
+            if not since:
+                raise RuntimeError("Не смог распарсить --from. Пример: --from '2025-12-09'")
+
+        for oid in oids:
+            with transaction.atomic():
+                n_points, n_trips, n_days = refresh_derived(oid, since=since)
+            self.stdout.write(
+                "OID={}: пересчитано {} точек, рейсов: {}, суток пирамиды: {}".format(oid, n_points, n_trips, n_days)
+            )
+
+        self.stdout.write(self.style.SUCCESS("ГОТОВО"))
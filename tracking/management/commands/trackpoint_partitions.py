@@ -0,0 +1,59 @@
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tracking import partitions
+
+
+class Command(BaseCommand):
+    help = "Помесячные секции tracking_trackpoint: создать будущие, выгрузить и отсоединить старые (после миграции 0008)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=3, help="Сколько месяцев вперёд держать готовыми (по умолчанию 3)")
+        parser.add_argument("--detach-before", dest="detach_before", default="", help="Отсоединить секции целиком раньше месяца: YYYY-MM")
+        parser.add_argument("--archive-dir", dest="archive_dir", default="", help="Перед отсоединением выгрузить секцию в <dir>/<секция>.csv.gz")
+        parser.add_argument("--drop", action="store_true", help="Удалить отсоединённые секции (только вместе с --archive-dir)")
+        parser.add_argument("--list", action="store_true", help="Только показать секции")
+
+    def handle(self, *args, **opts):
+        if not partitions.is_partitioned():
+            raise RuntimeError("tracking_trackpoint не секционирована: сначала migrate tracking 0008")
+
+        if opts.get("list"):
+            for name, month in partitions.list_partitions():
+                self.stdout.write(f"  {name}" + ("" if month else "  (DEFAULT)"))
+            return
+
+        cur = partitions.month_start(timezone.now().date())  # now() в UTC, границы секций тоже
+        created = 0
+        for i in range(max(0, int(opts.get("ahead") or 0)) + 1):
+            if partitions.create_month(partitions.add_months(cur, i)):
+                created += 1
+        self.stdout.write(f"Новых секций: {created}")
+
+        s = (opts.get("detach_before") or "").strip()
+        if not s:
+            return
+        try:
+            y, m = s.split("-")[:2]
+            before = date(int(y), int(m), 1)
+        except Exception:
+            raise RuntimeError("Не смог распарсить --detach-before. Пример: --detach-before 2025-01")
+
+        archive_dir = Path(opts["archive_dir"]) if opts.get("archive_dir") else None
+        drop = bool(opts.get("drop"))
+        if drop and archive_dir is None:
+            raise RuntimeError("--drop только вместе с --archive-dir")
+
+        for name, month in partitions.list_partitions():
+            if month is None or month >= before:
+                continue
+            if archive_dir is not None:
+                path = partitions.archive(name, archive_dir)
+                self.stdout.write(f"  {name} -> {path}")
+            partitions.detach(name, drop=drop)
+            self.stdout.write(f"  {name}: " + ("удалена" if drop else "отсоединена"))
+
+        self.stdout.write(self.style.SUCCESS("ГОТОВО"))
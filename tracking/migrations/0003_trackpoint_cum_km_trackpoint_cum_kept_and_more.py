@@ -0,0 +1,33 @@
+# Generated by Django 4.2.28 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_trackpoint_odo_km_trackpoint_speed_kmh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackpoint',
+            name='cum_km',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackpoint',
+            name='cum_kept',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackpoint',
+            name='cum_sb_entries',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackpoint',
+            name='gps_jump',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
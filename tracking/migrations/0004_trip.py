@@ -0,0 +1,31 @@
+# Generated by Django 4.2.28 on 2026-10-17 10:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0003_trackpoint_cum_km_trackpoint_cum_kept_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oid', models.IntegerField()),
+                ('tm_start', models.DateTimeField()),
+                ('tm_end', models.DateTimeField()),
+                ('idx_start', models.IntegerField(blank=True, null=True)),
+                ('idx_end', models.IntegerField(blank=True, null=True)),
+                ('distance_km', models.FloatField()),
+                ('points_count', models.IntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.LineStringField(blank=True, null=True, srid=4326)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['oid', 'tm_start'], name='tracking_tr_oid_32027d_idx')],
+            },
+        ),
+    ]
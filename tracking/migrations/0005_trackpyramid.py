@@ -0,0 +1,32 @@
+# Generated by Django 4.2.28 on 2026-10-17 11:20
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_trip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackPyramid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oid', models.IntegerField()),
+                ('day', models.DateField()),
+                ('level', models.SmallIntegerField()),
+                ('tolerance_m', models.FloatField()),
+                ('points_count', models.IntegerField()),
+                ('geom', django.contrib.gis.db.models.fields.LineStringField(blank=True, null=True, srid=4326)),
+                ('vertex_t', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, size=None)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='trackpyramid',
+            constraint=models.UniqueConstraint(fields=('oid', 'level', 'day'), name='tracking_pyramid_oid_level_day_uniq'),
+        ),
+    ]
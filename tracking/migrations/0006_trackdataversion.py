@@ -0,0 +1,26 @@
+# Generated by Django 4.2.28 on 2026-10-17 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_trackpyramid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackDataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oid', models.IntegerField()),
+                ('day', models.DateField()),
+                ('version', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='trackdataversion',
+            constraint=models.UniqueConstraint(fields=('oid', 'day'), name='tracking_dataversion_oid_day_uniq'),
+        ),
+    ]
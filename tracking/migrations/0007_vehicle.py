@@ -0,0 +1,44 @@
+# Generated by Django 4.2.28 on 2026-10-17 12:40
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+# реестр заполняется по уже загруженным точкам одним проходом
+POPULATE_SQL = """
+INSERT INTO tracking_vehicle (oid, first_tm, last_tm, points_count, last_geom, updated_at)
+SELECT a.oid, a.first_tm, a.last_tm, a.points_count, l.geom, now()
+FROM (
+    SELECT oid, min(tm) AS first_tm, max(tm) AS last_tm, count(*) AS points_count
+    FROM tracking_trackpoint
+    GROUP BY oid
+) a
+JOIN (
+    SELECT DISTINCT ON (oid) oid, geom
+    FROM tracking_trackpoint
+    ORDER BY oid, tm DESC
+) l ON l.oid = a.oid
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_trackdataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vehicle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oid', models.IntegerField(unique=True)),
+                ('first_tm', models.DateTimeField(blank=True, null=True)),
+                ('last_tm', models.DateTimeField(blank=True, null=True)),
+                ('points_count', models.BigIntegerField(default=0)),
+                ('last_geom', django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, srid=4326)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(POPULATE_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
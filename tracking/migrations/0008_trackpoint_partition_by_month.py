@@ -0,0 +1,129 @@
+# Generated by Django 4.2.28 on 2026-10-17 13:10
+#
+# tracking_trackpoint -> секционированная по месяцам tm таблица (PostgreSQL 11+).
+# Модель не меняется: Django видит PK id, в БД PK (id, tm) — секционированная
+# таблица требует ключ секционирования в уникальных индексах. Индексы
+# пересоздаются с прежними именами, поэтому следующие миграции их находят.
+# Данные копируются целиком, таблица на время миграции заблокирована.
+# Новые месяцы / архив старых — manage.py trackpoint_partitions.
+
+from django.db import migrations
+
+
+FORWARD_SQL = """
+DO $$
+DECLARE
+    r record;
+    idx_defs text[] := ARRAY[]::text[];
+    d text;
+    m date;
+    m_last date;
+    next_id bigint;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'tracking_trackpoint'::regclass) THEN
+        RETURN;
+    END IF;
+
+    FOR r IN
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'tracking_trackpoint'
+          AND indexname <> 'tracking_trackpoint_pkey'
+    LOOP
+        idx_defs := idx_defs || r.indexdef;
+        EXECUTE format('DROP INDEX %I', r.indexname);
+    END LOOP;
+
+    ALTER TABLE tracking_trackpoint RENAME TO tracking_trackpoint_old;
+    ALTER INDEX tracking_trackpoint_pkey RENAME TO tracking_trackpoint_old_pkey;
+    ALTER TABLE tracking_trackpoint_old ALTER COLUMN id DROP IDENTITY IF EXISTS;
+    ALTER TABLE tracking_trackpoint_old ALTER COLUMN id DROP DEFAULT;
+    DROP SEQUENCE IF EXISTS tracking_trackpoint_id_seq;
+
+    CREATE TABLE tracking_trackpoint (LIKE tracking_trackpoint_old INCLUDING DEFAULTS)
+        PARTITION BY RANGE (tm);
+    CREATE TABLE tracking_trackpoint_default PARTITION OF tracking_trackpoint DEFAULT;
+
+    SELECT date_trunc('month', min(tm) AT TIME ZONE 'UTC')::date,
+           date_trunc('month', max(tm) AT TIME ZONE 'UTC')::date
+      INTO m, m_last
+      FROM tracking_trackpoint_old;
+    m := COALESCE(m, date_trunc('month', now() AT TIME ZONE 'UTC')::date);
+    m_last := (GREATEST(COALESCE(m_last, m), date_trunc('month', now() AT TIME ZONE 'UTC')::date)
+               + interval '3 months')::date;
+    WHILE m <= m_last LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF tracking_trackpoint FOR VALUES FROM (%L) TO (%L)',
+            'tracking_trackpoint_p' || to_char(m, 'YYYYMM'),
+            m::timestamp AT TIME ZONE 'UTC',
+            (m + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        m := (m + interval '1 month')::date;
+    END LOOP;
+
+    INSERT INTO tracking_trackpoint SELECT * FROM tracking_trackpoint_old;
+
+    ALTER TABLE tracking_trackpoint ADD CONSTRAINT tracking_trackpoint_pkey PRIMARY KEY (id, tm);
+    FOREACH d IN ARRAY idx_defs LOOP
+        EXECUTE d;
+    END LOOP;
+
+    SELECT COALESCE(max(id), 0) + 1 INTO next_id FROM tracking_trackpoint_old;
+    DROP TABLE tracking_trackpoint_old;
+
+    EXECUTE format('CREATE SEQUENCE tracking_trackpoint_id_seq START %s OWNED BY tracking_trackpoint.id', next_id);
+    ALTER TABLE tracking_trackpoint ALTER COLUMN id SET DEFAULT nextval('tracking_trackpoint_id_seq');
+END $$;
+"""
+
+# обратно в обычную таблицу (отсоединённые секции-архивы не трогаем)
+REVERSE_SQL = """
+DO $$
+DECLARE
+    r record;
+    idx_defs text[] := ARRAY[]::text[];
+    d text;
+    next_id bigint;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'tracking_trackpoint'::regclass) THEN
+        RETURN;
+    END IF;
+
+    FOR r IN
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'tracking_trackpoint'
+          AND indexname <> 'tracking_trackpoint_pkey'
+    LOOP
+        idx_defs := idx_defs || replace(r.indexdef, ' ON ONLY ', ' ON ');
+    END LOOP;
+
+    SELECT COALESCE(max(id), 0) + 1 INTO next_id FROM tracking_trackpoint;
+
+    ALTER TABLE tracking_trackpoint RENAME TO tracking_trackpoint_old;
+    ALTER INDEX tracking_trackpoint_pkey RENAME TO tracking_trackpoint_old_pkey;
+    ALTER TABLE tracking_trackpoint_old ALTER COLUMN id DROP DEFAULT;
+
+    CREATE TABLE tracking_trackpoint (LIKE tracking_trackpoint_old INCLUDING DEFAULTS);
+    INSERT INTO tracking_trackpoint SELECT * FROM tracking_trackpoint_old;
+    DROP TABLE tracking_trackpoint_old;
+
+    ALTER TABLE tracking_trackpoint ADD CONSTRAINT tracking_trackpoint_pkey PRIMARY KEY (id);
+    FOREACH d IN ARRAY idx_defs LOOP
+        EXECUTE d;
+    END LOOP;
+    EXECUTE format(
+        'ALTER TABLE tracking_trackpoint ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH %s)',
+        next_id
+    );
+END $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_vehicle'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD_SQL, reverse_sql=REVERSE_SQL),
+    ]
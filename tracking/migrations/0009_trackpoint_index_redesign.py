@@ -0,0 +1,73 @@
+# Generated by Django 4.2.28 on 2026-10-17 13:45
+#
+# Индексы TrackPoint под реальные запросы: oid + диапазон tm.
+# SQL написан явно (а не через AlterField/AddIndex), чтобы индексы
+# пересоздавались и на секционированной таблице (миграция 0008);
+# имена старых индексов — те, что сгенерировал Django.
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+FORWARD_SQL = """
+CREATE INDEX IF NOT EXISTS tracking_tp_oid_tm_cover
+    ON tracking_trackpoint (oid, tm) INCLUDE (geom, speed_kmh, odo_km);
+CREATE INDEX IF NOT EXISTS tracking_tp_tm_brin ON tracking_trackpoint USING brin (tm);
+DROP INDEX IF EXISTS tracking_tr_oid_b41971_idx;
+DROP INDEX IF EXISTS tracking_trackpoint_oid_c4a7e984;
+DROP INDEX IF EXISTS tracking_trackpoint_tm_3dd15736;
+DROP INDEX IF EXISTS tracking_trackpoint_idx_1d464f4d;
+"""
+
+REVERSE_SQL = """
+CREATE INDEX IF NOT EXISTS tracking_trackpoint_idx_1d464f4d ON tracking_trackpoint (idx);
+CREATE INDEX IF NOT EXISTS tracking_trackpoint_tm_3dd15736 ON tracking_trackpoint (tm);
+CREATE INDEX IF NOT EXISTS tracking_trackpoint_oid_c4a7e984 ON tracking_trackpoint (oid);
+CREATE INDEX IF NOT EXISTS tracking_tr_oid_b41971_idx ON tracking_trackpoint (oid, tm);
+DROP INDEX IF EXISTS tracking_tp_tm_brin;
+DROP INDEX IF EXISTS tracking_tp_oid_tm_cover;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_trackpoint_partition_by_month'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(FORWARD_SQL, reverse_sql=REVERSE_SQL),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='trackpoint',
+                    name='oid',
+                    field=models.IntegerField(),
+                ),
+                migrations.AlterField(
+                    model_name='trackpoint',
+                    name='tm',
+                    field=models.DateTimeField(),
+                ),
+                migrations.AlterField(
+                    model_name='trackpoint',
+                    name='idx',
+                    field=models.IntegerField(blank=True, null=True),
+                ),
+                migrations.RemoveIndex(
+                    model_name='trackpoint',
+                    name='tracking_tr_oid_b41971_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='trackpoint',
+                    index=models.Index(fields=['oid', 'tm'], include=('geom', 'speed_kmh', 'odo_km'), name='tracking_tp_oid_tm_cover'),
+                ),
+                migrations.AddIndex(
+                    model_name='trackpoint',
+                    index=django.contrib.postgres.indexes.BrinIndex(fields=['tm'], name='tracking_tp_tm_brin'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.28 on 2026-10-17 14:30
+#
+# Уникальность (oid, tm): сначала убираем накопившиеся дубли (оставляем
+# строку с меньшим id, т.е. первую загруженную), затем уникальный индекс
+# заменяет покрывающий tracking_tp_oid_tm_cover с теми же INCLUDE-колонками.
+# У oid с дублями cum_* и gps_jump с первого удалённого tm сбрасываются в NULL
+# (range_summary по ним не отвечает, refresh_derived пересчитает oid с начала),
+# версии данных этих суток поднимаются — кэш API не отдаст старые ответы.
+# Пересчитать сразу: manage.py recompute_cumulative --oids ... (список в NOTICE).
+
+from django.db import migrations, models
+
+
+DEDUP_SQL = """
+DO $$
+DECLARE
+    affected text;
+BEGIN
+    CREATE TEMP TABLE tracking_dedup_oids ON COMMIT DROP AS
+    SELECT t.oid, min(t.tm) AS tm_from
+    FROM tracking_trackpoint t
+    JOIN tracking_trackpoint d ON d.oid = t.oid AND d.tm = t.tm AND d.id < t.id
+    GROUP BY t.oid;
+
+    DELETE FROM tracking_trackpoint t
+    USING tracking_trackpoint d
+    WHERE d.oid = t.oid AND d.tm = t.tm AND d.id < t.id;
+
+    UPDATE tracking_vehicle v
+    SET points_count = (SELECT count(*) FROM tracking_trackpoint p WHERE p.oid = v.oid)
+    WHERE v.oid IN (SELECT oid FROM tracking_dedup_oids);
+
+    UPDATE tracking_trackpoint p
+    SET cum_km = NULL, cum_kept = NULL, cum_sb_entries = NULL, gps_jump = NULL
+    FROM tracking_dedup_oids o
+    WHERE p.oid = o.oid AND p.tm >= o.tm_from;
+
+    -- сутки по UTC с запасом в день с каждой стороны: местные сутки (local_day) внутри
+    INSERT INTO tracking_trackdataversion (oid, day, version)
+    SELECT o.oid, d::date, 1
+    FROM tracking_dedup_oids o
+    CROSS JOIN LATERAL generate_series(
+        ((o.tm_from AT TIME ZONE 'UTC')::date - 1)::timestamp,
+        (((SELECT max(p.tm) FROM tracking_trackpoint p WHERE p.oid = o.oid) AT TIME ZONE 'UTC')::date + 1)::timestamp,
+        interval '1 day'
+    ) AS d
+    ON CONFLICT (oid, day) DO UPDATE SET version = tracking_trackdataversion.version + 1;
+
+    SELECT string_agg(oid::text, ',' ORDER BY oid) INTO affected FROM tracking_dedup_oids;
+    IF affected IS NOT NULL THEN
+        RAISE NOTICE 'tracking: дубли (oid, tm) удалены, cum_* сброшены, пересчитать: --oids %', affected;
+    END IF;
+END $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_trackpoint_index_redesign'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEDUP_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='trackpoint',
+            constraint=models.UniqueConstraint(fields=('oid', 'tm'), include=('geom', 'speed_kmh', 'odo_km'), name='tracking_tp_oid_tm_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='trackpoint',
+            name='tracking_tp_oid_tm_cover',
+        ),
+    ]
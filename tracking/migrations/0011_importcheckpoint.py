@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-17 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0010_trackpoint_oid_tm_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oid', models.IntegerField()),
+                ('source', models.CharField(max_length=32)),
+                ('last_tm', models.DateTimeField(blank=True, null=True)),
+                ('dirty_from', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importcheckpoint',
+            constraint=models.UniqueConstraint(fields=('oid', 'source'), name='tracking_checkpoint_oid_source_uniq'),
+        ),
+    ]
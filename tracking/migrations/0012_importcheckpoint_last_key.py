@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0011_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='last_key',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.28 on 2026-10-17 17:10
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+# пескобаза, раньше заданная SAND_BASE_* в settings.py
+SAND_BASE_LAT = 52.036282
+SAND_BASE_LON = 37.887833
+SAND_BASE_RADIUS_M = 20.0
+
+
+def seed_sand_base(apps, schema_editor):
+    from django.contrib.gis.geos import Point
+
+    Geofence = apps.get_model("tracking", "Geofence")
+    if not Geofence.objects.exists():
+        Geofence.objects.create(
+            name="Пескобаза",
+            kind="sand_base",
+            center=Point(SAND_BASE_LON, SAND_BASE_LAT, srid=4326),
+            radius_m=SAND_BASE_RADIUS_M,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0012_importcheckpoint_last_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geofence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('sand_base', 'Пескобаза (погрузка)'), ('unloading', 'Выгрузка'), ('other', 'Прочее')], default='sand_base', max_length=32)),
+                ('area', django.contrib.gis.db.models.fields.PolygonField(blank=True, geography=True, null=True, srid=4326)),
+                ('center', django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, srid=4326)),
+                ('radius_m', models.FloatField(blank=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='geofence',
+            index=models.Index(fields=['kind', 'active'], name='tracking_geofence_kind_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='geofence',
+            constraint=models.CheckConstraint(check=models.Q(('area__isnull', False), models.Q(('center__isnull', False), ('radius_m__gt', 0)), _connector='OR'), name='tracking_geofence_shape'),
+        ),
+        migrations.RunPython(seed_sand_base, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0013_geofence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routecatalog',
+            name='geom',
+            field=django.contrib.gis.db.models.fields.LineStringField(blank=True, null=True, srid=4326),
+        ),
+    ]
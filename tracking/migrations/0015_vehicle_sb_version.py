@@ -0,0 +1,32 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def stamp_current(apps, schema_editor):
+    # cum_sb_entries/рейсы посчитаны по пескобазе из settings — той же, что засеяна в 0013;
+    # строка — как tracking.geofences.version(Geofence.SAND_BASE)
+    Geofence = apps.get_model("tracking", "Geofence")
+    Vehicle = apps.get_model("tracking", "Vehicle")
+    agg = Geofence.objects.filter(kind="sand_base").aggregate(
+        n=Count("id"), active=Count("id", filter=Q(active=True)), changed=Max("updated_at")
+    )
+    changed = agg["changed"].isoformat() if agg["changed"] else ""
+    Vehicle.objects.update(sb_version="{}:{}:{}".format(agg["n"], agg["active"], changed))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0014_routecatalog_geom'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='sb_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(stamp_current, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-17 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0015_vehicle_sb_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routecatalog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
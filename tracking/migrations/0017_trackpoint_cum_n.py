@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-17 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0016_routecatalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackpoint',
+            name='cum_n',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
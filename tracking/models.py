@@ -1,27 +1,189 @@
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
-class RouteCatalog(models.Model):
+class RouteCatalog(gis_models.Model):
     name = models.CharField(max_length=255, unique=True)
     road_width_m = models.FloatField(null=True, blank=True)
     road_length_km = models.FloatField(null=True, blank=True)
     pss_tonnage_t = models.FloatField(null=True, blank=True)
 
+    # ось маршрута для сопоставления рейсов (tracking.routes); GiST-индекс — GeoDjango
+    geom = gis_models.LineStringField(srid=4326, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
     def __str__(self):
         return self.name
 
 
 class TrackPoint(gis_models.Model):
-    oid = models.IntegerField(db_index=True)
-    tm = models.DateTimeField(db_index=True)
-    idx = models.IntegerField(db_index=True, null=True, blank=True)
+    # в БД таблица секционирована по месяцам tm, PK (id, tm) — см. миграцию 0008
+    oid = models.IntegerField()
+    tm = models.DateTimeField()
+    idx = models.IntegerField(null=True, blank=True)
 
     # lon/lat
     geom = gis_models.PointField(srid=4326, geography=True)
 
+    speed_kmh = models.FloatField(null=True, blank=True)
+    odo_km = models.FloatField(null=True, blank=True)
+
+    # накопительные значения по oid (см. tracking.derived), NULL = ещё не посчитано
+    cum_km = models.FloatField(null=True, blank=True)
+    cum_kept = models.IntegerField(null=True, blank=True)
+    # все строки oid до этой включительно (original_count периода — разность, как cum_kept)
+    cum_n = models.IntegerField(null=True, blank=True)
+    cum_sb_entries = models.IntegerField(null=True, blank=True)
+    gps_jump = models.BooleanField(null=True, blank=True)
+
     class Meta:
         indexes = [
+            # max(idx) при нумерации новых точек (tracking.loader)
             models.Index(fields=["oid", "idx"]),
-            models.Index(fields=["oid", "tm"]),
+            # скан по времени по всему парку
+            BrinIndex(fields=["tm"], name="tracking_tp_tm_brin"),
+        ]
+        constraints = [
+            # ON CONFLICT (oid, tm) в импорте; INCLUDE — index-only scan для точек трека
+            models.UniqueConstraint(
+                fields=["oid", "tm"],
+                include=["geom", "speed_kmh", "odo_km"],
+                name="tracking_tp_oid_tm_uniq",
+            ),
+        ]
+
+
+
+class Trip(gis_models.Model):
+    """Рейс: от заезда на пескобазу до следующего заезда (см. tracking.trips)."""
+    oid = models.IntegerField()
+    tm_start = models.DateTimeField()
+    tm_end = models.DateTimeField()
+    idx_start = models.IntegerField(null=True, blank=True)
+    idx_end = models.IntegerField(null=True, blank=True)
+
+    distance_km = models.FloatField()
+    points_count = models.IntegerField()
+
+    # упрощённая линия для карты
+    geom = gis_models.LineStringField(srid=4326, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["oid", "tm_start"]),
+        ]
+
+    def __str__(self):
+        return f"Trip oid={self.oid} {self.tm_start:%Y-%m-%d %H:%M}"
+
+
+class TrackPyramid(gis_models.Model):
+    """Упрощённый трек oid за сутки на нескольких уровнях детализации (см. tracking.pyramid)."""
+    oid = models.IntegerField()
+    day = models.DateField()
+    level = models.SmallIntegerField()
+    tolerance_m = models.FloatField()
+    points_count = models.IntegerField()
+
+    geom = gis_models.LineStringField(srid=4326, null=True, blank=True)
+    # epoch-секунды вершин geom (по порядку)
+    vertex_t = ArrayField(models.BigIntegerField(), default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["oid", "level", "day"], name="tracking_pyramid_oid_level_day_uniq"),
+        ]
+
+    def __str__(self):
+        return f"TrackPyramid oid={self.oid} {self.day} L{self.level}"
+
+
+class TrackDataVersion(models.Model):
+    """Версия данных oid за сутки: растёт при каждом пересчёте (см. tracking.versions)."""
+    oid = models.IntegerField()
+    day = models.DateField()
+    version = models.BigIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["oid", "day"], name="tracking_dataversion_oid_day_uniq"),
         ]
 
+    def __str__(self):
+        return f"TrackDataVersion oid={self.oid} {self.day} v{self.version}"
+
+
+class Vehicle(gis_models.Model):
+    """Реестр oid: границы трека, число точек и последняя позиция (см. tracking.vehicles)."""
+    oid = models.IntegerField(unique=True)
+    first_tm = models.DateTimeField(null=True, blank=True)
+    last_tm = models.DateTimeField(null=True, blank=True)
+    points_count = models.BigIntegerField(default=0)
+    last_geom = gis_models.PointField(srid=4326, geography=True, null=True, blank=True)
+    # версия пескобаз (tracking.geofences.version), с которой посчитаны cum_sb_entries и рейсы
+    sb_version = models.CharField(max_length=64, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Vehicle oid={self.oid}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Водяной знак импорта oid из источника (см. tracking.checkpoints).
+    last_tm / last_key — до какого момента / ключа трек уже загружен; dirty_from — самая ранняя
+    загруженная точка, для которой ещё не пересчитаны cum_*/рейсы.
+    """
+    oid = models.IntegerField()
+    source = models.CharField(max_length=32)
+    last_tm = models.DateTimeField(null=True, blank=True)
+    # ключ источника, до которого всё загружено (Mongo — idx)
+    last_key = models.BigIntegerField(null=True, blank=True)
+    dirty_from = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["oid", "source"], name="tracking_checkpoint_oid_source_uniq"),
+        ]
+
+    def __str__(self):
+        return f"ImportCheckpoint oid={self.oid} {self.source} {self.last_tm}"
+
+
+class Geofence(gis_models.Model):
+    """
+    Геозона: полигон area или круг center + radius_m (см. tracking.geofences).
+    Пространственные (GiST) индексы на area/center GeoDjango создаёт сам.
+    """
+    SAND_BASE = "sand_base"
+    UNLOADING = "unloading"
+    OTHER = "other"
+    KINDS = [
+        (SAND_BASE, "Пескобаза (погрузка)"),
+        (UNLOADING, "Выгрузка"),
+        (OTHER, "Прочее"),
+    ]
+
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=32, choices=KINDS, default=SAND_BASE)
+    area = gis_models.PolygonField(srid=4326, geography=True, null=True, blank=True)
+    center = gis_models.PointField(srid=4326, geography=True, null=True, blank=True)
+    radius_m = models.FloatField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "active"], name="tracking_geofence_kind_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(area__isnull=False) | models.Q(center__isnull=False, radius_m__gt=0),
+                name="tracking_geofence_shape",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Geofence {self.kind} {self.name}"
@@ -0,0 +1,105 @@
+"""
+Помесячные секции tracking_trackpoint (см. миграцию 0008).
+
+Секция месяца — tracking_trackpoint_pYYYYMM, границы по UTC; строки вне
+секций попадают в tracking_trackpoint_default. Старые секции можно выгрузить
+в csv.gz и отсоединить: запросы их больше не видят, накопительные колонки
+и рейсы более поздних точек от этого не меняются.
+"""
+from __future__ import annotations
+
+import gzip
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+
+TABLE = "tracking_trackpoint"
+DEFAULT = "tracking_trackpoint_default"
+_NAME_RE = re.compile(r"^tracking_trackpoint_p(\d{4})(\d{2})$")
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cur.fetchone() is not None
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def _bounds(month: date) -> Tuple[datetime, datetime]:
+    a = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    b = add_months(month, 1)
+    return a, datetime(b.year, b.month, 1, tzinfo=dt_timezone.utc)
+
+
+def list_partitions() -> List[Tuple[str, Optional[date]]]:
+    """Присоединённые секции: (имя, месяц или None для DEFAULT), по порядку."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass ORDER BY c.relname
+            """,
+            [TABLE],
+        )
+        names = [r[0] for r in cur.fetchall()]
+
+    out = []
+    for name in names:
+        m = _NAME_RE.match(name)
+        out.append((name, date(int(m.group(1)), int(m.group(2)), 1) if m else None))
+    return out
+
+
+def create_month(month: date) -> bool:
+    """
+    Создаём секцию месяца, если её нет. Строки этого месяца, успевшие попасть
+    в DEFAULT, переносятся в новую секцию (иначе CREATE ... PARTITION OF упадёт).
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if any(n == name for n, _ in list_partitions()):
+        return False
+
+    a, b = _bounds(month)
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(f"SELECT 1 FROM {DEFAULT} WHERE tm >= %s AND tm < %s LIMIT 1", [a, b])
+        stray = cur.fetchone() is not None
+        if stray:
+            cur.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT}")
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)", [a, b])
+        if stray:
+            cur.execute(f"INSERT INTO {TABLE} SELECT * FROM {DEFAULT} WHERE tm >= %s AND tm < %s", [a, b])
+            cur.execute(f"DELETE FROM {DEFAULT} WHERE tm >= %s AND tm < %s", [a, b])
+            cur.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT} DEFAULT")
+    return True
+
+
+def archive(name: str, out_dir: Path) -> Path:
+    """Выгружаем секцию в <out_dir>/<name>.csv.gz (COPY ... TO STDOUT, права суперпользователя не нужны)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{name}.csv.gz"
+    with connection.cursor() as cur, gzip.open(path, "wb") as f:
+        cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+    return path
+
+
+def detach(name: str, drop: bool = False) -> None:
+    with connection.cursor() as cur:
+        cur.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        if drop:
+            cur.execute(f"DROP TABLE {name}")
@@ -0,0 +1,134 @@
+"""
+Пирамида упрощённых треков: для каждого (oid, сутки) храним линию на
+нескольких уровнях детализации (TrackPyramid). Обзорные масштабы карты
+берут вершины отсюда и не читают сырые TrackPoint.
+
+Уровни строятся от детального к грубому: каждый следующий упрощает
+вершины предыдущего, поэтому погрешности уровней складываются
+(грубый уровень ~ сумма допусков).
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+from django.contrib.gis.geos import LineString
+from django.db import transaction
+from django.utils import timezone
+
+from tracking import engine
+from tracking.db import with_lat_lon
+from tracking.engine import Track
+from tracking.models import TrackPoint, TrackPyramid
+
+# (максимальный zoom Leaflet, допуск упрощения, м) — от грубого уровня к детальному;
+# при zoom больше последнего уровня точки берутся из рейсов / сырого трека
+PYRAMID_LEVELS = (
+    (10, 200.0),
+    (12, 50.0),
+    (14, 10.0),
+)
+
+
+def level_for_zoom(zoom: int) -> Optional[int]:
+    for level, (max_zoom, _tol) in enumerate(PYRAMID_LEVELS):
+        if zoom <= max_zoom:
+            return level
+    return None
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    return start, start + timedelta(days=1)
+
+
+def local_day(dt: datetime) -> date:
+    return timezone.localtime(dt).date()
+
+
+def build_day(oid: int, day: date) -> int:
+    """Перестраиваем все уровни за сутки. Возвращаем число точек суток."""
+    start, end = day_bounds(day)
+    qs = (
+        TrackPoint.objects
+        .filter(oid=oid, tm__gte=start, tm__lt=end)
+        .exclude(gps_jump=True)  # NULL (ещё не посчитано) оставляем
+    )
+    track = Track.from_rows(with_lat_lon(qs).order_by("tm", "id").values_list("tm", "lat", "lon"))
+
+    objs = []
+    idx = np.arange(len(track))
+    for level in reversed(range(len(PYRAMID_LEVELS))):
+        tol_m = PYRAMID_LEVELS[level][1]
+        idx = idx[engine.simplify(track.lat[idx], track.lon[idx], tol_m / 1000.0)]
+        geom = None
+        if idx.shape[0] >= 2:
+            geom = LineString(list(zip(track.lon[idx].tolist(), track.lat[idx].tolist())), srid=4326)
+        objs.append(
+            TrackPyramid(
+                oid=oid,
+                day=day,
+                level=level,
+                tolerance_m=tol_m,
+                points_count=int(idx.shape[0]) if geom else 0,
+                geom=geom,
+                vertex_t=np.round(track.t[idx]).astype(np.int64).tolist() if geom else [],
+            )
+        )
+
+    with transaction.atomic():
+        TrackPyramid.objects.filter(oid=oid, day=day).delete()
+        TrackPyramid.objects.bulk_create(objs)
+    return len(track)
+
+
+def build_range(oid: int, since: Optional[datetime] = None, until: Optional[datetime] = None) -> int:
+    """Перестраиваем сутки от since до until (по умолчанию — весь трек oid). Возвращаем число суток."""
+    qs = TrackPoint.objects.filter(oid=oid)
+    if since is None:
+        since = qs.order_by("tm").values_list("tm", flat=True).first()
+    if until is None:
+        until = qs.order_by("-tm").values_list("tm", flat=True).first()
+    if since is None or until is None or until < since:
+        return 0
+
+    day = local_day(since)
+    last = local_day(until)
+    n = 0
+    while day <= last:
+        build_day(oid, day)
+        day += timedelta(days=1)
+        n += 1
+    return n
+
+
+def load_level(oid: int, level: int, dt_start: datetime, dt_end: datetime):
+    """
+    Вершины уровня за сутки, покрывающие [dt_start, dt_end]: (t, lat, lon).
+    None — какие-то сутки ещё не построены.
+    """
+    d0 = local_day(dt_start)
+    d1 = local_day(dt_end)
+    rows = list(
+        TrackPyramid.objects
+        .filter(oid=oid, level=level, day__gte=d0, day__lte=d1)
+        .order_by("day")
+    )
+    if len(rows) != (d1 - d0).days + 1:
+        return None
+
+    ts, lats, lons = [], [], []
+    for r in rows:
+        if r.geom is None:
+            continue
+        coords = np.asarray(r.geom.coords, dtype=np.float64).reshape(-1, 2)
+        ts.append(np.asarray(r.vertex_t, dtype=np.float64))
+        lats.append(coords[:, 1])
+        lons.append(coords[:, 0])
+
+    if not ts:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, empty
+    return np.concatenate(ts), np.concatenate(lats), np.concatenate(lons)
@@ -0,0 +1,117 @@
+"""
+Архив сырых ответов Fortmonitor: NDJSON-сегменты <root>/<oid>/<YYYY-MM-DD>.ndjson.gz
+(или .ndjson.zst, если установлен zstandard). Строка — один чанк:
+{"oid", "from", "to", "fetched_at", "data"}; сутки — по локальному началу чанка.
+
+Каждый чанк дописывается отдельным gzip-member / zstd-frame, поэтому файл
+можно дописывать между запусками, а читается он целиком как один поток.
+import_fortmonitor --replay DIR прогоняет архив через обычный разбор и upsert.
+"""
+from __future__ import annotations
+
+import gzip
+import io
+import json
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.utils import timezone
+
+try:
+    import zstandard
+except ImportError:  # zst — по желанию, gzip есть всегда
+    zstandard = None
+
+SUFFIXES = {"gz": ".ndjson.gz", "zst": ".ndjson.zst"}
+
+
+def _day(dt: datetime) -> date:
+    return timezone.localtime(dt).date() if timezone.is_aware(dt) else dt.date()
+
+
+class RawArchive:
+    def __init__(self, root: Path, compression: str = "gz"):
+        if compression not in SUFFIXES:
+            raise ValueError("compression: gz или zst")
+        if compression == "zst" and zstandard is None:
+            raise RuntimeError("Для zst нужен пакет zstandard (pip install zstandard)")
+        self.root = Path(root)
+        self.compression = compression
+
+    def path(self, oid: int, day: date) -> Path:
+        return self.root / str(oid) / (day.isoformat() + SUFFIXES[self.compression])
+
+    def write(self, oid: int, a: datetime, b: datetime, data: Dict[str, Any]) -> Path:
+        line = json.dumps(
+            {
+                "oid": oid,
+                "from": a.isoformat(),
+                "to": b.isoformat(),
+                "fetched_at": timezone.now().isoformat(),
+                "data": data,
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8") + b"\n"
+
+        path = self.path(oid, _day(a))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self.compression == "zst":
+            with open(path, "ab") as f:
+                f.write(zstandard.ZstdCompressor(level=10).compress(line))
+        else:
+            with gzip.open(path, "ab", compresslevel=6) as f:
+                f.write(line)
+        return path
+
+    def oids(self) -> List[int]:
+        if not self.root.is_dir():
+            return []
+        return sorted(int(p.name) for p in self.root.iterdir() if p.is_dir() and p.name.isdigit())
+
+    def _segments(self, oid: int) -> List[Tuple[date, Path]]:
+        out = []
+        d = self.root / str(oid)
+        if not d.is_dir():
+            return out
+        for p in d.iterdir():
+            for suffix in SUFFIXES.values():
+                if p.name.endswith(suffix):
+                    try:
+                        out.append((date.fromisoformat(p.name[: -len(suffix)]), p))
+                    except ValueError:
+                        pass
+        out.sort()
+        return out
+
+    @staticmethod
+    def _lines(path: Path) -> Iterator[bytes]:
+        if path.name.endswith(SUFFIXES["zst"]):
+            if zstandard is None:
+                raise RuntimeError("{}: нужен пакет zstandard".format(path))
+            with open(path, "rb") as raw:
+                reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                yield from io.BufferedReader(reader)
+        else:
+            with gzip.open(path, "rb") as f:
+                yield from f
+
+    def iter_chunks(
+        self, oid: int, dt_from: Optional[datetime] = None, dt_to: Optional[datetime] = None
+    ) -> Iterator[Tuple[datetime, datetime, Dict[str, Any]]]:
+        """Чанки oid по порядку: (from, to, data); только пересекающие [dt_from, dt_to)."""
+        for day, path in self._segments(oid):
+            if dt_from is not None and day < _day(dt_from):
+                continue
+            if dt_to is not None and day > _day(dt_to):
+                break
+            for line in self._lines(path):
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                a = datetime.fromisoformat(rec["from"])
+                b = datetime.fromisoformat(rec["to"])
+                if (dt_from is not None and b <= dt_from) or (dt_to is not None and a >= dt_to):
+                    continue
+                yield a, b, rec.get("data") or {}
@@ -0,0 +1,96 @@
+"""
+Сопоставление рейсов с маршрутами справочника (RouteCatalog.geom).
+
+Все рейсы ответа — одним запросом. Кандидаты на рейс отбираются GiST-индексом
+по bbox: маршрут, до которого расстояние Хаусдорфа не больше max_m, целиком
+лежит в bbox рейса, расширенном на max_m (оператор @). Дальше — ST_DWithin
+концов рейса до линии маршрута и расстояние Хаусдорфа в локальной
+равнопромежуточной проекции (долгота * cos широты рейса), в метрах.
+Лучший маршрут — с минимальным расстоянием; дальше max_m — совпадения нет.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Q
+
+from tracking import engine
+from tracking.models import RouteCatalog
+
+# метров в градусе широты (сфера engine.EARTH_RADIUS_KM)
+M_PER_DEG = math.radians(1.0) * engine.EARTH_RADIUS_KM * 1000.0
+
+_MATCH_SQL = """
+WITH lines AS (
+    SELECT u.n, ST_GeomFromText(u.wkt, 4326) AS g
+    FROM unnest(%(wkts)s::text[]) WITH ORDINALITY AS u(wkt, n)
+),
+t AS (
+    SELECT n, g, cos(radians(ST_Y(ST_Centroid(g)))) AS k FROM lines
+)
+SELECT t.n, m.id, m.name, m.hausdorff_m
+FROM t
+CROSS JOIN LATERAL (
+    SELECT r.id, r.name,
+           ST_HausdorffDistance(ST_Scale(r.geom, t.k, 1), ST_Scale(t.g, t.k, 1)) * %(m_per_deg)s AS hausdorff_m
+    FROM tracking_routecatalog r
+    WHERE r.geom @ ST_Expand(t.g, %(max_deg)s / t.k, %(max_deg)s)
+      AND ST_DWithin(r.geom::geography, ST_StartPoint(t.g)::geography, %(max_m)s, false)
+      AND ST_DWithin(r.geom::geography, ST_EndPoint(t.g)::geography, %(max_m)s, false)
+    ORDER BY hausdorff_m
+    LIMIT 1
+) AS m
+WHERE m.hausdorff_m <= %(max_m)s
+"""
+
+
+def version() -> Optional[str]:
+    """
+    Версия геометрий маршрутов для ключа кэша API; None — ни у одного маршрута
+    нет geom, сопоставлять не с чем.
+    """
+    agg = RouteCatalog.objects.aggregate(
+        n=Count("id", filter=Q(geom__isnull=False)), changed=Max("updated_at"), total=Count("id")
+    )
+    if not agg["n"]:
+        return None
+    return "{}:{}:{}".format(agg["n"], agg["total"], agg["changed"].isoformat() if agg["changed"] else "")
+
+
+def match_max_m() -> float:
+    return float(getattr(settings, "ROUTE_MATCH_MAX_M", 300.0))
+
+
+def _wkt(lat: np.ndarray, lon: np.ndarray) -> str:
+    return "LINESTRING({})".format(",".join("%.7f %.7f" % p for p in zip(lon.tolist(), lat.tolist())))
+
+
+def match_lines(
+    lines: Sequence[Tuple[np.ndarray, np.ndarray]], max_m: Optional[float] = None
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    lines — (lat[], lon[]) рейсов. Для каждого — {"id", "name", "hausdorff_m"}
+    лучшего маршрута или None (нет маршрута ближе max_m, меньше двух точек).
+    """
+    out: List[Optional[Dict[str, Any]]] = [None] * len(lines)
+    todo = [n for n, (lat, _lon) in enumerate(lines) if lat.shape[0] >= 2]
+    if not todo:
+        return out
+
+    max_m = match_max_m() if max_m is None else float(max_m)
+    params = {
+        "wkts": [_wkt(*lines[n]) for n in todo],
+        "m_per_deg": M_PER_DEG,
+        # +1%: cos широты на краях рейса чуть меньше, чем в центре
+        "max_deg": 1.01 * max_m / M_PER_DEG,
+        "max_m": max_m,
+    }
+    with connection.cursor() as cur:
+        cur.execute(_MATCH_SQL, params)
+        for n, route_id, name, hausdorff_m in cur.fetchall():
+            out[todo[n - 1]] = {"id": route_id, "name": name, "hausdorff_m": round(float(hausdorff_m), 1)}
+    return out
@@ -0,0 +1,161 @@
+"""
+Потоковое деление трека на рейсы (trips_for_map?stream=1, source=live).
+
+Трек приходит чанками (tracking.db.iter_track), состояние фильтра скачков
+и "внутри пескобазы" переносится между чанками, рейс отдаётся сразу после
+следующего заезда. В памяти — только точки текущего рейса; если буфер
+вырос больше лимита, он заранее упрощается (тем же _thin, что и ответ),
+поэтому погрешность может достигать двух допусков упрощения.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from tracking import engine
+from tracking.engine import Track
+from tracking.geofences import FenceIndex
+
+# точек в буфере рейса до предварительного упрощения
+BUFFER_POINTS = 200_000
+
+
+class _TripBuffer:
+    def __init__(self, thin: Callable, limit: int):
+        self.thin = thin
+        self.limit = limit
+        self.lat = np.empty(0, dtype=np.float64)
+        self.lon = np.empty(0, dtype=np.float64)
+        self.km = 0.0
+        self.tm_start = None
+        self.tm_end = None
+
+    def __len__(self) -> int:
+        return int(self.lat.shape[0])
+
+    def add(self, track: Track, steps: np.ndarray) -> None:
+        if not len(track):
+            return
+        if self.tm_start is None:
+            self.tm_start = track.tm[0]
+        self.tm_end = track.tm[-1]
+        self.km += float(steps.sum())
+        self.lat = np.concatenate((self.lat, track.lat))
+        self.lon = np.concatenate((self.lon, track.lon))
+        if self.lat.shape[0] > self.limit:
+            sel = self.thin(self.lat, self.lon, self.limit // 2)
+            self.lat, self.lon = self.lat[sel], self.lon[sel]
+
+
+def iter_live_trips(
+    chunks: Iterable[Track],
+    max_jump_km: float,
+    max_speed_kmh: float,
+    min_trip_km: float,
+    max_points_per_trip: int,
+    thin: Callable,
+    sb: Optional[FenceIndex],
+    stats: Dict[str, int],
+    buffer_points: int = BUFFER_POINTS,
+) -> Iterator[dict]:
+    """
+    Рейсы как в trips_for_map (source=live), по одному.
+    thin(lat, lon, max_points) -> индексы точек.
+    stats заполняется по ходу: original_count, filtered_count,
+    gps_jumps_removed, sand_base_entries — окончательные после исчерпания.
+    """
+    stats.update(original_count=0, filtered_count=0, gps_jumps_removed=0, sand_base_entries=0)
+
+    anchor = None  # (lat, lon) последней принятой точки
+    inside_prev = False
+    entries = 0
+    trip_no = 0
+
+    new_buf = lambda: _TripBuffer(thin, buffer_points)  # noqa: E731
+    cur = new_buf()
+    # весь трек — пока заездов < 2 (тогда рейс один на весь трек)
+    whole: Optional[_TripBuffer] = new_buf()
+
+    def emit(buf: _TripBuffer):
+        nonlocal trip_no
+        if len(buf) < 2 or buf.km < min_trip_km:
+            return None
+        sel = thin(buf.lat, buf.lon, max_points_per_trip)
+        trip_no += 1
+        return {
+            "trip_no": trip_no,
+            "tm_start": buf.tm_start.isoformat(),
+            "tm_end": buf.tm_end.isoformat(),
+            "distance_km": round(buf.km, 6),
+            "_lat": buf.lat[sel],
+            "_lon": buf.lon[sel],
+        }
+
+    for track in chunks:
+        stats["original_count"] += len(track)
+        track = track.take(engine.speed_mask(track.speed, max_speed_kmh))
+        if not len(track):
+            continue
+
+        if anchor is not None:
+            keep = engine.filter_jumps(
+                np.concatenate(([anchor[0]], track.lat)),
+                np.concatenate(([anchor[1]], track.lon)),
+                max_jump_km,
+            )[1:]
+        else:
+            keep = engine.filter_jumps(track.lat, track.lon, max_jump_km)
+        stats["gps_jumps_removed"] += int(keep.shape[0] - np.count_nonzero(keep))
+
+        track = track.take(keep)
+        n = len(track)
+        if not n:
+            continue
+        stats["filtered_count"] += n
+
+        # steps[i] — отрезок от предыдущей принятой точки до i
+        if anchor is not None:
+            steps = engine.step_km(
+                np.concatenate(([anchor[0]], track.lat)), np.concatenate(([anchor[1]], track.lon))
+            )
+        else:
+            steps = np.concatenate(([0.0], engine.step_km(track.lat, track.lon)))
+        anchor = (float(track.lat[-1]), float(track.lon[-1]))
+
+        if sb:
+            inside = sb.inside(track.lat, track.lon)
+            prev = np.concatenate(([inside_prev], inside[:-1]))
+            chunk_entries = np.flatnonzero(inside & ~prev)
+            inside_prev = bool(inside[-1])
+        else:
+            chunk_entries = np.empty(0, dtype=np.int64)
+
+        pos = 0
+        for e in chunk_entries.tolist():
+            piece = slice(pos, e + 1)
+            cur.add(track.take(piece), steps[piece])
+            if whole is not None:
+                whole.add(track.take(piece), steps[piece])
+            if entries >= 1:
+                trip = emit(cur)
+                if trip is not None:
+                    yield trip
+            entries += 1
+            if entries >= 2:
+                whole = None
+            # заезд — конец рейса и начало следующего
+            cur = new_buf()
+            cur.add(track.take(slice(e, e + 1)), steps[:0])
+            pos = e + 1
+
+        rest = slice(pos, n)
+        cur.add(track.take(rest), steps[rest])
+        if whole is not None:
+            whole.add(track.take(rest), steps[rest])
+
+    stats["sand_base_entries"] = entries
+    if whole is not None:
+        trip = emit(whole)
+        if trip is not None:
+            yield trip
@@ -1,3 +1,767 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import math
+import pkgutil
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.contrib.gis.geos import Point
+from django.core.management import get_commands, load_command_class
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+import tracking
+from tracking import checkpoints, encoding, engine, geofences, ingest
+from tracking.derived import range_summary, refresh_cumulative, refresh_derived
+from tracking.geofences import Fence, FenceIndex
+from tracking.loader import insert_points, upsert_points
+from tracking.management.commands import import_from_mongo
+from tracking.models import Geofence, TrackDataVersion, TrackPoint, Vehicle
+
+
+class ImportSmokeTests(SimpleTestCase):
+    """Модули и команды импортируются: ловит перенос функций между модулями."""
+
+    def test_tracking_modules_import(self):
+        for mod in pkgutil.walk_packages(tracking.__path__, "tracking."):
+            if ".migrations." in mod.name:
+                continue
+            with self.subTest(module=mod.name):
+                importlib.import_module(mod.name)
+
+    def test_tracking_commands_load(self):
+        commands = sorted(name for name, app in get_commands().items() if app == "tracking")
+        self.assertIn("import_fortmonitor", commands)
+        for name in commands:
+            with self.subTest(command=name):
+                load_command_class("tracking", name)
+
+
+# ----------------- эталоны: прежние циклы по точкам (volovo_api.views до NumPy) -----------------
+
+def _haversine_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return engine.EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(a))
+
+
+def _loop_filter(lat, lon, max_jump_km, t=None, max_gap_s=None):
+    """Прежний фильтр скачков: сравнение с последней принятой точкой; + правило паузы."""
+    keep = []
+    prev = None
+    for i in range(len(lat)):
+        if prev is not None:
+            d = _haversine_km(lat[prev], lon[prev], lat[i], lon[i])
+            gap = t is not None and max_gap_s is not None and t[i] - t[prev] > max_gap_s
+            if d > max_jump_km and not gap:
+                keep.append(False)
+                continue
+        keep.append(True)
+        prev = i
+    return np.array(keep)
+
+
+def _loop_segments(inside):
+    """Прежнее деление на рейсы: заезд — переход вне -> внутрь, рейс — между заездами."""
+    entry_idx = []
+    inside_prev = False
+    for i, v in enumerate(inside):
+        if v and not inside_prev:
+            entry_idx.append(i)
+        inside_prev = v
+    if len(entry_idx) >= 2:
+        return [(a, b) for a, b in zip(entry_idx[:-1], entry_idx[1:]) if b > a]
+    return [(0, len(inside) - 1)] if len(inside) >= 2 else []
+
+
+def _loop_downsample(n, max_points):
+    points = list(range(n))
+    if max_points <= 0 or n <= max_points:
+        return points
+    sampled = points[::max(1, n // max_points)]
+    if sampled and sampled[-1] != points[-1]:
+        sampled.append(points[-1])
+    return sampled
+
+
+def _recursive_dp(x, y, s, e, tol, out):
+    """Классический рекурсивный Дуглас–Пекер (расстояние до отрезка), без бюджета точек."""
+    best, best_d = -1, 0.0
+    ax, ay, dx, dy = x[s], y[s], x[e] - x[s], y[e] - y[s]
+    l2 = dx * dx + dy * dy
+    for i in range(s + 1, e):
+        u = min(1.0, max(0.0, ((x[i] - ax) * dx + (y[i] - ay) * dy) / l2)) if l2 > 0 else 0.0
+        d = math.hypot(x[i] - (ax + u * dx), y[i] - (ay + u * dy))
+        if d > best_d:
+            best, best_d = i, d
+    if best >= 0 and best_d > tol:
+        out.add(best)
+        _recursive_dp(x, y, s, best, tol, out)
+        _recursive_dp(x, y, best, e, tol, out)
+
+
+def _decode_polyline(s: str, precision: int = encoding.POLYLINE_PRECISION):
+    out, i, lat, lon = [], 0, 0, 0
+    while i < len(s):
+        d = []
+        for _ in range(2):
+            shift = v = 0
+            while True:
+                b = ord(s[i]) - 63
+                i += 1
+                v |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            d.append(~(v >> 1) if v & 1 else v >> 1)
+        lat += d[0]
+        lon += d[1]
+        out.append((lat / 10 ** precision, lon / 10 ** precision))
+    return out
+
+
+def _random_track(n, seed=0, jumps=0.02, gaps=0.005):
+    """
+    Блуждание у пескобазы (52.0, 37.9) со скачками GPS и паузами;
+    за паузу машина уезжает на ~3 км (и за следующую — возвращается).
+    """
+    rng = np.random.default_rng(seed)
+    pause = rng.random(n) < gaps
+    phase = np.cumsum(rng.uniform(0.0, 0.02, n))
+    lat = 52.0 + 0.02 * np.sin(phase) + rng.normal(0.0, 2e-5, n) + 0.03 * (np.cumsum(pause) % 2)
+    lon = 37.9 + 0.01 * (1.0 - np.cos(phase)) + rng.normal(0.0, 2e-5, n)
+    bad = rng.random(n) < jumps
+    lat[bad] += rng.choice((-1.0, 1.0), bad.sum()) * rng.uniform(0.05, 0.5, bad.sum())
+    dt = rng.uniform(5.0, 30.0, n)
+    dt[pause] += 3600.0
+    return lat, lon, 1.7e9 + np.cumsum(dt)
+
+
+def _sand_base(radius_km=0.3):
+    return FenceIndex([Fence(1, "Пескобаза", "sand_base", lat=52.0, lon=37.9, radius_km=radius_km)], kind="sand_base")
+
+
+class EngineTests(SimpleTestCase):
+    """Векторные ядра дают то же, что прежние циклы по точкам."""
+
+    def test_filter_jumps_matches_loop(self):
+        for seed in range(3):
+            lat, lon, t = _random_track(3000, seed=seed)
+            for max_jump_km in (0.05, 1.0):
+                with self.subTest(seed=seed, max_jump_km=max_jump_km):
+                    np.testing.assert_array_equal(
+                        engine.filter_jumps(lat, lon, max_jump_km), _loop_filter(lat, lon, max_jump_km)
+                    )
+                    np.testing.assert_array_equal(
+                        engine.filter_jumps(lat, lon, max_jump_km, t=t, max_gap_s=600.0),
+                        _loop_filter(lat, lon, max_jump_km, t=t, max_gap_s=600.0),
+                    )
+
+    def test_filter_jumps_long_outage(self):
+        # после скачка все точки "далеко" — окно поиска якоря растёт до конца трека
+        lat = np.concatenate((np.full(10, 52.0), np.full(2000, 53.0)))
+        lon = np.full(lat.shape[0], 37.9)
+        np.testing.assert_array_equal(engine.filter_jumps(lat, lon, 1.0), _loop_filter(lat, lon, 1.0))
+
+    def test_split_between_entries_matches_loop(self):
+        lat, lon, _t = _random_track(5000, seed=1, jumps=0.0)
+        for radius_km in (0.0, 0.3, 2.0, 50.0):
+            inside = engine.inside_circle(lat, lon, 52.0, 37.9, radius_km)
+            with self.subTest(radius_km=radius_km):
+                self.assertEqual(
+                    engine.split_between_entries(lat.shape[0], engine.entry_indexes(inside)),
+                    _loop_segments(inside.tolist()),
+                )
+        self.assertEqual(engine.split_between_entries(1, np.empty(0, dtype=np.int64)), [])
+
+    def test_stride_indices_matches_downsample(self):
+        for n, max_points in ((0, 10), (5, 10), (1000, 10), (1001, 7), (999, 1000), (10, 0)):
+            with self.subTest(n=n, max_points=max_points):
+                self.assertEqual(engine.stride_indices(n, max_points).tolist(), _loop_downsample(n, max_points))
+
+
+class DerivedChunkTests(SimpleTestCase):
+    """_apply_chunk, продолженный через границы чанков, совпадает с одним проходом по треку."""
+
+    def _run(self, lat, lon, t, chunk, max_gap_s):
+        from tracking.derived import _State, _apply_chunk
+
+        st = _State()
+        parts = []
+        for a in range(0, lat.shape[0], chunk):
+            sl = slice(a, a + chunk)
+            parts.append(_apply_chunk(st, lat[sl], lon[sl], t[sl], _sand_base(), 1.0, max_gap_s))
+        return [np.concatenate(cols) for cols in zip(*parts)], st
+
+    def test_chunks_match_single_pass(self):
+        lat, lon, t = _random_track(4000, seed=4)
+        for max_gap_s in (None, 600.0):
+            (full_km, full_kept, full_n, full_sb, full_jump), full_st = self._run(lat, lon, t, lat.shape[0], max_gap_s)
+            self.assertEqual(int(full_n[-1]), lat.shape[0])
+            self.assertGreater(int(full_sb[-1]), 2)
+            self.assertTrue(full_jump.any())
+            for chunk in (1, 7, 333, 1000):
+                with self.subTest(max_gap_s=max_gap_s, chunk=chunk):
+                    (km, kept, n, sb, jump), st = self._run(lat, lon, t, chunk, max_gap_s)
+                    np.testing.assert_allclose(km, full_km, rtol=0, atol=1e-9)
+                    np.testing.assert_array_equal(kept, full_kept)
+                    np.testing.assert_array_equal(n, full_n)
+                    np.testing.assert_array_equal(sb, full_sb)
+                    np.testing.assert_array_equal(jump, full_jump)
+                    self.assertEqual(st.anchor, full_st.anchor)
+
+    def test_single_pass_matches_loop(self):
+        lat, lon, t = _random_track(2000, seed=5)
+        (km, kept, n, _sb, jump), _st = self._run(lat, lon, t, lat.shape[0], 600.0)
+        keep = _loop_filter(lat, lon, 1.0, t=t, max_gap_s=600.0)
+        np.testing.assert_array_equal(jump, ~keep)
+        np.testing.assert_array_equal(kept, np.cumsum(keep))
+        np.testing.assert_array_equal(n, np.arange(1, lat.shape[0] + 1))
+        k = np.flatnonzero(keep)
+        steps = engine.step_km(lat[k], lon[k])
+        self.assertAlmostEqual(float(km[-1]), float(steps[steps <= 1.0].sum()), places=6)
+
+
+class SimplifyTests(SimpleTestCase):
+    """engine.simplify: тот же отбор, что рекурсивный Дуглас–Пекер; бюджет точек соблюдается."""
+
+    def test_simplify_matches_recursive_dp(self):
+        lat, lon, _t = _random_track(800, seed=2, jumps=0.0)
+        k = np.cos(np.radians(np.nanmean(lat))) * engine.EARTH_RADIUS_KM
+        x = (np.radians(lon) * k).tolist()
+        y = (np.radians(lat) * engine.EARTH_RADIUS_KM).tolist()
+        for tol_km in (0.001, 0.01, 0.1):
+            expected = {0, len(x) - 1}
+            _recursive_dp(x, y, 0, len(x) - 1, tol_km, expected)
+            with self.subTest(tolerance_km=tol_km):
+                self.assertEqual(engine.simplify(lat, lon, tol_km).tolist(), sorted(expected))
+
+    def test_simplify_budget(self):
+        lat, lon, _t = _random_track(5000, seed=3, jumps=0.0)
+        idx = engine.simplify(lat, lon, 0.0, 100)
+        self.assertEqual(idx.shape[0], 100)
+        self.assertEqual((int(idx[0]), int(idx[-1])), (0, lat.shape[0] - 1))
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+
+class EncodingTests(SimpleTestCase):
+    def test_polyline_round_trip(self):
+        lat, lon, _t = _random_track(1000, seed=6)
+        lat = np.concatenate((lat, [-33.8688, 0.0, 89.99999]))
+        lon = np.concatenate((lon, [151.2093, -179.99999, 0.0]))
+        decoded = np.array(_decode_polyline(encoding.encode_polyline(lat, lon)))
+        np.testing.assert_allclose(decoded[:, 0], np.round(lat, 5), atol=1e-9)
+        np.testing.assert_allclose(decoded[:, 1], np.round(lon, 5), atol=1e-9)
+        self.assertEqual(encoding.encode_polyline(np.empty(0), np.empty(0)), "")
+
+    def test_polyline_reference_string(self):
+        # пример из описания формата Google
+        lat = np.array([38.5, 40.7, 43.252])
+        lon = np.array([-120.2, -120.95, -126.453])
+        self.assertEqual(encoding.encode_polyline(lat, lon), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_binary_round_trip(self):
+        trips = [_random_track(n, seed=n)[:2] for n in (1, 50, 700)]
+        header = {"format": "binary", "binary_scale": encoding.BINARY_SCALE,
+                  "trips": [{"trip_no": i + 1, "points_count": int(la.shape[0])} for i, (la, _lo) in enumerate(trips)]}
+        buf = encoding.pack_binary(header, [encoding.delta_int32(la, lo) for la, lo in trips])
+
+        (head_len,) = struct.unpack_from("<I", buf, 0)
+        self.assertEqual((4 + head_len) % 4, 0)
+        self.assertEqual(json.loads(buf[4:4 + head_len].decode("utf-8")), header)
+        data = np.frombuffer(buf, dtype="<i4", offset=4 + head_len)
+        off = 0
+        for la, lo in trips:
+            d = data[off:off + 2 * la.shape[0]].reshape(-1, 2).astype(np.int64)
+            off += d.size
+            v = np.cumsum(d, axis=0) / encoding.BINARY_SCALE
+            np.testing.assert_allclose(v[:, 0], np.round(la, 6), atol=1e-9)
+            np.testing.assert_allclose(v[:, 1], np.round(lo, 6), atol=1e-9)
+        self.assertEqual(off, data.shape[0])
+
+
+class FenceIndexTests(SimpleTestCase):
+    @staticmethod
+    def _square(lat0, lon0, lat1, lon1):
+        return (np.array([lon0, lon1, lon1, lon0, lon0]), np.array([lat0, lat0, lat1, lat1, lat0]))
+
+    def test_circle(self):
+        index = _sand_base(radius_km=0.5)
+        rng = np.random.default_rng(7)
+        lat = 52.0 + rng.uniform(-0.01, 0.01, 5000)
+        lon = 37.9 + rng.uniform(-0.015, 0.015, 5000)
+        np.testing.assert_array_equal(index.inside(lat, lon), engine.inside_circle(lat, lon, 52.0, 37.9, 0.5))
+        self.assertEqual(index.max_radius_m(), 500.0)
+        self.assertFalse(index.has_polygons())
+
+    def test_polygon_with_hole(self):
+        fence = Fence(2, "Карьер", "sand_base", rings=[
+            self._square(52.10, 37.80, 52.12, 37.84),
+            self._square(52.105, 37.81, 52.115, 37.83),  # дыра
+        ])
+        index = FenceIndex([fence])
+        lat = np.array([52.101, 52.11, 52.119, 52.13, 52.11, 52.09])
+        lon = np.array([37.801, 37.82, 37.839, 37.82, 37.835, 37.82])
+        self.assertEqual(index.inside(lat, lon).tolist(), [True, False, True, False, True, False])
+        self.assertTrue(index.has_polygons())
+
+    def test_classify_matches_brute_force(self):
+        rng = np.random.default_rng(8)
+        fences = []
+        for n in range(60):
+            lat0, lon0 = 52.0 + rng.uniform(-0.3, 0.3), 37.9 + rng.uniform(-0.5, 0.5)
+            if n % 3:
+                fences.append(Fence(n, str(n), "sand_base", lat=lat0, lon=lon0, radius_km=rng.uniform(0.05, 3.0)))
+            else:
+                fences.append(Fence(n, str(n), "sand_base", rings=[
+                    self._square(lat0, lon0, lat0 + rng.uniform(0.005, 0.05), lon0 + rng.uniform(0.005, 0.05))
+                ]))
+        index = FenceIndex(fences)
+        lat = 52.0 + rng.uniform(-0.35, 0.35, 20000)
+        lon = 37.9 + rng.uniform(-0.55, 0.55, 20000)
+
+        expected = np.full(lat.shape[0], -1)
+        for n in range(len(fences) - 1, -1, -1):
+            expected[fences[n].contains(lat, lon)] = n
+        np.testing.assert_array_equal(index.classify(lat, lon), expected)
+        self.assertGreater(int((expected >= 0).sum()), 0)
+
+    def test_empty(self):
+        index = FenceIndex([])
+        self.assertFalse(index)
+        self.assertEqual(index.inside(np.array([52.0]), np.array([37.9])).tolist(), [False])
+        self.assertIsNone(index.as_json())
+
+
+# ----------------- Fortmonitor: локальный стаб-сервер -----------------
+
+class _StubServer:
+    """ThreadingHTTPServer на 127.0.0.1 в отдельном потоке; handler — подкласс BaseHTTPRequestHandler."""
+
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.base = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj, status=200, headers=()):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _TrackHandler(_QuietHandler):
+    """Ответ — эхо параметров; считает одновременные запросы."""
+
+    def do_GET(self):
+        stub = self.server.stub
+        q = parse_qs(urlparse(self.path).query)
+        oid = int(q["oid"][0])
+        with stub.lock:
+            stub.inflight += 1
+            stub.max_inflight = max(stub.max_inflight, stub.inflight)
+        try:
+            # поздние задачи отвечают быстрее: порядок выдачи не должен зависеть от порядка ответов
+            time.sleep(0.02 + 0.01 * ((7 * oid) % 5))
+            self.send_json({"oid": oid, "from": q["from"][0], "to": q["to"][0]})
+        finally:
+            with stub.lock:
+                stub.inflight -= 1
+
+
+class FetchChunksTests(SimpleTestCase):
+    def _tasks(self, n):
+        t0 = datetime(2026, 1, 1)
+        return [(i, t0 + timedelta(hours=6 * i), t0 + timedelta(hours=6 * (i + 1))) for i in range(n)]
+
+    def test_order_and_concurrency(self):
+        from tracking.management.commands.import_fortmonitor import fetch_chunks
+
+        tasks = self._tasks(24)
+        for workers in (1, 3, 6):
+            with self.subTest(workers=workers), _StubServer(_TrackHandler) as stub:
+                stub.inflight = stub.max_inflight = 0
+                with requests.Session() as s:
+                    def fetch(oid, a, b):
+                        return s.get(stub.base + "/track", params={"oid": oid, "from": a, "to": b}).json()
+
+                    out = list(fetch_chunks(tasks, fetch, workers=workers))
+
+                self.assertEqual([t for t, _ in out], tasks)
+                for (oid, a, _b), data in out:
+                    self.assertEqual((data["oid"], data["from"]), (oid, a.strftime("%Y-%m-%d %H:%M:%S")))
+                self.assertLessEqual(stub.max_inflight, workers)
+                if workers > 1:
+                    self.assertGreater(stub.max_inflight, 1)
+
+
+class _LoginHandler(_QuietHandler):
+    """login.aspx (ASP.NET-форма) выдаёт новую cookie sid; track принимает только последнюю."""
+
+    FORM = '<form><input type="hidden" name="__VIEWSTATE" value="vs" /></form>'
+
+    def do_GET(self):
+        stub = self.server.stub
+        if self.path.startswith("/login.aspx"):
+            body = self.FORM.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        with stub.lock:
+            stub.requests += 1
+        if "sid=%d" % stub.sid not in (self.headers.get("Cookie") or ""):
+            self.send_json({"error": "unauthorized"}, status=401)
+            return
+        self.send_json({"ok": True})
+
+    def do_POST(self):
+        stub = self.server.stub
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with stub.lock:
+            stub.logins += 1
+            stub.sid += 1
+            sid = stub.sid
+        self.send_json({}, headers=[("Set-Cookie", "sid=%d; Path=/" % sid)])
+
+
+class FortmonitorClientTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch("tracking.fortmonitor.COOKIE_TXT", Path(tmp.name) / "cookie.txt")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _stub(self):
+        stub = _StubServer(_LoginHandler)
+        stub.sid, stub.logins, stub.requests = 1, 0, 0
+        return stub
+
+    def test_relogin_on_401(self):
+        from tracking.fortmonitor import FortmonitorClient
+
+        with self._stub() as stub:
+            client = FortmonitorClient(stub.base, retries=0)
+            client.set_cookie("sid=0")  # протухшая
+            self.assertEqual(client.track(182, "2026-01-01 00:00:00", "2026-01-01 06:00:00"), {"ok": True})
+            self.assertEqual((stub.logins, stub.requests), (1, 2))
+
+            # cookie снова свежая — без перелогина
+            client.track(182, "2026-01-01 06:00:00", "2026-01-01 12:00:00")
+            self.assertEqual((stub.logins, stub.requests), (1, 3))
+
+    def test_relogin_once_for_many_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from tracking.fortmonitor import FortmonitorClient
+
+        with self._stub() as stub:
+            client = FortmonitorClient(stub.base, pool_size=8, retries=0)
+            client.set_cookie("sid=0")
+            with ThreadPoolExecutor(8) as ex:
+                out = list(ex.map(lambda i: client.track(i, "2026-01-01 00:00:00", "2026-01-01 06:00:00"), range(8)))
+            self.assertEqual(out, [{"ok": True}] * 8)
+            self.assertEqual(stub.logins, 1)
+
+    def test_relogin_disabled(self):
+        from tracking.fortmonitor import FortmonitorClient, SessionExpired
+
+        with self._stub() as stub:
+            client = FortmonitorClient(stub.base, retries=0, relogin=False)
+            client.set_cookie("sid=0")
+            with self.assertRaises(SessionExpired):
+                client.track(182, "2026-01-01 00:00:00", "2026-01-01 06:00:00")
+            self.assertEqual(stub.logins, 0)
+
+
+class RawArchiveTests(SimpleTestCase):
+    def test_write_then_replay(self):
+        from tracking.rawarchive import RawArchive
+
+        utc = dt_timezone.utc
+        chunks = [
+            (182, datetime(2026, 1, 1, 0, tzinfo=utc), datetime(2026, 1, 1, 6, tzinfo=utc), {"points": [1, 2]}),
+            (182, datetime(2026, 1, 1, 6, tzinfo=utc), datetime(2026, 1, 1, 12, tzinfo=utc), {"points": []}),
+            (182, datetime(2026, 1, 2, 0, tzinfo=utc), datetime(2026, 1, 2, 6, tzinfo=utc), {"name": "КамАЗ"}),
+            (716, datetime(2026, 1, 1, 0, tzinfo=utc), datetime(2026, 1, 1, 6, tzinfo=utc), {"points": [3]}),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = RawArchive(Path(tmp))
+            for oid, a, b, data in chunks:
+                archive.write(oid, a, b, data)
+            # дописывание в тот же сегмент при следующем запуске
+            again = RawArchive(Path(tmp))
+            extra = (182, datetime(2026, 1, 1, 18, tzinfo=utc), datetime(2026, 1, 2, 0, tzinfo=utc), {"points": [4]})
+            again.write(*extra)
+
+            self.assertEqual(again.oids(), [182, 716])
+            self.assertEqual(
+                list(again.iter_chunks(182)),
+                [(a, b, data) for oid, a, b, data in chunks[:2] + [extra] + chunks[2:3]],
+            )
+            # сегмент — несколько gzip-member, читается как один поток
+            with gzip.open(again.path(182, chunks[0][1].date()), "rb") as f:
+                self.assertEqual(len(f.read().splitlines()), 3)
+
+            got = list(again.iter_chunks(182, dt_from=chunks[1][1], dt_to=chunks[2][1]))
+            self.assertEqual([a for a, _b, _d in got], [chunks[1][1], extra[1]])
+            self.assertEqual(list(again.iter_chunks(999)), [])
+
+    def test_bad_compression(self):
+        from tracking.rawarchive import RawArchive
+
+        with self.assertRaises(ValueError):
+            RawArchive(Path(tempfile.gettempdir()), compression="xz")
+
+
+# ----------------- запись точек (PostGIS) -----------------
+
+def _point_rows(oid, n, seed=0):
+    """Строки tracking.loader (oid, tm, idx=None, lon, lat, speed_kmh, odo_km) без скачков, tm — целые секунды."""
+    lat, lon, t = _random_track(n, seed=seed, jumps=0.0, gaps=0.0)
+    return [
+        (oid, datetime.fromtimestamp(round(ts), dt_timezone.utc), None, lo, la, 40.0, None)
+        for la, lo, ts in zip(lat.tolist(), lon.tolist(), t.tolist())
+    ]
+
+
+class UpsertTests(TestCase):
+    """Уникальный (oid, tm): повтор не дублирует, upsert трогает только изменившиеся строки."""
+
+    OID = 9101
+
+    def _stored(self, oid=OID):
+        return list(TrackPoint.objects.filter(oid=oid).order_by("tm").values_list("tm", "idx"))
+
+    def test_duplicates_skipped(self):
+        for oid, use_copy in ((self.OID, False), (self.OID + 1, True)):
+            with self.subTest(use_copy=use_copy):
+                rows = _point_rows(oid, 20, seed=oid)
+                # дубли внутри пачки схлопываются
+                self.assertEqual(len(insert_points(rows + rows[:5], use_copy=use_copy)), 20)
+                self.assertEqual(insert_points(rows, use_copy=use_copy), [])
+                self.assertEqual(len(self._stored(oid)), 20)
+
+    def test_upsert_returns_only_changed(self):
+        rows = _point_rows(self.OID, 50)
+        out = upsert_points(rows)
+        self.assertEqual([(r[1], r[4]) for r in out], [(r[1], True) for r in rows])
+        self.assertEqual(upsert_points(rows), [])
+
+        oid, tm, _idx, lon, lat, _speed, _odo = rows[10]
+        # пустая скорость существующую не затирает
+        self.assertEqual(upsert_points([(oid, tm, None, lon, lat, None, None)]), [])
+        out = upsert_points([(oid, tm, None, lon + 0.001, lat, None, None)])
+        self.assertEqual([(r[0], r[1], r[4]) for r in out], [(oid, tm, False)])
+        self.assertAlmostEqual(out[0][2], lon + 0.001, places=7)
+        self.assertEqual(TrackPoint.objects.get(oid=oid, tm=tm).speed_kmh, 40.0)
+
+    def test_store_chunk_numbers_new_points(self):
+        for oid, use_copy in ((self.OID, False), (self.OID + 1, True)):
+            with self.subTest(use_copy=use_copy):
+                rows = _point_rows(oid, 30, seed=oid)
+                # перекрывающиеся окна, как у ingest_daemon и повторного импорта
+                for a, b in ((0, 10), (5, 15), (0, 15), (12, 30)):
+                    ingest.store_chunk(oid, rows[a:b], None, use_copy=use_copy)
+                self.assertEqual([idx for _tm, idx in self._stored(oid)], list(range(30)))
+
+        # idx, выданный другим источником (Mongo), продолжается
+        oid = self.OID + 2
+        rows = _point_rows(oid, 10, seed=oid)
+        insert_points([r[:2] + (100,) + r[3:] for r in rows[:1]])
+        ingest.store_chunk(oid, rows, None)
+        self.assertEqual([idx for _tm, idx in self._stored(oid)], [100] + list(range(101, 110)))
+
+    def test_dedup_migration(self):
+        migration = importlib.import_module("tracking.migrations.0010_trackpoint_oid_tm_unique")
+        rows = [r[:2] + (i,) + r[3:] for i, r in enumerate(_point_rows(self.OID, 10))]
+        insert_points(rows)
+        TrackPoint.objects.filter(oid=self.OID).update(cum_km=1.0)
+        with connection.cursor() as cur:
+            # UniqueConstraint с include Django создаёт уникальным индексом
+            cur.execute("DROP INDEX tracking_tp_oid_tm_uniq")
+            # дубли хвоста, загруженные позже (id больше) и с другим idx
+            cur.execute(
+                "INSERT INTO tracking_trackpoint (oid, tm, idx, geom) "
+                "SELECT oid, tm, idx + 100, geom FROM tracking_trackpoint WHERE oid = %s AND tm >= %s",
+                [self.OID, rows[6][1]],
+            )
+            self.assertEqual(len(self._stored()), 14)
+            cur.execute(migration.DEDUP_SQL)
+
+        self.assertEqual(self._stored(), [(r[1], r[2]) for r in rows])
+        cum = list(TrackPoint.objects.filter(oid=self.OID).order_by("tm").values_list("cum_km", flat=True))
+        self.assertEqual(cum, [1.0] * 6 + [None] * 4)
+        self.assertTrue(TrackDataVersion.objects.filter(oid=self.OID).exists())
+
+
+class CheckpointTests(TestCase):
+    """Водяной знак и долг пересчёта (ImportCheckpoint) при записи пачек и пересчёте cum_*."""
+
+    OID = 9201
+
+    def _cum(self):
+        return list(
+            TrackPoint.objects.filter(oid=self.OID).order_by("tm")
+            .values_list("cum_km", "cum_kept", "cum_n", "cum_sb_entries", "gps_jump")
+        )
+
+    def assertSameCum(self, got, expected):
+        # cum_km по чанкам складывается в другом порядке
+        np.testing.assert_allclose([r[0] for r in got], [r[0] for r in expected], rtol=0, atol=1e-9)
+        self.assertEqual([r[1:] for r in got], [r[1:] for r in expected])
+
+    def test_store_chunk_advances_watermark(self):
+        rows = _point_rows(self.OID, 40)
+        mark = rows[19][1] + timedelta(minutes=1)
+        self.assertEqual(ingest.store_chunk(self.OID, rows[:20], mark), (20, 0, rows[0][1]))
+        cp = checkpoints.get(self.OID, ingest.SOURCE)
+        self.assertEqual((cp.last_tm, cp.dirty_from), (mark, rows[0][1]))
+
+        # повтор пачки ничего не пишет, водяной знак назад не идёт
+        self.assertEqual(ingest.store_chunk(self.OID, rows[:20], rows[5][1]), (0, 0, None))
+        ingest.store_chunk(self.OID, rows[20:], rows[-1][1])
+        cp.refresh_from_db()
+        self.assertEqual((cp.last_tm, cp.dirty_from), (rows[-1][1], rows[0][1]))
+        self.assertEqual(ingest.pending_since(self.OID), rows[0][1])
+
+        ingest.refresh(self.OID, ingest.pending_since(self.OID))
+        self.assertIsNone(ingest.pending_since(self.OID))
+        self.assertFalse(TrackPoint.objects.filter(oid=self.OID, cum_km__isnull=True).exists())
+
+    def test_mark_clean_keeps_earlier_debt(self):
+        rows = _point_rows(self.OID, 40)
+        ingest.store_chunk(self.OID, rows[20:], None)
+        # пока шёл пересчёт с rows[20], параллельный импорт дописал точку раньше
+        checkpoints.advance(self.OID, ingest.SOURCE, None, rows[5][1])
+        checkpoints.mark_clean(self.OID, ingest.SOURCE, rows[20][1])
+        self.assertEqual(ingest.pending_since(self.OID), rows[5][1])
+        checkpoints.mark_clean(self.OID, ingest.SOURCE, rows[5][1])
+        self.assertIsNone(ingest.pending_since(self.OID))
+
+    def test_paged_refresh_matches_single_page(self):
+        lat, lon, t = _random_track(500, seed=21)
+        insert_points([
+            (self.OID, datetime.fromtimestamp(round(ts), dt_timezone.utc), i, lo, la, None, None)
+            for i, (la, lo, ts) in enumerate(zip(lat.tolist(), lon.tolist(), t.tolist()))
+        ])
+        self.assertEqual(refresh_cumulative(self.OID), 500)
+        full = self._cum()
+        self.assertTrue(any(r[4] for r in full))
+
+        self.assertEqual(refresh_cumulative(self.OID, chunk=7), 500)
+        self.assertSameCum(self._cum(), full)
+        # досчёт с середины продолжает состояние строк до since
+        since = TrackPoint.objects.filter(oid=self.OID).order_by("tm").values_list("tm", flat=True)[300]
+        self.assertEqual(refresh_cumulative(self.OID, since=since, chunk=13), 200)
+        self.assertSameCum(self._cum(), full)
+
+
+class MongoResumeTests(TestCase):
+    """import_from_mongo: после обрыва продолжаем с last_key, ничего не теряя и не дублируя."""
+
+    OID = 9301
+
+    def _docs(self, n):
+        return [
+            {"oid": oid, "tm": timezone.localtime(tm).strftime("%Y-%m-%d %H:%M:%S"), "lat": lat, "lon": lon, "idx": i}
+            for i, (oid, tm, _idx, lon, lat, _speed, _odo) in enumerate(_point_rows(self.OID, n))
+        ]
+
+    def test_resume_query(self):
+        q = {"tm": {"$exists": True}}
+        self.assertIs(import_from_mongo.resume_query(q, {}), q)
+        self.assertEqual(import_from_mongo.resume_query({"oid": 3}, {1: 5}), {"oid": 3})
+        self.assertEqual(import_from_mongo.resume_query({"oid": 1}, {1: 5}), {"oid": 1, "idx": {"$gte": 5}})
+        self.assertEqual(
+            import_from_mongo.resume_query(q, {2: 7, 1: 5}),
+            {**q, "$or": [{"oid": {"$nin": [1, 2]}}, {"oid": 1, "idx": {"$gte": 5}}, {"oid": 2, "idx": {"$gte": 7}}]},
+        )
+
+    def test_resume_after_interrupt(self):
+        docs = self._docs(50)
+
+        def interrupted():
+            yield from docs[:23]
+            raise RuntimeError("курсор Mongo оборвался")
+
+        with self.assertRaises(RuntimeError):
+            import_from_mongo._load_points(interrupted(), 10, False, keyed=True)
+        # закоммичены только полные пачки, с контрольной точкой на последнем idx
+        self.assertEqual(TrackPoint.objects.filter(oid=self.OID).count(), 20)
+        done = checkpoints.keys(import_from_mongo.SOURCE)
+        self.assertEqual(done, {self.OID: 19})
+
+        q = import_from_mongo.resume_query({"oid": self.OID}, done)
+        rest = [d for d in docs if d["idx"] >= q["idx"]["$gte"]]
+        inserted, skipped, changed_from = import_from_mongo._load_points(rest, 10, True, keyed=True)
+        self.assertEqual((inserted, skipped), (30, 0))
+        self.assertEqual(
+            list(TrackPoint.objects.filter(oid=self.OID).order_by("tm").values_list("idx", flat=True)),
+            list(range(50)),
+        )
+        self.assertEqual(checkpoints.keys(import_from_mongo.SOURCE), {self.OID: 49})
+        first_tm = TrackPoint.objects.filter(oid=self.OID).order_by("tm").values_list("tm", flat=True)
+        self.assertEqual(changed_from, {self.OID: first_tm[20]})
+        # долг пересчёта — с первой точки, загруженной до обрыва
+        self.assertEqual(checkpoints.dirty(import_from_mongo.SOURCE), {self.OID: first_tm[0]})
+
+
+class SandBaseVersionTests(TestCase):
+    """После правки пескобаз cum_sb_entries не отвечают, пока oid не пересчитан целиком."""
+
+    OID = 9401
+
+    def test_geofence_change_invalidates(self):
+        sb = Geofence.objects.create(
+            name="Пескобаза", kind=Geofence.SAND_BASE, center=Point(37.9, 52.0, srid=4326), radius_m=300.0
+        )
+        rows = _point_rows(self.OID, 300)
+        insert_points(rows)
+        refresh_derived(self.OID)
+        self.assertGreater(range_summary(self.OID)["sand_base_entries"], 0)
+
+        # пескобазу перенесли в сторону от трека
+        sb.center = Point(38.5, 52.5, srid=4326)
+        sb.save()
+        self.assertIsNone(range_summary(self.OID))
+
+        # пересчёт "с since" при устаревших пескобазах идёт с начала трека
+        refresh_derived(self.OID, since=rows[-1][1])
+        self.assertEqual(range_summary(self.OID)["sand_base_entries"], 0)
+        self.assertEqual(Vehicle.objects.get(oid=self.OID).sb_version, geofences.version())
@@ -0,0 +1,108 @@
+"""
+Рейсы в таблице Trip: считаются при импорте, а не на каждый запрос.
+
+Рейс — отфильтрованные точки от заезда на пескобазу до следующего заезда
+(как в trips_for_map). Берём готовые cum_km / cum_sb_entries / gps_jump
+(tracking.derived), поэтому дистанция рейса — разность двух cum_km.
+Хранятся только закрытые рейсы; хвост после последнего заезда
+пересчитывается при следующем импорте.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+from django.contrib.gis.geos import LineString
+
+from tracking import engine, geofences
+from tracking.db import with_lat_lon
+from tracking.models import Geofence, TrackPoint, Trip
+
+# Trip.geom: Дуглас–Пекер с мелким допуском, дальше view упрощает под запрос
+TRIP_GEOM_MAX_POINTS = 2000
+TRIP_GEOM_TOLERANCE_KM = 0.001
+
+
+def _line(lat: np.ndarray, lon: np.ndarray) -> Optional[LineString]:
+    if lat.shape[0] < 2:
+        return None
+    sel = engine.simplify(lat, lon, TRIP_GEOM_TOLERANCE_KM, TRIP_GEOM_MAX_POINTS)
+    return LineString(list(zip(lon[sel].tolist(), lat[sel].tolist())), srid=4326)
+
+
+def refresh_trips(oid: int, since=None) -> int:
+    """
+    Досчитываем рейсы oid. since — самая ранняя изменённая точка: рейсы,
+    которые её задевают, удаляются и считаются заново (since=None — все рейсы).
+    Возвращаем число созданных рейсов.
+
+    Читаем только точки от конца последнего рейса (или от первого заезда, если
+    рейсов нет); без новых заездов точки не читаются вовсе — по cum_sb_entries
+    последней строки oid.
+    """
+    stale = Trip.objects.filter(oid=oid)
+    if since is not None:
+        stale = stale.filter(tm_end__gte=since)
+    stale.delete()
+
+    if not len(geofences.load(Geofence.SAND_BASE)):
+        return 0
+
+    points = TrackPoint.objects.filter(oid=oid)
+    tail = points.order_by("-tm").values_list("cum_sb_entries", flat=True).first()
+    if not tail:
+        return 0
+
+    last = Trip.objects.filter(oid=oid).order_by("-tm_start").first()
+    if last is None:
+        # рейс — между двумя заездами
+        if tail < 2:
+            return 0
+        start = points.filter(cum_sb_entries__gte=1).order_by("tm").values_list("tm", flat=True).first()
+    else:
+        end_sb = points.filter(tm=last.tm_end).values_list("cum_sb_entries", flat=True).first()
+        if end_sb is not None and tail <= end_sb:
+            return 0  # после последнего рейса заездов не было
+        start = last.tm_end
+
+    qs = points.filter(gps_jump=False, tm__gte=start)
+    rows = list(
+        with_lat_lon(qs)
+        .order_by("tm", "id")
+        .values_list("tm", "idx", "lat", "lon", "cum_km", "cum_sb_entries")
+    )
+    if len(rows) < 2:
+        return 0
+
+    tms, idxs, lats, lons, cum_kms, cum_sbs = zip(*rows)
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    cum_km = np.asarray(cum_kms, dtype=np.float64)
+    cum_sb = np.asarray(cum_sbs, dtype=np.int64)
+
+    # заезд — принятая точка, на которой вырос счётчик; первая строка — конец
+    # прошлого рейса или первый заезд, т.е. тоже заезд
+    if last is None or tms[0] == last.tm_end:
+        base = cum_sb[0] - 1
+    else:
+        base = cum_sb[0]
+    prev = np.concatenate(([base], cum_sb[:-1]))
+    entries = np.flatnonzero(cum_sb > prev)
+
+    objs = []
+    for a, b in zip(entries[:-1].tolist(), entries[1:].tolist()):
+        objs.append(
+            Trip(
+                oid=oid,
+                tm_start=tms[a],
+                tm_end=tms[b],
+                idx_start=idxs[a],
+                idx_end=idxs[b],
+                distance_km=float(cum_km[b] - cum_km[a]),
+                points_count=b - a + 1,
+                geom=_line(lat[a:b + 1], lon[a:b + 1]),
+            )
+        )
+
+    Trip.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
@@ -0,0 +1,54 @@
+"""
+Реестр Vehicle: обновляется импортёрами после каждой пачки точек,
+чтобы список oid не требовал SELECT DISTINCT по всему TrackPoint.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Tuple
+
+from django.db import connection
+
+from tracking.models import TrackPoint
+
+_UPSERT_SQL = """
+INSERT INTO tracking_vehicle AS v (oid, first_tm, last_tm, points_count, last_geom, updated_at)
+VALUES (%s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, now())
+ON CONFLICT (oid) DO UPDATE SET
+    first_tm = LEAST(v.first_tm, EXCLUDED.first_tm),
+    last_geom = CASE WHEN v.last_tm IS NULL OR EXCLUDED.last_tm >= v.last_tm
+                     THEN EXCLUDED.last_geom ELSE v.last_geom END,
+    last_tm = GREATEST(v.last_tm, EXCLUDED.last_tm),
+    points_count = v.points_count + EXCLUDED.points_count,
+    updated_at = now()
+"""
+
+
+def note_rows(rows: Iterable[Tuple]) -> int:
+    """
+    Учитываем пачку точек в реестре (одна строка на oid).
+    rows: (oid, tm, lon, lat, new); new=False — точка уже была в таблице
+    (обновлена): счётчик не растёт, но последняя позиция может смениться.
+    Возвращаем число затронутых oid.
+    """
+    acc: Dict[int, list] = {}
+    for oid, tm, lon, lat, new in rows:
+        a = acc.get(oid)
+        if a is None:
+            acc[oid] = [tm, tm, int(bool(new)), lon, lat]
+            continue
+        if tm < a[0]:
+            a[0] = tm
+        if tm >= a[1]:
+            a[1] = tm
+            a[3], a[4] = lon, lat
+        a[2] += int(bool(new))
+
+    with connection.cursor() as cur:
+        for oid, (first_tm, last_tm, n, lon, lat) in acc.items():
+            cur.execute(_UPSERT_SQL, [oid, first_tm, last_tm, n, lon, lat])
+    return len(acc)
+
+
+def note_points(points: Iterable[TrackPoint], new: bool = True) -> int:
+    """Как note_rows, но по объектам TrackPoint (после bulk_create / bulk_update)."""
+    return note_rows((p.oid, p.tm, p.geom.x, p.geom.y, new) for p in points)
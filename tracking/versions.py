@@ -0,0 +1,59 @@
+"""
+Версии данных трека для кэша API.
+
+TrackDataVersion хранит счётчик на (oid, сутки). Импортёры поднимают его в
+транзакции записи пачки (с самой ранней новой/изменённой точки), refresh_derived —
+после пересчёта cum_* и рейсов; в обоих случаях для всех суток от since до
+последней точки oid. Ключ кэша включает сумму версий суток периода:
+любой пересчёт внутри периода меняет ключ, старые ответы просто не читаются.
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Tuple
+
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from tracking.models import TrackDataVersion, TrackPoint
+from tracking.pyramid import local_day
+
+_BUMP_SQL = """
+INSERT INTO tracking_trackdataversion (oid, day, version)
+SELECT %s, d::date, 1
+FROM generate_series(%s::date, %s::date, interval '1 day') AS d
+ON CONFLICT (oid, day) DO UPDATE SET version = tracking_trackdataversion.version + 1
+"""
+
+
+def _day(dt) -> date:
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return local_day(dt)
+
+
+def bump(oid: int, since=None) -> int:
+    """Поднимаем версии суток oid от since (None — с первой точки) до последней точки."""
+    qs = TrackPoint.objects.filter(oid=oid)
+    if since is None:
+        since = qs.order_by("tm").values_list("tm", flat=True).first()
+    until = qs.order_by("-tm").values_list("tm", flat=True).first()
+    if since is None or until is None:
+        return 0
+
+    d0, d1 = _day(since), max(_day(since), _day(until))
+    with connection.cursor() as cur:
+        cur.execute(_BUMP_SQL, [oid, d0, d1])
+    return (d1 - d0).days + 1
+
+
+def data_version(oid: int, dt_from=None, dt_to=None) -> Tuple[int, int]:
+    """(число суток с версией, сумма версий) за период — часть ключа кэша."""
+    qs = TrackDataVersion.objects.filter(oid=oid)
+    if dt_from:
+        qs = qs.filter(day__gte=_day(dt_from))
+    if dt_to:
+        qs = qs.filter(day__lte=_day(dt_to))
+    agg = qs.aggregate(n=Count("id"), v=Sum("version"))
+    return agg["n"], agg["v"] or 0
@@ -1,3 +1,264 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from tracking import ingest
+from tracking.derived import range_summary, refresh_derived
+from tracking.engine import Track
+from tracking.geofences import Fence, FenceIndex
+from tracking.loader import insert_points
+from tracking.management.commands import import_from_mongo
+from tracking.models import Geofence, TrackPoint
+from volovo_api import views
+
+
+# точек в чанке iter_track: на каждой границе — скачок GPS
+CHUNK = 500
+
+
+def _track(n, seed=0):
+    """Челнок между пескобазой (52.0, 37.9) и точкой в ~4 км, со скачками GPS."""
+    rng = np.random.default_rng(seed)
+    phase = np.cumsum(rng.uniform(0.0, 0.02, n))
+    lat = 52.0 + 0.02 * np.sin(phase) + rng.normal(0.0, 2e-5, n)
+    lon = 37.9 + 0.01 * (1.0 - np.cos(phase)) + rng.normal(0.0, 2e-5, n)
+    bad = rng.random(n) < 0.02
+    bad[CHUNK::CHUNK] = True
+    lat[bad] += rng.uniform(0.05, 0.5, bad.sum())
+    t0 = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+    tm = [t0 + timedelta(seconds=s) for s in np.cumsum(rng.uniform(5.0, 30.0, n)).tolist()]
+    return Track.from_rows(zip(tm, lat.tolist(), lon.tolist()))
+
+
+def _walk(n, seed=0):
+    """Блуждание у пескобазы (52.0, 37.9) со скачками GPS, шаг 5–30 с (целые секунды)."""
+    rng = np.random.default_rng(seed)
+    phase = np.cumsum(rng.uniform(0.0, 0.02, n))
+    lat = 52.0 + 0.02 * np.sin(phase) + rng.normal(0.0, 2e-5, n)
+    lon = 37.9 + 0.01 * (1.0 - np.cos(phase)) + rng.normal(0.0, 2e-5, n)
+    bad = rng.random(n) < 0.02
+    lat[bad] += rng.uniform(0.05, 0.5, bad.sum())
+    t = 1.7e9 + np.cumsum(np.round(rng.uniform(5.0, 30.0, n)))
+    return lat, lon, t
+
+
+def _rows(oid, lat, lon, t):
+    """Строки tracking.loader: (oid, tm, idx, lon, lat, speed_kmh, odo_km)."""
+    return [
+        (oid, datetime.fromtimestamp(ts, dt_timezone.utc), i, lo, la, None, None)
+        for i, (la, lo, ts) in enumerate(zip(lat.tolist(), lon.tolist(), t.tolist()))
+    ]
+
+
+def _add_sand_base():
+    return Geofence.objects.create(
+        name="Пескобаза", kind=Geofence.SAND_BASE, center=Point(37.9, 52.0, srid=4326), radius_m=300.0
+    )
+
+
+# правило паузы есть только у cum_* (tracking.derived): без него cum и live считают одинаково
+@override_settings(TRACK_CUM_MAX_GAP_S=None)
+class PointsSummaryCumTests(TestCase):
+    """points_summary mode=cum (range_summary) против mode=python и устаревшие cum_*."""
+
+    OID = 9001
+
+    def setUp(self):
+        _add_sand_base()
+        self.rows = _rows(self.OID, *_walk(1500, seed=11))
+        # нечётные точки — "догрузка" в тестах
+        insert_points(self.rows[::2])
+        refresh_derived(self.OID)
+
+    def _summary(self, mode, dt_from=None, dt_to=None):
+        row = views._summary_row(self.OID, dt_from, dt_to, 1.0, 180.0, mode)
+        self.assertEqual(row.pop("mode"), mode)
+        return row
+
+    def assertMatchesLive(self, dt_from=None, dt_to=None):
+        cum = self._summary("cum", dt_from, dt_to)
+        live = self._summary("python", dt_from, dt_to)
+        self.assertAlmostEqual(cum.pop("total_km"), live.pop("total_km"), places=5)
+        self.assertEqual(cum, live)
+
+    def test_matches_live(self):
+        tms = [r[1] for r in self.rows[::2]]
+        self.assertMatchesLive()
+        for dt_to in (tms[1], tms[300], tms[-10]):
+            with self.subTest(dt_to=dt_to):
+                self.assertMatchesLive(None, dt_to)
+        # фильтр скачков на dt_from не перезапускается: совпадает, если первая точка периода принята
+        kept = list(
+            TrackPoint.objects.filter(oid=self.OID, gps_jump=False).order_by("tm").values_list("tm", flat=True)
+        )
+        for a, b in ((kept[50], kept[400]), (kept[200], None), (kept[-30], kept[-1])):
+            with self.subTest(dt_from=a, dt_to=b):
+                self.assertMatchesLive(a, b)
+        self.assertGreater(self._summary("python")["gps_jumps_removed"], 0)
+        self.assertGreater(self._summary("python")["sand_base_entries"], 1)
+
+    def test_mid_range_insert(self):
+        late = self.rows[1::2][400:500]
+        n_new, n_upd, first = ingest.store_chunk(self.OID, late, None)
+        self.assertEqual((n_new, n_upd, first), (100, 0, late[0][1]))
+
+        # период до вставки отвечает по cum_*, период с новыми точками — нет, API считает на лету
+        self.assertMatchesLive(None, self.rows[800][1])
+        self.assertIsNone(range_summary(self.OID, None, late[50][1]))
+        row = views._summary_row(self.OID, None, late[50][1], 1.0, 180.0, "auto")
+        self.assertEqual((row["mode"], row["original_count"]), ("python", 451 + 51))
+
+        ingest.refresh(self.OID, first)
+        self.assertMatchesLive()
+        self.assertMatchesLive(None, late[50][1])
+
+    def test_rewritten_point(self):
+        oid, tm, idx, lon, lat, _speed, _odo = self.rows[600]
+        # точка уехала на ~2 км: ON CONFLICT DO UPDATE переписывает её, cum_* остаются старыми
+        n_new, n_upd, first = ingest.store_chunk(self.OID, [(oid, tm, idx, lon, lat + 0.02, None, None)], None)
+        self.assertEqual((n_new, n_upd, first), (0, 1, tm))
+        self.assertIsNone(range_summary(self.OID, None, None))
+        self.assertIsNotNone(range_summary(self.OID, None, self.rows[598][1]))
+
+        ingest.refresh(self.OID, first)
+        self.assertMatchesLive()
+
+
+class TripsStreamTests(SimpleTestCase):
+    """trips_for_map: stream=1 (чанки, tracking.stream) отдаёт то же, что обычный ответ."""
+
+    def setUp(self):
+        self.track = _track(6000)
+        sb = FenceIndex([Fence(1, "Пескобаза", "sand_base", lat=52.0, lon=37.9, radius_km=0.3)], kind="sand_base")
+
+        def iter_track(oid, dt_from, dt_to):
+            for a in range(0, len(self.track), CHUNK):
+                yield self.track.take(slice(a, a + CHUNK))
+
+        for name, value in (
+            ("_load_points", lambda oid, dt_from, dt_to: self.track),
+            ("iter_track", iter_track),
+            ("get_sand_base", lambda: sb),
+        ):
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get(self, fmt, stream, **kw):
+        request = RequestFactory().get("/dj/api/trips_for_map", {"oid": "182"})
+        resp = views._trips_for_map(
+            request, 182, None, None, kw.get("max_points", 2000), 1.0, 180.0, kw.get("min_trip_km", 0.5), 5.0, None,
+            kw.get("simplify", "dp"), "live", fmt, stream, False,
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.streaming, stream)
+        return json.loads(b"".join(resp.streaming_content) if stream else resp.content)
+
+    def test_stream_equals_plain(self):
+        for fmt in ("json", "polyline"):
+            for kw in ({}, {"max_points": 50}, {"simplify": "stride", "max_points": 50}, {"min_trip_km": 100.0}):
+                with self.subTest(fmt=fmt, **kw):
+                    plain = self._get(fmt, False, **kw)
+                    streamed = self._get(fmt, True, **kw)
+                    self.assertEqual(streamed.keys(), plain.keys())
+
+                    trips, streamed_trips = plain.pop("trips"), streamed.pop("trips")
+                    self.assertEqual(streamed, plain)
+                    self.assertEqual(len(streamed_trips), len(trips))
+                    for a, b in zip(streamed_trips, trips):
+                        self.assertAlmostEqual(a.pop("distance_km"), b.pop("distance_km"), places=6)
+                        self.assertEqual(a, b)
+
+    def test_counters(self):
+        plain = self._get("json", False)
+        self.assertEqual(plain["original_count"], len(self.track))
+        self.assertEqual(plain["filtered_count"] + plain["gps_jumps_removed"], len(self.track))
+        self.assertGreater(plain["gps_jumps_removed"], 0)
+        self.assertGreaterEqual(plain["sand_base_entries"], 3)
+        self.assertEqual(plain["trips_count"], len(plain["trips"]))
+        self.assertGreaterEqual(plain["trips_count"], 2)
+
+
+class ApiCacheTests(TestCase):
+    """Кэш ответов API живёт, пока не поменялись версия данных oid (импорт) или пескобазы."""
+
+    OID = 9002
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.sb = _add_sand_base()
+        self.rows = _rows(self.OID, *_walk(400, seed=12))
+        insert_points(self.rows[:100])
+
+    def _get(self):
+        resp = self.client.get("/dj/api/points_summary", {"oid": self.OID, "mode": "python"})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_importers_invalidate(self):
+        self.assertEqual(self._get()["original_count"], 100)
+        # запись мимо импортёров версию не поднимает — ответ из кэша
+        insert_points(self.rows[100:200])
+        self.assertEqual(self._get()["original_count"], 100)
+
+        ingest.store_chunk(self.OID, self.rows[200:300], None)
+        self.assertEqual(self._get()["original_count"], 300)
+
+        docs = [
+            {"oid": oid, "tm": timezone.localtime(tm).strftime("%Y-%m-%d %H:%M:%S"), "lat": lat, "lon": lon}
+            for oid, tm, _idx, lon, lat, _speed, _odo in self.rows[300:]
+        ]
+        self.assertEqual(import_from_mongo._load_points(docs, 40, False)[0], 100)
+        self.assertEqual(self._get()["original_count"], 400)
+
+    def test_sand_base_change_invalidates(self):
+        self.assertGreater(self._get()["sand_base_entries"], 0)
+        self.sb.active = False
+        self.sb.save()
+        self.assertEqual(self._get()["sand_base_entries"], 0)
+
+
+# TransactionTestCase: oid считаются в пуле потоков, у каждого своё соединение
+class FleetSummaryTests(TransactionTestCase):
+    """fleet_summary отдаёт по каждому oid то же, что points_summary."""
+
+    OIDS = (9501, 9502)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        _add_sand_base()
+        for n, oid in enumerate(self.OIDS):
+            insert_points(_rows(oid, *_walk(300 + 100 * n, seed=oid)))
+
+    def _get(self, path, **params):
+        resp = self.client.get(path, params)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(b"".join(resp.streaming_content) if resp.streaming else resp.content)
+
+    def test_matches_points_summary(self):
+        for mode in ("python", "sql"):
+            with self.subTest(mode=mode):
+                fleet = self._get("/dj/api/fleet_summary", oids="9502,9501,9999", mode=mode)
+                self.assertEqual((fleet["mode"], fleet["count"]), (mode, 3))
+                self.assertEqual([v["oid"] for v in fleet["vehicles"]], [9501, 9502, 9999])
+                for v in fleet["vehicles"]:
+                    one = self._get("/dj/api/points_summary", oid=v["oid"], mode=mode)
+                    self.assertEqual(v, {k: one[k] for k in v})
+                self.assertEqual(fleet["vehicles"][2]["original_count"], 0)
+                self.assertGreater(fleet["vehicles"][0]["original_count"], 0)
+
+                streamed = self._get("/dj/api/fleet_summary", oids="9502,9501,9999", mode=mode, stream=1)
+                self.assertEqual(sorted(streamed.pop("vehicles"), key=lambda v: v["oid"]), fleet.pop("vehicles"))
+                self.assertEqual(streamed, fleet)
+
+    def test_default_oids_from_registry(self):
+        fleet = self._get("/dj/api/fleet_summary", mode="python")
+        self.assertEqual([v["oid"] for v in fleet["vehicles"]], list(self.OIDS))
@@ -5,7 +5,9 @@ urlpatterns = [
     path("oids", views.oids, name="oids"),
     path("routes", views.routes, name="routes"),
     path("points_summary", views.points_summary, name="points_summary"),
+    path("fleet_summary", views.fleet_summary, name="fleet_summary"),
     path("trips_for_map", views.trips_for_map, name="trips_for_map"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", views.track_tile, name="track_tile"),
     path("forms/save", views.forms_save, name="forms_save"),
     path("forms/<str:form_id>/export_xlsx", views.forms_export_xlsx, name="forms_export_xlsx"),
 ]
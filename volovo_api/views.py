@@ -1,33 +1,35 @@
 from __future__ import annotations
-from django.db.models.functions import Cast
-from django.contrib.gis.db.models import GeometryField
 
+import hashlib
 import json
-from datetime import datetime
-from math import radians, sin, cos, asin, sqrt
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from itertools import chain
 from uuid import uuid4
 
+import numpy as np
 from django.conf import settings
-from django.db.models import F, Func, FloatField
-from django.http import HttpResponse, JsonResponse
-from django.utils.dateparse import parse_datetime
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Max, Min
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
-from django.contrib.gis.db.models.functions import Transform
 
-from tracking.models import RouteCatalog, TrackPoint
+from tracking import encoding, engine, geofences
+from tracking.db import iter_track, load_track, summary_sql, track_tile_mvt
+from tracking.derived import cum_max_jump_km, get_sand_base, range_summary
+from tracking.models import Geofence, RouteCatalog, TrackPyramid, Trip, Vehicle
+from tracking.pyramid import PYRAMID_LEVELS, day_bounds, level_for_zoom, load_level, local_day
+from tracking.routes import match_lines, version as routes_version
+from tracking.stream import iter_live_trips
+from tracking.versions import data_version
 
-
-# ----------------- PostGIS helpers (ST_X / ST_Y) -----------------
-
-class ST_X(Func):
-    function = "ST_X"
-    output_field = FloatField()
-
-
-class ST_Y(Func):
-    function = "ST_Y"
-    output_field = FloatField()
+# рейсов на запрос сопоставления с маршрутами в stream-режиме
+ROUTE_MATCH_BATCH = 50
 
 
 # ----------------- utils -----------------
@@ -44,142 +46,195 @@ def _dt(s: str):
     return parse_datetime(s)
 
 
-def _haversine_km(lat1, lon1, lat2, lon2) -> float:
-    """Расстояние по сфере, км."""
-    R = 6371.0088
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    return R * c
-
-
-def _get_sand_base():
-    lat = getattr(settings, "SAND_BASE_LAT", None)
-    lon = getattr(settings, "SAND_BASE_LON", None)
-    radius_km = getattr(settings, "SAND_BASE_RADIUS_KM", None)
-    if lat is None or lon is None or radius_km is None:
-        return None
-    try:
-        return {"lat": float(lat), "lon": float(lon), "radius_km": float(radius_km)}
-    except Exception:
-        return None
-
-
-def _total_km(points) -> float:
-    if len(points) < 2:
-        return 0.0
-    km = 0.0
-    prev = points[0]
-    for p in points[1:]:
-        km += _haversine_km(prev["lat"], prev["lon"], p["lat"], p["lon"])
-        prev = p
-    return km
-
-
-def _sand_base_entries(points, sb):
+def _sand_base_entries(track, sb):
     """
-    Считаем "заезды" на пескобазу как переход из вне -> внутрь радиуса.
-    Возвращаем entries_count и список индексов точек-входа.
+    Считаем "заезды" на пескобазу как переход из вне -> внутрь любой из зон sb.
+    Возвращаем entries_count и массив индексов точек-входа.
     """
-    if not sb or not points:
-        return 0, []
-    lat0, lon0, r = sb["lat"], sb["lon"], sb["radius_km"]
-
-    inside_prev = False
-    entries = 0
-    entry_idx = []
-
-    for i, p in enumerate(points):
-        d = _haversine_km(lat0, lon0, p["lat"], p["lon"])
-        inside = d <= r
-        if inside and not inside_prev:
-            entries += 1
-            entry_idx.append(i)
-        inside_prev = inside
-
-    return entries, entry_idx
+    if not sb or not len(track):
+        return 0, np.empty(0, dtype=np.int64)
+    inside = sb.inside(track.lat, track.lon)
+    entry_idx = engine.entry_indexes(inside)
+    return int(entry_idx.shape[0]), entry_idx
 
 
-def _downsample(points, max_points: int):
-    if max_points <= 0 or len(points) <= max_points:
-        return points
-    step = max(1, len(points) // max_points)
-    sampled = points[::step]
-    if sampled and sampled[-1] != points[-1]:
-        sampled.append(points[-1])
-    return sampled
+def _sand_base_json(sb):
+    return sb.as_json() if sb else None
 
 
-def _filter_points(points, max_jump_km: float, max_speed_kmh: float):
+def _filter_points(track, max_jump_km: float, max_speed_kmh: float):
     """
     Фильтрация:
     - выкидываем точки с speed > max_speed_kmh (если speed есть)
-    - выкидываем "скачки" где дистанция между соседями > max_jump_km
-    Возвращаем: filtered_points, jumps_removed, original_count
+    - выкидываем "скачки" где дистанция от последней принятой точки > max_jump_km
+    Возвращаем: filtered_track, jumps_removed, original_count
     """
-    original_count = len(points)
+    original_count = len(track)
     if original_count <= 1:
-        return points, 0, original_count
+        return track, 0, original_count
 
     # 1) speed filter
-    speed_filtered = []
-    for p in points:
-        sp = p.get("speed")
-        if sp is None:
-            speed_filtered.append(p)
-        else:
-            try:
-                if float(sp) <= max_speed_kmh:
-                    speed_filtered.append(p)
-            except Exception:
-                speed_filtered.append(p)
+    track = track.take(engine.speed_mask(track.speed, max_speed_kmh))
 
     # 2) jump filter
-    out = []
-    jumps_removed = 0
-    prev = None
-
-    for p in speed_filtered:
-        if prev is None:
-            out.append(p)
-            prev = p
-            continue
+    keep = engine.filter_jumps(track.lat, track.lon, max_jump_km)
+    jumps_removed = int(keep.shape[0] - np.count_nonzero(keep))
 
-        d = _haversine_km(prev["lat"], prev["lon"], p["lat"], p["lon"])
-        if d > max_jump_km:
-            jumps_removed += 1
-            # не принимаем эту точку, prev оставляем
-            continue
+    return track.take(keep), jumps_removed, original_count
 
-        out.append(p)
-        prev = p
 
-    return out, jumps_removed, original_count
+def _load_points(oid: int, dt_from, dt_to):
+    # speed пока не берём: фильтр по скорости работает только если она есть
+    return load_track(oid, dt_from, dt_to)
 
 
-def _load_points(oid: int, dt_from, dt_to):
-    qs = TrackPoint.objects.filter(oid=oid)
+def _thin(lat, lon, max_points: int, simplify: str, tolerance_m: float):
+    """Индексы точек для карты: dp — Дуглас–Пекер (по умолчанию), stride — каждая N-я."""
+    if simplify == "stride":
+        return engine.stride_indices(lat.shape[0], max_points)
+    return engine.simplify(lat, lon, tolerance_m / 1000.0, max_points)
 
+
+def _stored_trips(oid: int, dt_from, dt_to, min_trip_km: float, max_points_per_trip: int,
+                  simplify: str, tolerance_m: float, level=None):
+    """
+    Рейсы из таблицы Trip (считаются при импорте, см. tracking.trips).
+    Берём рейсы, пересекающие период, и отдаём их целиком (tm_start/tm_end и
+    distance_km из Trip): рейс на границе периода не теряется, но в отличие от
+    расчёта на лету включает и точки за границей.
+    level — уровень пирамиды (tracking.pyramid): вершины рейса берутся оттуда,
+    если все сутки построены, иначе — из Trip.geom.
+    Возвращаем (итератор рейсов, допуск пирамиды в м или None).
+    """
+    qs = Trip.objects.filter(oid=oid, distance_km__gte=min_trip_km)
     if dt_from:
-        qs = qs.filter(tm__gte=dt_from)
+        qs = qs.filter(tm_end__gte=dt_from)
     if dt_to:
-        qs = qs.filter(tm__lte=dt_to)
-
-    # geography -> geometry (в 4326), затем ST_X/ST_Y
-    qs = qs.annotate(
-        geom2=Cast("geom", GeometryField(srid=4326)),
-    ).annotate(
-        lon=ST_X(F("geom2")),
-        lat=ST_Y(F("geom2")),
+        qs = qs.filter(tm_start__lte=dt_to)
+
+    pyr = None
+    if level is not None:
+        span = qs.aggregate(tm_start=Min("tm_start"), tm_end=Max("tm_end"))
+        if span["tm_start"] is not None:
+            pyr = load_level(oid, level, span["tm_start"], span["tm_end"])
+
+    return _iter_stored_trips(qs, pyr, max_points_per_trip, simplify, tolerance_m), (
+        PYRAMID_LEVELS[level][1] if pyr is not None else None
     )
 
-    rows = list(qs.order_by("tm").values("tm", "lat", "lon"))
-    for r in rows:
-        r["speed"] = None
-    return rows
 
+def _iter_stored_trips(qs, pyr, max_points_per_trip: int, simplify: str, tolerance_m: float):
+    for trip_no, tr in enumerate(qs.order_by("tm_start").iterator(), start=1):
+        if pyr is not None:
+            p_t, p_lat, p_lon = pyr
+            a = np.searchsorted(p_t, tr.tm_start.timestamp(), side="left")
+            b = np.searchsorted(p_t, tr.tm_end.timestamp(), side="right")
+            lats, lons = p_lat[a:b], p_lon[a:b]
+        else:
+            coords = np.asarray(tr.geom.coords if tr.geom else (), dtype=np.float64).reshape(-1, 2)
+            lats, lons = coords[:, 1], coords[:, 0]
+        sel = _thin(lats, lons, max_points_per_trip, simplify, tolerance_m)
+        yield {
+            "trip_no": trip_no,
+            "tm_start": tr.tm_start.isoformat(),
+            "tm_end": tr.tm_end.isoformat(),
+            "distance_km": round(tr.distance_km, 6),
+            "_lat": lats[sel],
+            "_lon": lons[sel],
+        }
+
+
+def _attach_routes(trips):
+    """trip["route"] — лучший маршрут RouteCatalog для рейса (один запрос на все рейсы)."""
+    for tr, route in zip(trips, match_lines([(tr["_lat"], tr["_lon"]) for tr in trips])):
+        tr["route"] = route
+    return trips
+
+
+def _iter_with_routes(trips, batch: int = ROUTE_MATCH_BATCH):
+    """То же для потока рейсов: сопоставляем пачками по batch."""
+    buf = []
+    for tr in trips:
+        buf.append(tr)
+        if len(buf) >= batch:
+            yield from _attach_routes(buf)
+            buf = []
+    yield from _attach_routes(buf)
+
+
+def _encode_trip(tr: dict, fmt: str):
+    """Точки рейса (_lat/_lon) -> points / polyline / points_count + байты для binary."""
+    lat, lon = tr.pop("_lat"), tr.pop("_lon")
+    if fmt == "polyline":
+        tr["polyline"] = encoding.encode_polyline(lat, lon)
+    elif fmt == "binary":
+        tr["points_count"] = int(lat.shape[0])
+        return encoding.delta_int32(lat, lon)
+    else:
+        tr["points"] = [{"lat": la, "lon": lo} for la, lo in zip(lat.tolist(), lon.tolist())]
+    return None
+
+
+def _format_meta(fmt: str):
+    if fmt == "polyline":
+        return {"format": fmt, "polyline_precision": encoding.POLYLINE_PRECISION}
+    if fmt == "binary":
+        return {"format": fmt, "binary_scale": encoding.BINARY_SCALE}
+    return {"format": fmt}
+
+
+def _trips_response(payload, fmt: str):
+    blobs = [_encode_trip(tr, fmt) for tr in payload["trips"]]
+    payload.update(_format_meta(fmt))
+    if fmt == "binary":
+        return HttpResponse(encoding.pack_binary(payload, blobs), content_type="application/octet-stream")
+    return JsonResponse(payload)
+
+
+def _trips_stream(head, trips, fmt: str, tail=None):
+    """
+    JSON по одному рейсу: сначала head, потом trips, в конце trips_count и tail()
+    (счётчики, которые известны только после прохода по треку).
+    """
+    def gen():
+        yield json.dumps({**head, **_format_meta(fmt)})[:-1] + ', "trips": ['
+        n = 0
+        for tr in trips:
+            _encode_trip(tr, fmt)
+            yield ("," if n else "") + json.dumps(tr)
+            n += 1
+        yield '], "trips_count": %d' % n
+        for k, v in (tail() if tail else {}).items():
+            yield ", %s: %s" % (json.dumps(k), json.dumps(v))
+        yield "}"
+
+    return StreamingHttpResponse(gen(), content_type="application/json")
+
+
+def _cache_key(key, oid: int, dt_from, dt_to) -> str:
+    # версия пескобаз: после правки Geofence заезды и рейсы в ответах другие
+    full = repr((key, data_version(oid, dt_from, dt_to), geofences.version(Geofence.SAND_BASE)))
+    return "api:" + hashlib.sha1(full.encode("utf-8")).hexdigest()
+
+
+def _cached(key, oid: int, dt_from, dt_to, build):
+    """
+    Ответ из кэша Django (CACHES). В ключ входят нормализованные параметры,
+    версия данных oid за период (tracking.versions) и версия пескобаз
+    (tracking.geofences): после импорта/пересчёта или правки зон ключ меняется,
+    поэтому устаревший ответ не отдаётся.
+    """
+    cache_key = _cache_key(key, oid, dt_from, dt_to)
+
+    hit = cache.get(cache_key)
+    if hit is not None:
+        content_type, content = hit
+        return HttpResponse(content, content_type=content_type)
+
+    resp = build()
+    if resp.status_code == 200 and not resp.streaming:
+        cache.set(cache_key, (resp["Content-Type"], resp.content), int(getattr(settings, "TRACK_API_CACHE_S", 86400)))
+    return resp
 
 
 # ----------------- API endpoints -----------------
@@ -190,20 +245,38 @@ def routes(request):
         RouteCatalog.objects
         .all()
         .order_by("name")
-        .values("name", "road_width_m", "road_length_km", "pss_tonnage_t")
+        .values("id", "name", "road_width_m", "road_length_km", "pss_tonnage_t")
     )
     return JsonResponse({"routes": list(qs)})
 
 
 @require_GET
 def oids(request):
-    qs = (
-        TrackPoint.objects
-        .values_list("oid", flat=True)
-        .distinct()
-        .order_by("oid")
-    )
-    return JsonResponse({"oids": list(qs)})
+    """
+    Список oid из реестра Vehicle (обновляется импортёрами, см. tracking.vehicles).
+    details=1 — ещё vehicles: [{oid, first_tm, last_tm, points_count, last_lat, last_lon}];
+    sort=last_seen — сначала недавно активные.
+    """
+    qs = Vehicle.objects.all()
+    if (request.GET.get("sort", "") or "").strip().lower() == "last_seen":
+        qs = qs.order_by(F("last_tm").desc(nulls_last=True), "oid")
+    else:
+        qs = qs.order_by("oid")
+
+    if (request.GET.get("details", "") or "").strip().lower() not in ("1", "true", "yes"):
+        return JsonResponse({"oids": list(qs.values_list("oid", flat=True))})
+
+    vehicles = []
+    for v in qs:
+        vehicles.append({
+            "oid": v.oid,
+            "first_tm": v.first_tm.isoformat() if v.first_tm else None,
+            "last_tm": v.last_tm.isoformat() if v.last_tm else None,
+            "points_count": v.points_count,
+            "last_lat": v.last_geom.y if v.last_geom else None,
+            "last_lon": v.last_geom.x if v.last_geom else None,
+        })
+    return JsonResponse({"oids": [v["oid"] for v in vehicles], "vehicles": vehicles})
 
 
 @require_GET
@@ -214,6 +287,16 @@ def points_summary(request):
       points_count_used, gps_jumps_removed,
       total_km,
       sand_base_entries
+
+    mode:
+      auto (по умолчанию) — cum, если max_jump_km совпадает с TRACK_CUM_MAX_JUMP_KM
+        и колонки посчитаны, иначе python;
+      cum — по двум граничным строкам с накопительными колонками (tracking.derived),
+        фильтр скачков не перезапускается на dt_from;
+      python — точки грузятся и фильтруются в Python;
+      sql — всё считается в PostGIS одним запросом (см. tracking.db.summary_sql),
+        скачком считается только одиночный выброс (далеко и от предыдущей, и от
+        следующей точки), а не всё, что далеко от последней принятой точки.
     """
     try:
         oid = int(request.GET.get("oid", "0") or 0)
@@ -222,34 +305,206 @@ def points_summary(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
+    mode = (request.GET.get("mode", "auto") or "auto").strip().lower()
+    if mode not in ("auto", "cum", "python", "sql"):
+        return JsonResponse({"error": "mode must be auto|cum|python|sql"}, status=400)
+
     dt_from = _dt(request.GET.get("dt_from", ""))
     dt_to = _dt(request.GET.get("dt_to", ""))
 
-    points = _load_points(oid, dt_from, dt_to)
-    filtered, jumps_removed, original_count = _filter_points(points, max_jump_km, max_speed_kmh)
-
-    sb = _get_sand_base()
+    key = ("points_summary", oid, request.GET.get("dt_from", ""), request.GET.get("dt_to", ""),
+           max_jump_km, max_speed_kmh, mode)
+    return _cached(key, oid, dt_from, dt_to, lambda: _points_summary(
+        request, oid, dt_from, dt_to, max_jump_km, max_speed_kmh, mode
+    ))
+
+
+_EMPTY_SUMMARY = {
+    "original_count": 0,
+    "points_count_used": 0,
+    "gps_jumps_removed": 0,
+    "total_km": 0.0,
+    "sand_base_entries": 0,
+}
+
+
+def _summary_json(mode: str, row) -> dict:
+    return {
+        "mode": mode,
+        "original_count": row["original_count"],
+        "points_count_used": row["points_count_used"],
+        "gps_jumps_removed": row["gps_jumps_removed"],
+        "total_km": round(row["total_km"], 6),
+        "sand_base_entries": row["sand_base_entries"],
+    }
+
+
+def _summary_row(oid: int, dt_from, dt_to, max_jump_km: float, max_speed_kmh: float, mode: str) -> dict:
+    """Итоги oid за период (поля points_summary без oid/dt_*), mode — фактический способ расчёта."""
+    row = None
+    if mode == "sql":
+        row = summary_sql([oid], dt_from, dt_to, max_jump_km, get_sand_base()).get(oid) or _EMPTY_SUMMARY
+    elif mode in ("auto", "cum") and math.isclose(max_jump_km, cum_max_jump_km()):
+        row = range_summary(oid, dt_from, dt_to)
+        if row is not None:
+            mode = "cum"
+
+    if row is not None:
+        return _summary_json(mode, row)
+
+    track = _load_points(oid, dt_from, dt_to)
+    filtered, jumps_removed, original_count = _filter_points(track, max_jump_km, max_speed_kmh)
+
+    sb = get_sand_base()
     entries, _ = _sand_base_entries(filtered, sb)
 
-    return JsonResponse({
-        "oid": oid,
-        "dt_from": request.GET.get("dt_from", "") or "",
-        "dt_to": request.GET.get("dt_to", "") or "",
+    return _summary_json("python", {
         "original_count": original_count,
         "points_count_used": len(filtered),
         "gps_jumps_removed": jumps_removed,
-        "total_km": round(_total_km(filtered), 6),
+        "total_km": engine.path_km(filtered.lat, filtered.lon),
         "sand_base_entries": entries,
     })
 
 
+def _points_summary(request, oid: int, dt_from, dt_to, max_jump_km: float, max_speed_kmh: float, mode: str):
+    return JsonResponse({
+        "oid": oid,
+        "dt_from": request.GET.get("dt_from", "") or "",
+        "dt_to": request.GET.get("dt_to", "") or "",
+        **_summary_row(oid, dt_from, dt_to, max_jump_km, max_speed_kmh, mode),
+    })
+
+
+@require_GET
+def fleet_summary(request):
+    """
+    points_summary сразу по многим oid (дневной отчёт по парку) — один запрос вместо N.
+
+    oids — через запятую (по умолчанию все из Vehicle); dt_from, dt_to, max_jump_km,
+    max_speed_kmh, mode — как у points_summary.
+      mode=sql — один set-based запрос на все oid (tracking.db.summary_sql);
+      auto/cum/python — oid считаются параллельно в пуле потоков (FLEET_SUMMARY_WORKERS),
+        итог каждого oid кэшируется с версией его данных, как в points_summary.
+
+    Ответ: {dt_from, dt_to, mode, vehicles: [{oid, mode, original_count, points_count_used,
+      gps_jumps_removed, total_km, sand_base_entries} | {oid, error}], count}; vehicles по oid.
+    stream=1 — StreamingHttpResponse: vehicles пишутся по мере готовности oid, count — в конце.
+    """
+    try:
+        oids_param = (request.GET.get("oids", "") or "").strip()
+        oid_list = sorted({int(x) for x in oids_param.split(",") if x.strip()})
+        max_jump_km = float(request.GET.get("max_jump_km", "1.0") or 1.0)
+        max_speed_kmh = float(request.GET.get("max_speed_kmh", "180") or 180.0)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    mode = (request.GET.get("mode", "auto") or "auto").strip().lower()
+    if mode not in ("auto", "cum", "python", "sql"):
+        return JsonResponse({"error": "mode must be auto|cum|python|sql"}, status=400)
+
+    stream = (request.GET.get("stream", "") or "").strip().lower() in ("1", "true", "yes")
+    if not oid_list:
+        oid_list = list(Vehicle.objects.order_by("oid").values_list("oid", flat=True))
+
+    head = {
+        "dt_from": request.GET.get("dt_from", "") or "",
+        "dt_to": request.GET.get("dt_to", "") or "",
+        "mode": mode,
+    }
+    rows = _iter_fleet_rows(
+        oid_list, _dt(head["dt_from"]), _dt(head["dt_to"]), max_jump_km, max_speed_kmh, mode,
+        (head["dt_from"], head["dt_to"]),
+    )
+
+    if stream:
+        def gen():
+            yield json.dumps(head)[:-1] + ', "vehicles": ['
+            n = 0
+            for row in rows:
+                yield ("," if n else "") + json.dumps(row)
+                n += 1
+            yield '], "count": %d}' % n
+
+        return StreamingHttpResponse(gen(), content_type="application/json")
+
+    vehicles = sorted(rows, key=lambda r: r["oid"])
+    return JsonResponse({**head, "vehicles": vehicles, "count": len(vehicles)})
+
+
+def _iter_fleet_rows(oids, dt_from, dt_to, max_jump_km: float, max_speed_kmh: float, mode: str, raw_range):
+    """{oid, ...итоги} по мере готовности; ошибка одного oid не роняет остальные."""
+    if mode == "sql":
+        found = summary_sql(oids, dt_from, dt_to, max_jump_km, get_sand_base()) if oids else {}
+        for oid in oids:
+            yield {"oid": oid, **_summary_json(mode, found.get(oid, _EMPTY_SUMMARY))}
+        return
+
+    workers = max(1, min(len(oids), int(getattr(settings, "FLEET_SUMMARY_WORKERS", 8))))
+    ex = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet")
+    try:
+        futures = {
+            ex.submit(_fleet_row, oid, dt_from, dt_to, max_jump_km, max_speed_kmh, mode, raw_range): oid
+            for oid in oids
+        }
+        for f in as_completed(futures):
+            oid = futures[f]
+            try:
+                yield {"oid": oid, **f.result()}
+            except Exception as e:
+                yield {"oid": oid, "error": str(e)}
+    finally:
+        # клиент оборвал stream — несделанные oid не считаем
+        ex.shutdown(wait=True, cancel_futures=True)
+
+
+def _fleet_row(oid: int, dt_from, dt_to, max_jump_km: float, max_speed_kmh: float, mode: str, raw_range) -> dict:
+    """Итог oid в потоке пула; кэш — как у points_summary (ключ с версией данных oid)."""
+    try:
+        key = _cache_key(("fleet_summary", oid) + tuple(raw_range) + (max_jump_km, max_speed_kmh, mode),
+                         oid, dt_from, dt_to)
+        row = cache.get(key)
+        if row is None:
+            row = _summary_row(oid, dt_from, dt_to, max_jump_km, max_speed_kmh, mode)
+            cache.set(key, row, int(getattr(settings, "TRACK_API_CACHE_S", 86400)))
+        return row
+    finally:
+        # у каждого потока своё соединение Django — не оставляем его открытым
+        connection.close()
+
+
 @require_GET
 def trips_for_map(request):
     """
     JS ждёт:
       trips_count, sand_base (опц), sand_base_entries,
       original_count, filtered_count, gps_jumps_removed,
-      trips: [{trip_no, tm_start, tm_end, distance_km, points:[{lat,lon}]}]
+      trips: [{trip_no, tm_start, tm_end, distance_km, route, points:[{lat,lon}]}]
+
+    route — лучший маршрут RouteCatalog по геометрии рейса (tracking.routes):
+      {id, name, hausdorff_m} или null; match_routes=0 — не сопоставлять (поля route нет).
+      Если ни у одного маршрута нет geom — как match_routes=0, запрос к БД не делается.
+
+    source:
+      auto (по умолчанию) — stored, если max_jump_km совпадает с TRACK_CUM_MAX_JUMP_KM
+        и в периоде есть готовые рейсы, иначе live;
+      stored — рейсы из таблицы Trip (только рейсы целиком внутри периода);
+      live — делим отфильтрованный трек на рейсы на лету.
+
+    simplify: dp (по умолчанию) — Дуглас–Пекер с допуском tolerance_m (по умолчанию 5 м)
+      и бюджетом max_points_per_trip; stride — каждая N-я точка, как раньше.
+
+    zoom (опц.) — масштаб карты: на обзорных масштабах (source=stored) вершины
+      рейсов берутся из пирамиды TrackPyramid, сырые точки не читаются.
+
+    format: json (по умолчанию) — points:[{lat,lon}];
+      polyline — вместо points строка polyline (Google encoded polyline);
+      binary — application/octet-stream, см. tracking.encoding.pack_binary:
+      JSON-заголовок (как json, у рейсов points_count вместо points) + int32-дельты.
+
+    stream=1 — StreamingHttpResponse, рейсы пишутся по одному (json/polyline):
+      trips_count и счётчики точек идут в конце объекта; live-путь читает трек
+      серверным курсором чанками (tracking.stream), память не растёт с периодом.
     """
     try:
         oid = int(request.GET.get("oid", "0") or 0)
@@ -257,65 +512,202 @@ def trips_for_map(request):
         max_jump_km = float(request.GET.get("max_jump_km", "1.0") or 1.0)
         max_speed_kmh = float(request.GET.get("max_speed_kmh", "180") or 180.0)
         min_trip_km = float(request.GET.get("min_trip_km", "1.0") or 1.0)
+        tolerance_m = float(request.GET.get("tolerance_m", "5") or 5.0)
+        zoom = int(request.GET["zoom"]) if request.GET.get("zoom") else None
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
+    simplify = (request.GET.get("simplify", "dp") or "dp").strip().lower()
+    if simplify not in ("dp", "stride"):
+        return JsonResponse({"error": "simplify must be dp|stride"}, status=400)
+
+    source = (request.GET.get("source", "auto") or "auto").strip().lower()
+    if source not in ("auto", "stored", "live"):
+        return JsonResponse({"error": "source must be auto|stored|live"}, status=400)
+
+    fmt = (request.GET.get("format", "json") or "json").strip().lower()
+    if fmt not in ("json", "polyline", "binary"):
+        return JsonResponse({"error": "format must be json|polyline|binary"}, status=400)
+
+    stream = (request.GET.get("stream", "") or "").strip().lower() in ("1", "true", "yes")
+    match_routes = (request.GET.get("match_routes", "1") or "1").strip().lower() not in ("0", "false", "no")
+    if stream and fmt == "binary":
+        return JsonResponse({"error": "stream does not support format=binary"}, status=400)
+
     dt_from = _dt(request.GET.get("dt_from", ""))
     dt_to = _dt(request.GET.get("dt_to", ""))
 
-    points = _load_points(oid, dt_from, dt_to)
-    filtered, jumps_removed, original_count = _filter_points(points, max_jump_km, max_speed_kmh)
-
-    sb = _get_sand_base()
+    # версия маршрутов — в ключе кэша: правка RouteCatalog.geom меняет route в ответе
+    routes_ver = routes_version() if match_routes else None
+    match_routes = routes_ver is not None
+
+    args = (oid, dt_from, dt_to, max_points_per_trip, max_jump_km, max_speed_kmh, min_trip_km,
+            tolerance_m, zoom, simplify, source, fmt, stream, match_routes)
+    if stream:
+        return _trips_for_map(request, *args)
+    key = ("trips_for_map", request.GET.get("dt_from", ""), request.GET.get("dt_to", ""), routes_ver) + args
+    return _cached(key, oid, dt_from, dt_to, lambda: _trips_for_map(request, *args))
+
+
+def _trips_for_map(request, oid: int, dt_from, dt_to, max_points_per_trip: int, max_jump_km: float,
+                   max_speed_kmh: float, min_trip_km: float, tolerance_m: float, zoom, simplify: str,
+                   source: str, fmt: str, stream: bool, match_routes: bool):
+    if source in ("auto", "stored") and math.isclose(max_jump_km, cum_max_jump_km()):
+        summary = range_summary(oid, dt_from, dt_to)
+        if summary is not None:
+            level = level_for_zoom(zoom) if zoom is not None else None
+            trips, pyramid_tolerance_m = _stored_trips(
+                oid, dt_from, dt_to, min_trip_km, max_points_per_trip, simplify, tolerance_m, level
+            )
+            head = {
+                "oid": oid,
+                "dt_from": request.GET.get("dt_from", "") or "",
+                "dt_to": request.GET.get("dt_to", "") or "",
+                "source": "stored",
+                "pyramid_tolerance_m": pyramid_tolerance_m,
+                "sand_base": _sand_base_json(get_sand_base()),
+                "sand_base_entries": summary["sand_base_entries"],
+                "original_count": summary["original_count"],
+                "filtered_count": summary["points_count_used"],
+                "gps_jumps_removed": summary["gps_jumps_removed"],
+            }
+            if stream:
+                if match_routes:
+                    trips = _iter_with_routes(trips)
+                first = next(trips, None)
+                if first is not None or source == "stored":
+                    return _trips_stream(head, chain([first], trips) if first else iter(()), fmt)
+            else:
+                trips = list(trips)
+                if trips or source == "stored":
+                    if match_routes:
+                        _attach_routes(trips)
+                    return _trips_response({**head, "trips_count": len(trips), "trips": trips}, fmt)
+
+    if stream:
+        sb = get_sand_base()
+        stats = {}
+        trips = iter_live_trips(
+            iter_track(oid, dt_from, dt_to),
+            max_jump_km, max_speed_kmh, min_trip_km, max_points_per_trip,
+            lambda la, lo, n: _thin(la, lo, n, simplify, tolerance_m),
+            sb, stats,
+        )
+        if match_routes:
+            trips = _iter_with_routes(trips)
+        return _trips_stream({
+            "oid": oid,
+            "dt_from": request.GET.get("dt_from", "") or "",
+            "dt_to": request.GET.get("dt_to", "") or "",
+            "source": "live",
+            "sand_base": _sand_base_json(sb),
+        }, trips, fmt, tail=lambda: stats)
+
+    track = _load_points(oid, dt_from, dt_to)
+    filtered, jumps_removed, original_count = _filter_points(track, max_jump_km, max_speed_kmh)
+
+    sb = get_sand_base()
     entries_count, entry_idx = _sand_base_entries(filtered, sb)
 
-    trips = []
-
     # Деление на рейсы:
     # - если есть >=2 заезда, делим по промежуткам между заездами
     # - если <2 заездов, отдаём 1 рейс целиком (чтобы карта хоть что-то рисовала)
-    segments = []
-    if len(entry_idx) >= 2:
-        for a, b in zip(entry_idx[:-1], entry_idx[1:]):
-            if b > a:
-                segments.append((a, b))
-    else:
-        if len(filtered) >= 2:
-            segments.append((0, len(filtered) - 1))
+    segments = engine.split_between_entries(len(filtered), entry_idx)
+    cum = engine.cumulative_km(filtered.lat, filtered.lon)
 
+    trips = []
     trip_no = 1
     for a, b in segments:
-        seg = filtered[a:b + 1]
-        km = _total_km(seg)
+        km = float(cum[b] - cum[a])
         if km < min_trip_km:
             continue
 
-        seg2 = _downsample(seg, max_points_per_trip)
-
-        tm_start = seg2[0]["tm"].isoformat() if seg2 and seg2[0].get("tm") else ""
-        tm_end = seg2[-1]["tm"].isoformat() if seg2 and seg2[-1].get("tm") else ""
+        sel = a + _thin(filtered.lat[a:b + 1], filtered.lon[a:b + 1], max_points_per_trip, simplify, tolerance_m)
 
         trips.append({
             "trip_no": trip_no,
-            "tm_start": tm_start,
-            "tm_end": tm_end,
+            "tm_start": filtered.tm[sel[0]].isoformat(),
+            "tm_end": filtered.tm[sel[-1]].isoformat(),
             "distance_km": round(km, 6),
-            "points": [{"lat": p["lat"], "lon": p["lon"]} for p in seg2],
+            "_lat": filtered.lat[sel],
+            "_lon": filtered.lon[sel],
         })
         trip_no += 1
 
-    return JsonResponse({
+    if match_routes:
+        _attach_routes(trips)
+
+    return _trips_response({
         "oid": oid,
         "dt_from": request.GET.get("dt_from", "") or "",
         "dt_to": request.GET.get("dt_to", "") or "",
+        "source": "live",
         "trips_count": len(trips),
-        "sand_base": sb,
+        "sand_base": _sand_base_json(sb),
         "sand_base_entries": entries_count,
         "original_count": original_count,
         "filtered_count": len(filtered),
         "gps_jumps_removed": jumps_removed,
         "trips": trips,
-    })
+    }, fmt)
+
+
+@require_GET
+def track_tile(request, z: int, x: int, y: int):
+    """
+    Mapbox Vector Tile трека: слой 'track', линия на сутки (свойство day).
+    Параметры: oid и day=YYYY-MM-DD (кэшируется по (oid, day, z, x, y))
+    или dt_from/dt_to (не кэшируется на сервере).
+
+    z <= последнего уровня PYRAMID_LEVELS — вершины из TrackPyramid (если все
+    сутки построены), глубже — линия по сырым точкам без скачков (gps_jump).
+    """
+    try:
+        oid = int(request.GET.get("oid", "0") or 0)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if not (0 <= z <= 30 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return JsonResponse({"error": "bad tile"}, status=400)
+
+    day = parse_date(request.GET.get("day", "") or "")
+    if day is not None:
+        dt_from, dt_end = day_bounds(day)
+        dt_to = dt_end - timedelta(microseconds=1)
+    else:
+        dt_from = _dt(request.GET.get("dt_from", ""))
+        dt_to = _dt(request.GET.get("dt_to", ""))
+        if dt_from is None or dt_to is None:
+            return JsonResponse({"error": "day or dt_from/dt_to required"}, status=400)
+        dt_from = timezone.make_aware(dt_from) if timezone.is_naive(dt_from) else dt_from
+        dt_to = timezone.make_aware(dt_to) if timezone.is_naive(dt_to) else dt_to
+
+    # сегодняшние сутки ещё дописываются импортом — кэшируем коротко
+    today = day is not None and day >= local_day(timezone.now())
+    max_age = 60 if (day is None or today) else int(getattr(settings, "TRACK_TILE_CACHE_S", 86400))
+
+    key = None
+    if day is not None:
+        n, ver = data_version(oid, dt_from, dt_to)
+        key = f"mvt:{oid}:{day}:{z}:{x}:{y}:{n}:{ver}"
+    content = cache.get(key) if key else None
+    if content is None:
+        level = level_for_zoom(z)
+        if level is not None:
+            n_days = (local_day(dt_to) - local_day(dt_from)).days + 1
+            built = TrackPyramid.objects.filter(
+                oid=oid, level=level, day__gte=local_day(dt_from), day__lte=local_day(dt_to)
+            ).count()
+            if built != n_days:
+                level = None
+        content = track_tile_mvt(
+            oid, z, x, y, dt_from, dt_to, timezone.get_current_timezone_name(), level=level
+        )
+        if key:
+            cache.set(key, content, max_age)
+
+    resp = HttpResponse(content, content_type="application/vnd.mapbox-vector-tile")
+    resp["Cache-Control"] = f"public, max-age={max_age}"
+    return resp
 
 
 # ----------------- forms / export -----------------